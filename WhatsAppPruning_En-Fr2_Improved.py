@@ -3,6 +3,7 @@
 WhatsApp Chat to HTML Converter – Whisper Edition (launcher).
 Run this file or use: python -m whatsapp_archive
 """
+import importlib.util
 import sys
 
 # Optional: ensure optional deps are present before loading the package
@@ -13,10 +14,8 @@ except ImportError:
     print("Please install it by running: pip install pytz")
     sys.exit(1)
 
-try:
-    from Crypto.Cipher import AES  # noqa: F401
-    from Crypto.Random import get_random_bytes  # noqa: F401
-except ImportError:
+# Only checked here; pycryptodome is imported when media is encrypted.
+if importlib.util.find_spec("Crypto") is None:
     print("Error: 'pycryptodome' library not found.")
     print("Please install it by running: pip install pycryptodome")
     sys.exit(1)
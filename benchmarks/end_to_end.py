@@ -0,0 +1,177 @@
+"""
+End-to-end build benchmark: generates synthetic chats (see synthetic_chat), builds each one
+with the pipeline and reports the build report's per-stage timings (median of --runs).
+Every run builds twice: "cold" with the caches next to the chat removed, then "warm" with
+the caches the cold build left. Transcription is stubbed by default (a model that returns
+fixed text instantly), so timings cover everything around Whisper; --transcription tiny
+uses the real tiny model, off skips it. Every date format the parser reads gets its own
+text-10k-<format> scenario.
+Results are compared with benchmarks/baseline.json (or --baseline), recorded with this
+script's defaults: re-record it with --json benchmarks/baseline.json on the machine the
+comparison runs on, as timings depend on it. The default baseline is skipped when the run
+uses other --scale/--transcription/--encrypt settings.
+Usage: python benchmarks/end_to_end.py [--scenario NAME ...] [--scale 1.0] [--runs 3]
+       [--transcription stub|tiny|off] [--encrypt] [--json results.json]
+       [--baseline baseline.json] [--tolerance 0.25] [--min-seconds 0.05] [--keep DIR]
+"""
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from synthetic_chat import FORMATS, generate_chat  # noqa: E402
+
+from whatsapp_archive.config import VERSION  # noqa: E402
+from whatsapp_archive.pipeline import ArchivePipeline  # noqa: E402
+from whatsapp_archive.report import stage_rows  # noqa: E402
+
+BASELINE = Path(__file__).with_name("baseline.json")
+NO_MEDIA = {}
+# name: (synthetic_chat.generate_chat arguments, ArchivePipeline options)
+SCENARIOS = {
+    "text-10k": ({"messages": 10_000, "media": NO_MEDIA}, {}),
+    **{f"text-10k-{fmt}": ({"messages": 10_000, "media": NO_MEDIA, "fmt": fmt}, {})
+       for fmt in FORMATS if fmt != "us12"},
+    "media-10k": ({"messages": 10_000, "external_audio": 20,
+                   "media": {"image": 0.05, "audio": 0.04, "video": 0.01, "document": 0.01}}, {}),
+    "text-100k": ({"messages": 100_000, "media": NO_MEDIA, "participants": 12}, {}),
+    "virtual-100k": ({"messages": 100_000, "media": NO_MEDIA, "participants": 12}, {"virtual_rendering": True}),
+    "sharded-100k": ({"messages": 100_000, "media": NO_MEDIA, "participants": 12}, {"shard_mode": "month"}),
+}
+PHASES = ("cold", "warm")
+CACHE_FOLDERS = ("_archive_cache", "_transcriptions_cache")
+
+
+class StubModel:
+    """Stands in for a Whisper model: fixed text, no time spent."""
+
+    def transcribe(self, path: str) -> dict:
+        return {"text": "benchmark transcription"}
+
+
+def build_once(chat: Path, out_html: Path, transcription: str, encrypt: bool, options: dict) -> dict:
+    """Build the chat once; returns the build report's stages."""
+    pipeline = ArchivePipeline(chat, out_html, "Benchmark", transcribe_audio=transcription != "off",
+                               encrypt_media=encrypt, lang="en", whisper_model_index=0, **options)
+    if transcription == "stub":
+        with mock.patch("whatsapp_archive.pipeline.load_whisper_model", lambda index, status=None: StubModel()):
+            pipeline.run()
+    else:
+        pipeline.run()
+    return pipeline.report.to_dict()["stages"]
+
+
+def median_stages(runs: list[dict]) -> dict:
+    """Per stage: median wall and CPU seconds over the runs, and the last run's other figures."""
+    merged = {}
+    for name, last in runs[-1].items():
+        entries = [run[name] for run in runs if name in run]
+        merged[name] = dict(last)
+        for key in ("wall_s", "cpu_s"):
+            merged[name][key] = round(statistics.median(entry.get(key, 0.0) for entry in entries), 4)
+    return merged
+
+
+def run_scenario(name: str, work_dir: Path, scale: float, runs: int, transcription: str, encrypt: bool) -> dict:
+    generator_args, options = SCENARIOS[name]
+    generator_args = dict(generator_args, messages=max(1, int(generator_args["messages"] * scale)))
+    chat_dir = work_dir / name
+    generated = generate_chat(chat_dir, **generator_args)
+    out_html = work_dir / f"{name}.html"
+    phases: dict[str, list[dict]] = {phase: [] for phase in PHASES}
+    for _ in range(runs):
+        for folder in CACHE_FOLDERS:
+            shutil.rmtree(chat_dir / folder, ignore_errors=True)
+        for phase in PHASES:
+            phases[phase].append(build_once(chat_dir / "_chat.txt", out_html, transcription, encrypt, options))
+    return {"generated": generated, "options": options,
+            **{phase: median_stages(stage_runs) for phase, stage_runs in phases.items()}}
+
+
+def print_scenario(name: str, result: dict) -> None:
+    generated = ", ".join(f"{key} {value}" for key, value in result["generated"].items())
+    print(f"\n{name}  ({generated})")
+    print(f"  {'phase':5} {'stage':15} {'time (s)':>9} {'CPU (s)':>9} {'items':>8} {'written':>10} {'peak':>8}")
+    for phase in PHASES:
+        for stage, (wall, cpu, items, _read, written, peak) in stage_rows(result[phase]):
+            print(f"  {phase:5} {stage:15} {wall:>9} {cpu:>9} {items:>8} {written:>10} {peak:>8}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_seconds: float) -> list[str]:
+    """Stages slower than the baseline by more than `tolerance`, ignoring ones under `min_seconds`."""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base_result = baseline.get("scenarios", {}).get(name)
+        if not base_result:
+            continue
+        for phase in PHASES:
+            for stage, figures in result[phase].items():
+                base_wall = base_result.get(phase, {}).get(stage, {}).get("wall_s")
+                if base_wall is None or base_wall < min_seconds:
+                    continue
+                wall = figures["wall_s"]
+                change = (wall - base_wall) / base_wall
+                line = f"{name} {phase} {stage}: {base_wall:.3f} s -> {wall:.3f} s ({change:+.0%})"
+                print(f"  {line}")
+                if wall > base_wall * (1 + tolerance):
+                    regressions.append(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time archive builds of synthetic chats, stage by stage.")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Scenario to run (default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every scenario's message count")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--transcription", choices=("stub", "tiny", "off"), default="stub")
+    parser.add_argument("--encrypt", action="store_true", help="Encrypt media (needs pycryptodome)")
+    parser.add_argument("--json", type=Path, help="Write the results to this file")
+    parser.add_argument("--baseline", type=Path,
+                        help="Results file to compare against (default: benchmarks/baseline.json)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown over the baseline")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="Stages faster than this in the baseline are too noisy to compare")
+    parser.add_argument("--keep", type=Path, help="Generate and build in this folder and keep it")
+    args = parser.parse_args()
+
+    results = {"version": VERSION, "created": datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(), "platform": f"{sys.platform} {platform.machine()}",
+               "runs": args.runs, "scale": args.scale, "transcription": args.transcription,
+               "encrypt": args.encrypt, "scenarios": {}}
+    with tempfile.TemporaryDirectory(prefix="archive-bench-") as temp_dir:
+        work_dir = args.keep or Path(temp_dir)
+        for name in args.scenario or SCENARIOS:
+            results["scenarios"][name] = run_scenario(name, work_dir, args.scale, args.runs,
+                                                      args.transcription, args.encrypt)
+            print_scenario(name, results["scenarios"][name])
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    baseline_path = args.baseline or (BASELINE if BASELINE.exists() else None)
+    if baseline_path and not (args.json and args.json.resolve() == baseline_path.resolve()):
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        if (baseline.get("scale"), baseline.get("transcription"), baseline.get("encrypt")) != \
+                (args.scale, args.transcription, args.encrypt):
+            if not args.baseline:
+                print(f"\nNot compared with {baseline_path}: it was run with other "
+                      "--scale/--transcription/--encrypt settings")
+                return
+            print("Baseline was run with other --scale/--transcription/--encrypt settings", file=sys.stderr)
+        print(f"\nCompared with {baseline_path} (tolerance {args.tolerance:.0%}):")
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print("Regressions:", *regressions, sep="\n  ", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
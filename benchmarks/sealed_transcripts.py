@@ -0,0 +1,68 @@
+"""
+Check that an encrypted archive with a transcript sidecar keeps its transcriptions sealed:
+builds a synthetic chat with voice notes (a one-page and a sharded archive, transcription
+stubbed to return a marker word) and fails if the marker appears in any file written next
+to the pages, in any letter case. Needs pycryptodome.
+Usage: python benchmarks/sealed_transcripts.py [--messages 500] [--keep DIR]
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from synthetic_chat import generate_chat  # noqa: E402
+
+from whatsapp_archive.config import APP_FOLDERS  # noqa: E402
+from whatsapp_archive.pipeline import ArchivePipeline  # noqa: E402
+
+MARKER = "Quokkatranscript"
+LAYOUTS = {"single": {}, "sharded": {"shard_mode": "month"}, "virtual": {"virtual_rendering": True}}
+
+
+class MarkerModel:
+    """Stands in for a Whisper model: every voice note transcribes to the marker word."""
+
+    def transcribe(self, path: str) -> dict:
+        return {"text": f"{MARKER} bonjour"}
+
+
+def leaks(folder: Path) -> list[str]:
+    """Files under `folder` (caches excluded) that contain the marker in plain text."""
+    marker = MARKER.lower().encode("ascii")
+    return sorted(str(path.relative_to(folder)) for path in folder.rglob("*")
+                  if path.is_file() and not any(part in APP_FOLDERS for part in path.relative_to(folder).parts)
+                  and path.suffix not in (".gz", ".br") and marker in path.read_bytes().lower())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that encrypted archives keep transcriptions sealed.")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--keep", type=Path, help="Generate and build in this folder and keep it")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="archive-sealed-") as temp_dir:
+        work_dir = args.keep or Path(temp_dir)
+        chat_dir = work_dir / "chat"
+        generate_chat(chat_dir, messages=args.messages, media={"audio": 0.1}, external_audio=5)
+        for name, options in LAYOUTS.items():
+            out_dir = work_dir / name
+            out_dir.mkdir(parents=True, exist_ok=True)
+            pipeline = ArchivePipeline(chat_dir / "_chat.txt", out_dir / "archive.html", "Sealed", transcribe_audio=True,
+                                       encrypt_media=True, lang="en", whisper_model_index=0,
+                                       transcript_sidecar=True, **options)
+            with mock.patch("whatsapp_archive.pipeline.load_whisper_model", lambda index, status=None: MarkerModel()):
+                pipeline.run()
+            found = leaks(out_dir)
+            print(f"{name}: {'transcriptions in plain text in ' + ', '.join(found) if found else 'sealed'}")
+            failed = failed or bool(found)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
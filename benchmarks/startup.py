@@ -0,0 +1,87 @@
+"""
+Cold-start benchmark: how long importing the app takes, measured with python -X importtime.
+Each run is a fresh interpreter; one unmeasured run first fills __pycache__. Reports the
+median total import time and the slowest imports under it, and fails if a heavy optional
+dependency (whisper, torch, Crypto) is imported at startup.
+Usage: python benchmarks/startup.py [--module whatsapp_archive.gui.main_window] [--runs 5]
+                                    [--json results.json] [--baseline baseline.json] [--tolerance 0.25]
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("whisper", "torch", "Crypto")
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+    """{module: (nesting depth, cumulative microseconds)} for `import module` in a new interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        last_line = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+        raise RuntimeError(f"import {module} failed: {last_line}")
+    times: dict[str, tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            times[match.group(4)] = (len(match.group(3)) // 2, int(match.group(2)))
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the app's cold-start import time.")
+    parser.add_argument("--module", default="whatsapp_archive.gui.main_window", help="Module the app starts from")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    parser.add_argument("--json", type=Path, help="Write the results to this file")
+    parser.add_argument("--baseline", type=Path, help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown over the baseline")
+    args = parser.parse_args()
+
+    try:
+        import_times(args.module)  # warm-up: compiles bytecode
+        runs = [import_times(args.module) for _ in range(args.runs)]
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+    totals = [sum(t for depth, t in run.values() if depth == 0) for run in runs]
+    total_ms = statistics.median(totals) / 1000
+    # What the app's modules pull in: everything imported directly under a top-level import.
+    direct = {name: statistics.median(run.get(name, (0, 0))[1] for run in runs) / 1000
+              for name, (depth, _t) in runs[0].items() if depth == 1}
+    slowest = sorted(direct.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    heavy = sorted({name.split(".")[0] for name in runs[0]} & set(HEAVY_MODULES))
+
+    print(f"import {args.module}: {total_ms:.1f} ms (median of {args.runs})")
+    for name, ms in slowest:
+        print(f"  {ms:8.1f} ms  {name}")
+    results = {"module": args.module, "runs": args.runs, "total_ms": round(total_ms, 1),
+               "slowest": [[name, round(ms, 1)] for name, ms in slowest], "heavy_imports": heavy}
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    failed = False
+    if heavy:
+        print(f"Imported at startup: {', '.join(heavy)}", file=sys.stderr)
+        failed = True
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        limit = baseline["total_ms"] * (1 + args.tolerance)
+        print(f"baseline: {baseline['total_ms']:.1f} ms, limit {limit:.1f} ms")
+        if total_ms > limit:
+            print(f"Startup regressed: {total_ms:.1f} ms > {limit:.1f} ms", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Synthetic WhatsApp exports for benchmarks: a _chat.txt in one of the supported date formats
+and tiny placeholder media, generated deterministically from a seed (same arguments, same
+bytes). Messages mix text, multi-line messages (continuation lines), system messages and
+media in the requested proportions; external voice notes (AUD-... files the chat does not
+mention) can be added too.
+Usage: python benchmarks/synthetic_chat.py OUT_DIR [--messages 10000] [--participants 4]
+       [--continuation 0.1] [--media image=0.05,audio=0.04,video=0.01,document=0.01,omitted=0]
+       [--external-audio 0] [--format us12] [--seed 1]
+"""
+import argparse
+import io
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Every date/time format the parser reads (see parser.DT_PATTERNS and parse_message_datetime):
+# 12- or 24-hour clock, with or without leading zeros, AM/PM after a space or a narrow
+# no-break space (U+202F), two- or four-digit years.
+# name: (clock, zero-padded, AM/PM separator, four-digit year)
+CLOCKS = {
+    "us12": (12, True, " "),
+    "us24": (24, True, ""),
+    "us12-unpadded": (12, False, " "),
+    "us24-unpadded": (24, False, ""),
+    "us12-nnbsp": (12, True, "\u202f"),
+    "us12-unpadded-nnbsp": (12, False, "\u202f"),
+}
+FORMATS = {
+    name + suffix: (*clock, long_year)
+    for suffix, long_year in (("", False), ("-long-year", True))
+    for name, clock in CLOCKS.items()
+}
+MEDIA_KINDS = {
+    # kind: (file name prefix, extension)
+    "image": ("IMG", "jpg"),
+    "video": ("VID", "mp4"),
+    "audio": ("PTT", "opus"),
+    "document": ("DOC", "pdf"),
+}
+DEFAULT_MEDIA = {"image": 0.05, "audio": 0.04, "video": 0.01, "document": 0.01, "omitted": 0.0}
+NAMES = ["Alice", "Bob", "Célia", "Dmitri", "Émile", "Fatima", "Grégoire", "Hana", "Ibrahim", "Joëlle",
+         "Kenji", "Léa", "Mateo", "Nour", "Océane", "Pablo"]
+WORDS = ("ok merci demain ce soir the meeting is at noon on arrive bientôt haha 😂 👍 see you tomorrow "
+         "je suis en route photo envoyée can you call me later d'accord parfait 🎉 rendez-vous "
+         "https://example.com/page?id=42 c'est noté thanks a lot on se voit samedi").split()
+SYSTEM_MESSAGES = ["Messages and calls are end-to-end encrypted. No one outside of this chat can read them.",
+                   "{name} changed the group description", "{name} joined using this group's invite link",
+                   "{name} changed this group's icon"]
+
+
+def format_stamp(when: datetime, fmt: str) -> str:
+    """The "date, time" that starts a message line, in one of FORMATS."""
+    clock, padded, separator, long_year = FORMATS[fmt]
+    year = f"{when.year:04d}" if long_year else f"{when.year % 100:02d}"
+    hour = (when.hour + 11) % 12 + 1 if clock == 12 else when.hour
+    suffix = separator + ("AM" if when.hour < 12 else "PM") if clock == 12 else ""
+    if padded:
+        return f"{when.month:02d}/{when.day:02d}/{year}, {hour:02d}:{when.minute:02d}{suffix}"
+    return f"{when.month}/{when.day}/{year}, {hour}:{when.minute:02d}{suffix}"
+
+
+def parse_media_mix(text: str) -> dict[str, float]:
+    """ "image=0.05,audio=0.04" -> {"image": 0.05, "audio": 0.04}, checked against MEDIA_KINDS."""
+    mix = {}
+    for part in filter(None, text.split(",")):
+        kind, _, share = part.partition("=")
+        if kind not in MEDIA_KINDS and kind != "omitted":
+            raise ValueError(f"unknown media kind: {kind}")
+        mix[kind] = float(share)
+    if sum(mix.values()) > 1:
+        raise ValueError("media shares add up to more than 1")
+    return mix
+
+
+def _placeholder(kind: str, rng: random.Random) -> bytes:
+    """A tiny file of the kind: a real JPEG when Pillow is available, marker bytes otherwise."""
+    if kind == "image":
+        try:
+            from PIL import Image
+        except ImportError:
+            pass
+        else:
+            buffer = io.BytesIO()
+            color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            Image.new("RGB", (64, 48), color).save(buffer, "JPEG", quality=70)
+            return buffer.getvalue()
+    if kind == "document":
+        return b"%PDF-1.1\n%%EOF\n"
+    return f"placeholder {kind} {rng.random()}".encode("ascii")
+
+
+def generate_chat(out_dir: Path, messages: int = 10000, participants: int = 4, continuation: float = 0.1,
+                  media: dict[str, float] = DEFAULT_MEDIA, external_audio: int = 0, fmt: str = "us12",
+                  seed: int = 1, start: datetime = datetime(2021, 1, 1, 8, 0)) -> dict[str, int]:
+    """Write out_dir/_chat.txt and its media. Returns counts of what was written."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = [NAMES[i % len(NAMES)] + ("" if i < len(NAMES) else f" {i // len(NAMES) + 1}")
+             for i in range(participants)]
+    kinds = list(media)
+    weights = [media[k] for k in kinds] + [max(0.0, 1 - sum(media.values()))]
+    counts = {"messages": 0, "continuation_lines": 0, "system": 0, "media_files": 0, "omitted": 0}
+    when = start
+    sequence = 0
+    with open(out_dir / "_chat.txt", "w", encoding="utf-8", newline="\n") as chat:
+        chat.write(f"{format_stamp(when, fmt)} - {SYSTEM_MESSAGES[0]}\n")
+        counts["system"] += 1
+        for _ in range(messages):
+            when += timedelta(minutes=rng.choice((0, 1, 1, 2, 5, 15, 60, 240, 720)))
+            stamp = format_stamp(when, fmt)
+            name = rng.choice(names)
+            if rng.random() < 0.002:
+                chat.write(f"{stamp} - {rng.choice(SYSTEM_MESSAGES[1:]).format(name=name)}\n")
+                counts["system"] += 1
+                continue
+            kind = rng.choices(kinds + ["text"], weights)[0]
+            if kind == "text":
+                body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 25)))
+            elif kind == "omitted":
+                body = "<Media omitted>"
+                counts["omitted"] += 1
+            else:
+                prefix, ext = MEDIA_KINDS[kind]
+                filename = f"{prefix}-{when:%Y%m%d}-WA{sequence:04d}.{ext}"
+                sequence += 1
+                (out_dir / filename).write_bytes(_placeholder(kind, rng))
+                counts["media_files"] += 1
+                body = f"{filename} (file attached)"
+            chat.write(f"{stamp} - {name}: {body}\n")
+            counts["messages"] += 1
+            if rng.random() < continuation:
+                for _ in range(rng.randint(1, 3)):
+                    chat.write(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12))) + "\n")
+                    counts["continuation_lines"] += 1
+    for _ in range(external_audio):
+        day = start + timedelta(days=rng.randrange(max(1, (when - start).days + 1)))
+        (out_dir / f"AUD-{day:%Y%m%d}-WA{sequence:04d}.opus").write_bytes(_placeholder("audio", rng))
+        sequence += 1
+        counts["media_files"] += 1
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a synthetic WhatsApp chat export.")
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--participants", type=int, default=4)
+    parser.add_argument("--continuation", type=float, default=0.1, help="Share of messages with extra lines")
+    parser.add_argument("--media", type=parse_media_mix, default=DEFAULT_MEDIA,
+                        help="Share of messages per media kind: image, video, audio, document, omitted")
+    parser.add_argument("--external-audio", type=int, default=0, help="Voice notes the chat does not mention")
+    parser.add_argument("--format", choices=FORMATS, default="us12")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    counts = generate_chat(args.out_dir, args.messages, args.participants, args.continuation, args.media,
+                           args.external_audio, args.format, args.seed)
+    print(", ".join(f"{key}: {value}" for key, value in counts.items()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
-"""Entry point for python -m whatsapp_archive."""
-from whatsapp_archive.gui.main_window import main
+"""Entry point for python -m whatsapp_archive: the desktop app, or the build|batch|watch commands (see cli)."""
+import sys
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("build", "batch", "watch"):
+        from whatsapp_archive.cli import main
+    else:
+        from whatsapp_archive.gui.main_window import main
     main()
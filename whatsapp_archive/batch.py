@@ -0,0 +1,207 @@
+"""Batch builds: many chat exports in one run, sharing one Whisper model.
+
+Jobs come from a manifest or from a folder of exports. A manifest lists the chats, with
+build options (named as on the command line) for all jobs or per job:
+
+    {"defaults": {"transcribe": true, "lang": "fr"},
+     "jobs": [{"chat": "alice/_chat.txt", "output": "alice.html", "title": "Alice"},
+              {"chat": "bob/_chat.txt", "shard_mode": "month", "state": "bob_state.json"}]}
+
+Paths are relative to the manifest; outputs default to <output dir>/<chat name>.html.
+A folder is scanned recursively for chat exports (see parser.find_chat_exports).
+
+Jobs run `max_jobs` at a time, smallest chat first, so short chats are not held up by a
+long one. Concurrent jobs split the CPUs between their media stages and share the
+resident model (see transcriber), which transcribes for one job at a time. A job that
+fails with an unexpected error is retried on its own. <output dir>/batch_summary.json is
+rewritten as jobs progress, with each job's status, attempts, timings and errors.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from whatsapp_archive.html_builder import PageState
+from whatsapp_archive.parser import find_chat_exports
+from whatsapp_archive.pipeline import ArchivePipeline, BuildError
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_NAME = "batch_summary.json"
+# Build options a manifest may set; the model is shared, so its index is set for the whole batch.
+JOB_OPTIONS = ("lang", "timezone", "date_from", "date_to", "transcribe", "encrypt", "shard_mode",
+               "transcode_video", "compact_audio", "virtual", "transcript_sidecar",
+               "shared_assets", "minify", "precompress")
+
+
+def output_name(chat: Path) -> str:
+    """WhatsApp names the file _chat.txt inside a folder named after the chat."""
+    return chat.parent.name if chat.stem == "_chat" else chat.stem
+
+
+def _make_job(chat: Path, output: Optional[Path], output_dir: Path, title: Optional[str],
+              options: dict, state: Optional[PageState]) -> dict[str, Any]:
+    name = output_name(chat)
+    output = output or output_dir / f"{name}.html"
+    return {"name": name, "chat": chat, "output": output, "title": title or output.stem,
+            "options": options, "state": state}
+
+
+def _job_options(base: dict, overrides: dict) -> dict:
+    unknown = set(overrides) - set(JOB_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown build options: {', '.join(sorted(unknown))}")
+    options = dict(base)
+    options.update(overrides)
+    for key in ("date_from", "date_to"):
+        if isinstance(options.get(key), str):
+            options[key] = date.fromisoformat(options[key])
+    return options
+
+
+def jobs_from_manifest(manifest: Path, output_dir: Path, base_options: dict) -> list[dict[str, Any]]:
+    """Jobs listed in a manifest file. Raises ValueError if it is malformed."""
+    with open(manifest, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not isinstance(data.get("jobs"), list):
+        raise ValueError(f"{manifest.name} has no \"jobs\" list")
+    root = manifest.parent
+    defaults = _job_options(base_options, data.get("defaults", {}))
+    jobs = []
+    for entry in data["jobs"]:
+        entry = dict(entry)
+        chat = root / entry.pop("chat")
+        output = root / entry.pop("output") if "output" in entry else None
+        title = entry.pop("title", None)
+        state = PageState.load(root / entry.pop("state")) if "state" in entry else None
+        jobs.append(_make_job(chat, output, output_dir, title, _job_options(defaults, entry), state))
+    return jobs
+
+
+def jobs_from_folder(folder: Path, output_dir: Path, base_options: dict) -> list[dict[str, Any]]:
+    """One job per chat export found under `folder`."""
+    jobs = []
+    names: set[str] = set()
+    for chat in find_chat_exports(folder):
+        job = _make_job(chat, None, output_dir, None, dict(base_options), None)
+        if job["name"] in names:
+            # Two exports with the same name: keep both archives.
+            job = _make_job(chat, output_dir / f"{job['name']}_{len(jobs) + 1}.html", output_dir, None,
+                            dict(base_options), None)
+        names.add(job["name"])
+        jobs.append(job)
+    return jobs
+
+
+def _job_size(job: dict[str, Any]) -> int:
+    try:
+        return job["chat"].stat().st_size
+    except OSError:
+        return 0
+
+
+class BatchRunner:
+    """Runs a list of jobs (see jobs_from_manifest / jobs_from_folder) and keeps the summary."""
+
+    def __init__(self, jobs: list[dict[str, Any]], summary_path: Path, model_index: int = -1,
+                 max_jobs: int = 2, retries: int = 1,
+                 status: Optional[Callable[[dict, str, dict], None]] = None):
+        self.jobs = sorted(jobs, key=_job_size)
+        self.summary_path = summary_path
+        self.model_index = model_index
+        self.max_jobs = max(1, max_jobs)
+        self.retries = max(0, retries)
+        self.status = status
+        self.stop_requested = False
+        self.media_workers = max(1, (os.cpu_count() or 2) // self.max_jobs)
+        self._lock = threading.Lock()
+        self._running: set[ArchivePipeline] = set()
+        self.summary: dict[str, Any] = {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "finished": None,
+            "jobs": [{"chat": str(job["chat"]), "output": str(job["output"]), "status": "pending",
+                      "attempts": [], "seconds": 0.0} for job in self.jobs],
+        }
+
+    def request_stop(self) -> None:
+        """Stop the running jobs at their next check and skip the pending ones."""
+        with self._lock:
+            self.stop_requested = True
+            for pipeline in self._running:
+                pipeline.request_stop()
+
+    def run(self) -> dict[str, Any]:
+        """Run every job and return the summary (also written to `summary_path`)."""
+        if any(job["options"]["transcribe"] or job["options"]["encrypt"] for job in self.jobs):
+            # Parsing and media stages of the first jobs overlap with loading the model.
+            from whatsapp_archive.transcriber import preload_whisper_model
+            preload_whisper_model(self.model_index)
+        self._write_summary()
+        with ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="batch-job") as pool:
+            # The executor starts jobs in submission order: smallest chats first.
+            for result in [pool.submit(self._run_job, job, entry)
+                           for job, entry in zip(self.jobs, self.summary["jobs"])]:
+                result.result()
+        self.summary["finished"] = datetime.now().isoformat(timespec="seconds")
+        self._write_summary()
+        return self.summary
+
+    def _run_job(self, job: dict[str, Any], entry: dict[str, Any]) -> None:
+        from whatsapp_archive.cli import pipeline_options
+
+        options = dict(job["options"], model_index=self.model_index)
+        for _attempt in range(1 + self.retries):
+            pipeline = ArchivePipeline(job["chat"], job["output"], job["title"], page_state=job["state"],
+                                       media_workers=self.media_workers, **pipeline_options(options))
+            if self.status:
+                pipeline.status_updated.connect(lambda key, params: self.status(job, key, params))
+            with self._lock:
+                if self.stop_requested:
+                    entry["status"] = "stopped"
+                    break
+                self._running.add(pipeline)
+                entry["status"] = "running"
+            self._write_summary()
+            start = time.perf_counter()
+            error = None
+            retry = False
+            try:
+                pipeline.run()
+            except BuildError as e:
+                error = e.key  # stopped, or nothing to build: a retry would end the same way
+            except Exception as e:
+                retry = True
+                logger.exception("Batch job %s failed: %s", job["chat"], e)
+                error = str(e) or type(e).__name__
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._running.discard(pipeline)
+                entry["attempts"].append({"seconds": round(seconds, 2), "error": error})
+                entry["seconds"] = round(entry["seconds"] + seconds, 2)
+                entry["transcription_seconds"] = round(pipeline.total_transcription_time, 2)
+                if error is None:
+                    entry["status"] = "ok"
+                    entry.pop("error", None)
+                else:
+                    entry["status"] = "stopped" if error == "error_stopped" else "failed"
+                    entry["error"] = error
+            if not retry:
+                break
+        self._write_summary()
+
+    def _write_summary(self) -> None:
+        with self._lock:
+            counts: dict[str, int] = {}
+            for entry in self.summary["jobs"]:
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+            self.summary["counts"] = counts
+            self.summary_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.summary_path.with_name(self.summary_path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.summary, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.summary_path)
@@ -0,0 +1,221 @@
+"""
+Command line builds, without Qt: runs the same pipeline as the desktop app.
+Usage: python -m whatsapp_archive build --chat _chat.txt --output archive.html
+       [--title T] [--transcribe] [--encrypt] [--date-from YYYY-MM-DD] [--date-to YYYY-MM-DD] [--state S.json]
+       [--shared-assets [--assets-dir D]] [--minify] [--precompress] [--profile] [--profile-memory]
+       python -m whatsapp_archive batch (--manifest jobs.json | --dir exports/) --output-dir archives/
+       [--jobs 2] [--retries 1] [build options, as defaults for every job]
+       python -m whatsapp_archive watch --dir exports/ [--dir ...] --output-dir archives/
+       [--work-dir W] [--settle 10] [--poll 10] [build options]
+Language, timezone, Whisper model and the output options (--shard-mode, --virtual,
+--minify, ...) default to the desktop app's saved settings. --transcribe and --encrypt
+are not saved settings: they are off unless given. Status messages go to stderr; the
+archive path is printed on success.
+"""
+import argparse
+import logging
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+from whatsapp_archive.html_builder import SHARD_MODES, PageState
+from whatsapp_archive.settings_store import load_settings
+from whatsapp_archive.translations import TRANSLATIONS
+
+# Batch arguments that are not per-job build options (the model is shared by the batch).
+BATCH_ARGUMENTS = ("command", "manifest", "dir", "output_dir", "jobs", "retries", "model_index")
+WATCH_ARGUMENTS = ("command", "dir", "output_dir", "work_dir", "settle", "poll")
+
+
+def add_build_arguments(parser: argparse.ArgumentParser, settings: dict) -> None:
+    """The chat, the output and the build options."""
+    parser.add_argument("--chat", required=True, type=Path, help="WhatsApp chat file (_chat.txt)")
+    parser.add_argument("--output", required=True, type=Path, help="Output .html path")
+    parser.add_argument("--title", help="Archive title (default: output file name)")
+    add_build_options(parser, settings)
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the build; the profile and an anonymous summary go to the log folder")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Also snapshot memory allocations at each stage (slower; implies --profile)")
+
+
+def add_build_options(parser: argparse.ArgumentParser, settings: dict) -> None:
+    """The build options, with the saved settings as defaults."""
+    parser.add_argument("--lang", default=settings["lang"], choices=("en", "fr"), help="Archive language")
+    parser.add_argument("--timezone", default=settings["timezone_key"], help="Timezone of the chat dates")
+    parser.add_argument("--date-from", type=date.fromisoformat, help="First day to include (YYYY-MM-DD)")
+    parser.add_argument("--date-to", type=date.fromisoformat, help="Last day to include (YYYY-MM-DD)")
+    parser.add_argument("--transcribe", action="store_true", help="Transcribe audio with Whisper (cached ones are reused)")
+    parser.add_argument("--encrypt", action="store_true", help="Encrypt media for sharing")
+    parser.add_argument("--model-index", type=int, default=settings["whisper_model_index"],
+                        help="Whisper model index (0=tiny .. 4=large)")
+    parser.add_argument("--shard-mode", default=settings["shard_mode"], choices=SHARD_MODES)
+    parser.add_argument("--transcode-video", action=argparse.BooleanOptionalAction,
+                        default=settings["transcode_video"])
+    parser.add_argument("--compact-audio", action=argparse.BooleanOptionalAction, default=settings["compact_audio"])
+    parser.add_argument("--virtual", action=argparse.BooleanOptionalAction, default=settings["virtual_rendering"])
+    parser.add_argument("--transcript-sidecar", action=argparse.BooleanOptionalAction,
+                        default=settings["transcript_sidecar"])
+    parser.add_argument("--shared-assets", action=argparse.BooleanOptionalAction, default=settings["shared_assets"],
+                        help="Link the CSS/JS as content-hashed files shared by every archive in the assets folder")
+    parser.add_argument("--assets-dir", type=Path, help="Shared assets folder (default: assets/ next to the archive)")
+    parser.add_argument("--minify", action=argparse.BooleanOptionalAction, default=settings["minify_output"],
+                        help="Minify the pages' CSS and JS and collapse whitespace between tags")
+    parser.add_argument("--precompress", action=argparse.BooleanOptionalAction,
+                        default=settings["precompress_output"],
+                        help="Write .gz (and, with the brotli package, .br) copies of the pages and scripts")
+
+
+def pipeline_options(options: dict) -> dict:
+    """ArchivePipeline keyword arguments from build options named as on the command line."""
+    return {
+        "transcribe_audio": options["transcribe"],
+        "encrypt_media": options["encrypt"],
+        "lang": options["lang"],
+        "whisper_model_index": options["model_index"],
+        "timezone_str": options["timezone"],
+        "date_from": options["date_from"],
+        "date_to": options["date_to"],
+        "transcode_video": options["transcode_video"],
+        "compact_audio": options["compact_audio"],
+        "shard_mode": options["shard_mode"],
+        "virtual_rendering": options["virtual"],
+        "transcript_sidecar": options["transcript_sidecar"],
+        "shared_assets": options["shared_assets"],
+        "assets_dir": options["assets_dir"],
+        "minify_output": options["minify"],
+        "precompress_output": options["precompress"],
+    }
+
+
+def run_build(args: argparse.Namespace, page_state: Optional[PageState] = None) -> int:
+    """Run one build from parsed build arguments. Returns the process exit code."""
+    T = TRANSLATIONS[args.lang]
+    if not args.chat.exists():
+        print(f"Chat file not found: {args.chat}", file=sys.stderr)
+        return 1
+    try:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        print(f"Could not create the output folder {args.output.parent}: {e}", file=sys.stderr)
+        return 1
+
+    # Imported here so --help and argument errors do not wait for Whisper.
+    from whatsapp_archive.pipeline import ArchivePipeline, BuildError
+
+    pipeline = ArchivePipeline(args.chat, args.output, args.title or args.output.stem,
+                               page_state=page_state, **pipeline_options(vars(args)))
+    pipeline.status_updated.connect(lambda key, params: print(T.get(key, key).format(**params), file=sys.stderr))
+    try:
+        if args.profile or args.profile_memory:
+            from whatsapp_archive.profiling import BuildProfiler
+            out_file = BuildProfiler(pipeline, memory=args.profile_memory).run()
+        else:
+            out_file = pipeline.run()
+    except BuildError as e:
+        print(f"{T['error_title']}: {T.get(e.key, e.key)}", file=sys.stderr)
+        return 1
+    print(out_file)
+    return 0
+
+
+def load_state_argument(path: Optional[Path]) -> Optional[PageState]:
+    """The --state file, or None. Exits with a message if it cannot be read."""
+    if path is None:
+        return None
+    try:
+        return PageState.load(path)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {path}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """Run the jobs of a manifest or folder (see batch). Returns the process exit code."""
+    T = TRANSLATIONS[args.lang]
+    from whatsapp_archive.batch import SUMMARY_NAME, BatchRunner, jobs_from_folder, jobs_from_manifest
+
+    options = {key: value for key, value in vars(args).items() if key not in BATCH_ARGUMENTS}
+    try:
+        if args.manifest:
+            jobs = jobs_from_manifest(args.manifest, args.output_dir, options)
+        else:
+            jobs = jobs_from_folder(args.dir, args.output_dir, options)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Could not read the jobs: {e}", file=sys.stderr)
+        return 1
+    if not jobs:
+        print("No chat exports found.", file=sys.stderr)
+        return 1
+
+    def status(job: dict, key: str, params: dict) -> None:
+        print(f"[{job['name']}] {T.get(key, key).format(**params)}", file=sys.stderr)
+
+    runner = BatchRunner(jobs, args.output_dir / SUMMARY_NAME, model_index=args.model_index,
+                         max_jobs=args.jobs, retries=args.retries, status=status)
+    try:
+        summary = runner.run()
+    except KeyboardInterrupt:
+        # Running jobs stop at their next check; the executor waits for them.
+        runner.request_stop()
+        raise
+    for entry in summary["jobs"]:
+        print(f"{entry['status']:8} {entry['seconds']:8.1f}s  {entry['output']}")
+    return 0 if summary["counts"].get("ok", 0) == len(jobs) else 1
+
+
+def run_watch(args: argparse.Namespace) -> int:
+    """Watch folders and build the exports dropped into them (see watcher) until interrupted."""
+    from whatsapp_archive.watcher import FolderWatcher
+
+    missing = [folder for folder in args.dir if not folder.is_dir()]
+    if missing:
+        print(f"Folder not found: {', '.join(map(str, missing))}", file=sys.stderr)
+        return 1
+    options = {key: value for key, value in vars(args).items() if key not in WATCH_ARGUMENTS}
+    FolderWatcher(args.dir, args.output_dir, options, work_dir=args.work_dir,
+                  settle=args.settle, poll=args.poll).run()
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m whatsapp_archive",
+                                     description="Build WhatsApp chat archives from the command line.")
+    settings = load_settings()
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build an HTML archive from a chat export")
+    add_build_arguments(build, settings)
+    build.add_argument("--state", type=Path,
+                       help="State file exported from an archive page, applied to the build (see prune_cli)")
+    batch = commands.add_parser("batch", help="Build archives for many chat exports in one run")
+    source = batch.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", type=Path, help="JSON file listing the jobs (see batch)")
+    source.add_argument("--dir", type=Path, help="Folder searched for chat exports")
+    batch.add_argument("--output-dir", required=True, type=Path, help="Folder for the archives and batch_summary.json")
+    batch.add_argument("--jobs", type=int, default=2, help="Chats built at the same time")
+    batch.add_argument("--retries", type=int, default=1, help="Retries for a job that fails unexpectedly")
+    add_build_options(batch, settings)
+    watch = commands.add_parser("watch", help="Build the chat exports dropped into folders, as they arrive")
+    watch.add_argument("--dir", required=True, type=Path, action="append", help="Folder to watch (repeatable)")
+    watch.add_argument("--output-dir", required=True, type=Path, help="Folder for the archives and watch_status.json")
+    watch.add_argument("--work-dir", type=Path,
+                       help="Folder keeping each chat's merged exports and caches (default: <output-dir>/_chats)")
+    watch.add_argument("--settle", type=float, default=10.0,
+                       help="Seconds an export must stay unchanged before it is built")
+    watch.add_argument("--poll", type=float, default=10.0, help="Seconds between rescans")
+    add_build_options(watch, settings)
+    args = parser.parse_args(argv)
+
+    if args.command == "watch":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+        sys.exit(run_watch(args))
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    if args.command == "batch":
+        sys.exit(run_batch(args))
+    state = load_state_argument(args.state)
+    sys.exit(run_build(args, state))
+
+
+if __name__ == "__main__":
+    main()
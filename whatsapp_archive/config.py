@@ -31,3 +31,37 @@ WHISPER_MODELS = [
     ("Medium", "medium", None),
     ("Large (best, slowest)", "large", "large-v3.pt"),
 ]
+
+# Image previews: longest side in pixels and encoder quality (WebP, or JPEG if WebP is unavailable)
+THUMBNAIL_MAX_SIZE = 640
+THUMBNAIL_QUALITY = 80
+
+# Optional lightweight video renditions: capped-bitrate H.264 video + Opus audio, web-optimized MP4
+VIDEO_TRANSCODE_ARGS = [
+    "-vf", "scale='min(1280,iw)':-2",
+    "-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-maxrate", "1500k", "-bufsize", "3000k",
+    "-pix_fmt", "yuv420p",
+    "-c:a", "libopus", "-b:a", "64k",
+    "-movflags", "+faststart",
+]
+
+# Optional compact voice notes: attachments from this size up are re-encoded to mono speech-rate Opus
+AUDIO_COMPACT_MIN_BYTES = 256 * 1024
+AUDIO_COMPACT_ARGS = ["-ac", "1", "-c:a", "libopus", "-b:a", "24k", "-application", "voip"]
+
+# Sharded output: messages per page when splitting by count
+SHARD_MESSAGE_COUNT = 5000
+
+# Folders the app writes next to chat exports (caches, the watcher's copies of exports).
+# Walks for chats and media skip them; other folders, whatever their names, are the user's.
+APP_FOLDERS = ("_archive_cache", "_transcriptions_cache", "_chats")
+
+# Shared assets: default folder, next to the archive, for the content-hashed CSS/JS files
+ASSETS_FOLDER = "assets"
+
+# Pre-compressed copies for hosted archives (.gz always, .br with the brotli package).
+# Brotli's top quality is slow on large pages, which get a lower one.
+PRECOMPRESS_GZIP_LEVEL = 9
+PRECOMPRESS_BROTLI_QUALITY = 11
+PRECOMPRESS_BROTLI_LARGE_QUALITY = 9
+PRECOMPRESS_BROTLI_LARGE_BYTES = 8 * 1024 * 1024
@@ -1,37 +1,107 @@
-"""AES-GCM encryption helper for media files."""
+"""AES-GCM encryption helper for media files.
+
+Files are written in a chunked format so that neither the encryptor nor the
+browser decryptor has to hold a whole file in memory:
+
+    header:  magic b"WAE2" (4) + chunk size, uint32 big-endian (4)
+    chunks:  nonce (12) + ciphertext (<= chunk size) + tag (16)
+
+Each chunk is sealed with its own random nonce and authenticates its index
+and a final-chunk flag as additional data, so chunks cannot be reordered,
+dropped or truncated without the decryptor noticing.
+"""
+import os
+import struct
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-from Crypto.Cipher import AES
-from Crypto.Random import get_random_bytes
+from whatsapp_archive.utils import temp_path
 
 if TYPE_CHECKING:
-    from whatsapp_archive.gui.worker import ChatWorker
+    from whatsapp_archive.pipeline import ArchivePipeline
+
+CHUNK_MAGIC = b"WAE2"
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+def chunk_aad(index: int, final: bool) -> bytes:
+    """Additional authenticated data for chunk `index` (uint32 BE index + final flag byte)."""
+    return struct.pack(">IB", index, 1 if final else 0)
+
+
+def _seal_chunk(key_bytes: bytes, chunk: bytes, index: int, final: bool) -> bytes:
+    # pycryptodome is imported on first use, not when the app starts.
+    from Crypto.Cipher import AES
+    from Crypto.Random import get_random_bytes
+
+    nonce = get_random_bytes(NONCE_SIZE)
+    cipher = AES.new(key_bytes, AES.MODE_GCM, nonce=nonce)
+    cipher.update(chunk_aad(index, final))
+    ciphertext, tag = cipher.encrypt_and_digest(chunk)
+    return nonce + ciphertext + tag
+
+
+def encrypt_bytes(data: bytes, key_hex: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> bytes:
+    """Encrypt an in-memory payload into the same chunked format as encrypt_file."""
+    key_bytes = bytes.fromhex(key_hex)
+    out = bytearray(CHUNK_MAGIC + struct.pack(">I", chunk_size))
+    starts = range(0, max(len(data), 1), chunk_size)
+    for index, start in enumerate(starts):
+        final = index == len(starts) - 1
+        out += _seal_chunk(key_bytes, data[start:start + chunk_size], index, final)
+    return bytes(out)
 
 
 def encrypt_file(
     input_path: Path,
     output_path: Path,
     key_hex: str,
-    worker: "ChatWorker",
-) -> None:
-    """Encrypt a file with AES-GCM. Writes nonce (16) + tag (16) + ciphertext to output_path."""
+    worker: "ArchivePipeline",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> bool:
+    """Encrypt a file with chunked AES-GCM, streaming `chunk_size` bytes at a time.
+
+    Output is written to a temporary `.part` file and renamed into place, so an
+    interrupted run never leaves a truncated file behind for the next run to reuse.
+    Returns False (after reporting the error) if the file could not be encrypted; an
+    output left by an earlier run is removed then, as it no longer matches the source.
+    """
     import logging
     logger = logging.getLogger(__name__)
+    part_path = temp_path(output_path, ".part")
     try:
         key_bytes = bytes.fromhex(key_hex)
-        cipher = AES.new(key_bytes, AES.MODE_GCM)
-
-        with open(input_path, "rb") as f:
-            file_data = f.read()
 
-        ciphertext, tag = cipher.encrypt_and_digest(file_data)
+        with open(input_path, "rb") as src, open(part_path, "wb") as dst:
+            dst.write(CHUNK_MAGIC + struct.pack(">I", chunk_size))
+            index = 0
+            chunk = src.read(chunk_size)
+            while True:
+                # Read one chunk ahead so the last chunk can be flagged as final.
+                next_chunk = src.read(chunk_size)
+                final = not next_chunk
+                dst.write(_seal_chunk(key_bytes, chunk, index, final))
+                if final:
+                    break
+                chunk = next_chunk
+                index += 1
 
-        with open(output_path, "wb") as f:
-            f.write(cipher.nonce)
-            f.write(tag)
-            f.write(ciphertext)
+        os.replace(part_path, output_path)
+        worker.report.count("encryption", items=1, bytes_read=input_path.stat().st_size,
+                            bytes_written=output_path.stat().st_size)
+        return True
 
     except Exception as e:
         logger.exception("Failed to encrypt %s: %s", input_path.name, e)
+        try:
+            part_path.unlink()
+        except OSError:
+            pass
+        try:
+            output_path.unlink()
+        except OSError:
+            pass
         worker.status_updated.emit("status_encrypting_error", {"filename": input_path.name})
+        return False
@@ -1,11 +1,12 @@
 """Main application window and entry point."""
+import html
 import logging
 import sys
 import tempfile
 from pathlib import Path
 
 from PySide6.QtCore import QProcess, QThread, Qt, QTimer, Slot, QUrl, QDate
-from PySide6.QtGui import QAction, QClipboard, QDragEnterEvent, QDropEvent, QKeySequence
+from PySide6.QtGui import QAction, QClipboard, QDesktopServices, QDragEnterEvent, QDropEvent, QKeySequence
 from PySide6.QtWidgets import (
     QApplication,
     QCheckBox,
@@ -27,20 +28,27 @@ from PySide6.QtWidgets import (
     QWidget,
 )
 
-from whatsapp_archive.config import COMMON_TIMEZONES, VERSION, WHISPER_MODELS
+from whatsapp_archive.config import COMMON_TIMEZONES, SHARD_MESSAGE_COUNT, VERSION, WHISPER_MODELS
 from whatsapp_archive.gui.styles import DARK_STYLE, LIGHT_STYLE
 from whatsapp_archive.gui.worker import ChatWorker
+from whatsapp_archive.html_builder import SHARD_MODES
+from whatsapp_archive.report import stage_rows
 from whatsapp_archive.translations import TRANSLATIONS
 from whatsapp_archive.parser import (
-    MEDIA_FILENAME_RE,
     load_chat_messages,
+    media_filename_match,
     parse_message_datetime,
 )
 from whatsapp_archive.settings_store import load_settings, save_settings
-from whatsapp_archive.utils import setup_logging
+from whatsapp_archive.transcriber import preload_whisper_model
+from whatsapp_archive.utils import log_directory, setup_logging
 
 logger = logging.getLogger(__name__)
 
+# Quiet time after the last model or transcription change before the model is preloaded:
+# scrolling through the model list must not start a load (or download) per entry.
+PRELOAD_DELAY_MS = 1000
+
 
 class MainWindow(QWidget):
     def __init__(self, app: QApplication):
@@ -58,6 +66,11 @@ class MainWindow(QWidget):
         self.spinner_base_text = ""
         self.spinner_timer.timeout.connect(self._update_spinner)
 
+        self.preload_timer = QTimer(self)
+        self.preload_timer.setSingleShot(True)
+        self.preload_timer.setInterval(PRELOAD_DELAY_MS)
+        self.preload_timer.timeout.connect(self._preload_model)
+
         self.setup_ui()
 
         self.chat_file_path = None
@@ -91,6 +104,7 @@ class MainWindow(QWidget):
 
         self.transcribe_checkbox = QCheckBox(T["transcribe_label"])
         self.transcribe_checkbox.setChecked(True)
+        self.transcribe_checkbox.toggled.connect(self._schedule_preload)
         input_layout.addWidget(self.transcribe_checkbox)
 
         self.encrypt_checkbox = QCheckBox(T["encrypt_label"])
@@ -98,6 +112,41 @@ class MainWindow(QWidget):
         self.encrypt_checkbox.toggled.connect(self.on_encrypt_toggled)
         input_layout.addWidget(self.encrypt_checkbox)
 
+        self.transcode_checkbox = QCheckBox(T["transcode_video_label"])
+        self.transcode_checkbox.setChecked(False)
+        self.transcode_checkbox.toggled.connect(self._save_settings)
+        input_layout.addWidget(self.transcode_checkbox)
+
+        self.compact_audio_checkbox = QCheckBox(T["compact_audio_label"])
+        self.compact_audio_checkbox.setChecked(False)
+        self.compact_audio_checkbox.toggled.connect(self._save_settings)
+        input_layout.addWidget(self.compact_audio_checkbox)
+
+        self.virtual_checkbox = QCheckBox(T["virtual_rendering_label"])
+        self.virtual_checkbox.setChecked(False)
+        self.virtual_checkbox.toggled.connect(self._save_settings)
+        input_layout.addWidget(self.virtual_checkbox)
+
+        self.transcript_sidecar_checkbox = QCheckBox(T["transcript_sidecar_label"])
+        self.transcript_sidecar_checkbox.setChecked(False)
+        self.transcript_sidecar_checkbox.toggled.connect(self._save_settings)
+        input_layout.addWidget(self.transcript_sidecar_checkbox)
+
+        self.shared_assets_checkbox = QCheckBox(T["shared_assets_label"])
+        self.shared_assets_checkbox.setChecked(False)
+        self.shared_assets_checkbox.toggled.connect(self._save_settings)
+        input_layout.addWidget(self.shared_assets_checkbox)
+
+        self.minify_checkbox = QCheckBox(T["minify_output_label"])
+        self.minify_checkbox.setChecked(False)
+        self.minify_checkbox.toggled.connect(self._save_settings)
+        input_layout.addWidget(self.minify_checkbox)
+
+        self.precompress_checkbox = QCheckBox(T["precompress_output_label"])
+        self.precompress_checkbox.setChecked(False)
+        self.precompress_checkbox.toggled.connect(self._save_settings)
+        input_layout.addWidget(self.precompress_checkbox)
+
         model_layout = QHBoxLayout()
         model_layout.addWidget(QLabel("Whisper model:"))
         self.whisper_model_combo = QComboBox()
@@ -105,9 +154,20 @@ class MainWindow(QWidget):
             self.whisper_model_combo.addItem(display_name)
         self.whisper_model_combo.setCurrentIndex(len(WHISPER_MODELS) - 1)  # Large by default
         self.whisper_model_combo.currentIndexChanged.connect(self._save_settings)
+        self.whisper_model_combo.currentIndexChanged.connect(self._schedule_preload)
         model_layout.addWidget(self.whisper_model_combo)
         input_layout.addLayout(model_layout)
 
+        shard_layout = QHBoxLayout()
+        self.shard_label = QLabel(T["shard_label"])
+        shard_layout.addWidget(self.shard_label)
+        self.shard_combo = QComboBox()
+        for mode in SHARD_MODES:
+            self.shard_combo.addItem(T[f"shard_{mode}"].format(count=SHARD_MESSAGE_COUNT), mode)
+        self.shard_combo.currentIndexChanged.connect(self._save_settings)
+        shard_layout.addWidget(self.shard_combo)
+        input_layout.addLayout(shard_layout)
+
         tz_layout = QHBoxLayout()
         tz_layout.addWidget(QLabel("Timezone:"))
         self.timezone_combo = QComboBox()
@@ -289,6 +349,19 @@ class MainWindow(QWidget):
         exit_act.triggered.connect(self.close)
         file_menu.addAction(exit_act)
         help_menu = menubar.addMenu("&Help")
+        # Diagnostics for slow builds: profiles go to the log folder (see profiling).
+        self.profile_act = QAction("&Profile builds", self)
+        self.profile_act.setCheckable(True)
+        self.profile_act.toggled.connect(self._save_settings)
+        help_menu.addAction(self.profile_act)
+        self.profile_memory_act = QAction("Profile &memory allocations", self)
+        self.profile_memory_act.setCheckable(True)
+        self.profile_memory_act.toggled.connect(self._save_settings)
+        help_menu.addAction(self.profile_memory_act)
+        log_folder_act = QAction("Open &log folder", self)
+        log_folder_act.triggered.connect(lambda: QDesktopServices.openUrl(QUrl.fromLocalFile(str(log_directory()))))
+        help_menu.addAction(log_folder_act)
+        help_menu.addSeparator()
         about_act = QAction("&About", self)
         about_act.triggered.connect(self._show_about)
         help_menu.addAction(about_act)
@@ -316,6 +389,35 @@ class MainWindow(QWidget):
         self.whisper_model_combo.blockSignals(True)
         self.whisper_model_combo.setCurrentIndex(min(s.get("whisper_model_index", len(WHISPER_MODELS) - 1), len(WHISPER_MODELS) - 1))
         self.whisper_model_combo.blockSignals(False)
+        self.transcode_checkbox.blockSignals(True)
+        self.transcode_checkbox.setChecked(s.get("transcode_video", False))
+        self.transcode_checkbox.blockSignals(False)
+        self.compact_audio_checkbox.blockSignals(True)
+        self.compact_audio_checkbox.setChecked(s.get("compact_audio", False))
+        self.compact_audio_checkbox.blockSignals(False)
+        self.virtual_checkbox.blockSignals(True)
+        self.virtual_checkbox.setChecked(s.get("virtual_rendering", False))
+        self.virtual_checkbox.blockSignals(False)
+        self.transcript_sidecar_checkbox.blockSignals(True)
+        self.transcript_sidecar_checkbox.setChecked(s.get("transcript_sidecar", False))
+        self.transcript_sidecar_checkbox.blockSignals(False)
+        self.shared_assets_checkbox.blockSignals(True)
+        self.shared_assets_checkbox.setChecked(s.get("shared_assets", False))
+        self.shared_assets_checkbox.blockSignals(False)
+        self.minify_checkbox.blockSignals(True)
+        self.minify_checkbox.setChecked(s.get("minify_output", False))
+        self.minify_checkbox.blockSignals(False)
+        self.precompress_checkbox.blockSignals(True)
+        self.precompress_checkbox.setChecked(s.get("precompress_output", False))
+        self.precompress_checkbox.blockSignals(False)
+        for action, key in ((self.profile_act, "profile_builds"), (self.profile_memory_act, "profile_memory")):
+            action.blockSignals(True)
+            action.setChecked(s.get(key, False))
+            action.blockSignals(False)
+        shard_idx = self.shard_combo.findData(s.get("shard_mode", "none"))
+        self.shard_combo.blockSignals(True)
+        self.shard_combo.setCurrentIndex(max(shard_idx, 0))
+        self.shard_combo.blockSignals(False)
         if "window_x" in s and "window_y" in s and "window_width" in s and "window_height" in s:
             self.setGeometry(s["window_x"], s["window_y"], s["window_width"], s["window_height"])
 
@@ -339,7 +441,7 @@ class MainWindow(QWidget):
                 name = m.get("name") or "(system)"
                 participants[name] = participants.get(name, 0) + 1
                 msg = m.get("msg", "")
-                mf = MEDIA_FILENAME_RE.search(msg) or MEDIA_FILENAME_RE.fullmatch(msg.strip())
+                mf = media_filename_match(msg)
                 if mf:
                     fn = mf.group("fname")
                     low = fn.lower()
@@ -382,6 +484,16 @@ class MainWindow(QWidget):
             "lang": self.current_lang,
             "timezone_key": self.timezone_combo.currentData() or "America/New_York",
             "whisper_model_index": self.whisper_model_combo.currentIndex(),
+            "transcode_video": self.transcode_checkbox.isChecked(),
+            "compact_audio": self.compact_audio_checkbox.isChecked(),
+            "shard_mode": self.shard_combo.currentData() or "none",
+            "virtual_rendering": self.virtual_checkbox.isChecked(),
+            "transcript_sidecar": self.transcript_sidecar_checkbox.isChecked(),
+            "shared_assets": self.shared_assets_checkbox.isChecked(),
+            "minify_output": self.minify_checkbox.isChecked(),
+            "precompress_output": self.precompress_checkbox.isChecked(),
+            "profile_builds": self.profile_act.isChecked(),
+            "profile_memory": self.profile_memory_act.isChecked(),
             "last_directory": last_dir,
             "window_x": self.x(),
             "window_y": self.y(),
@@ -439,6 +551,17 @@ class MainWindow(QWidget):
         self.title_label.setText(T["title_label"])
         self.transcribe_checkbox.setText(T["transcribe_label"])
         self.encrypt_checkbox.setText(T["encrypt_label"])
+        self.transcode_checkbox.setText(T["transcode_video_label"])
+        self.compact_audio_checkbox.setText(T["compact_audio_label"])
+        self.virtual_checkbox.setText(T["virtual_rendering_label"])
+        self.transcript_sidecar_checkbox.setText(T["transcript_sidecar_label"])
+        self.shared_assets_checkbox.setText(T["shared_assets_label"])
+        self.minify_checkbox.setText(T["minify_output_label"])
+        self.precompress_checkbox.setText(T["precompress_output_label"])
+        self.shard_label.setText(T["shard_label"])
+        for i in range(self.shard_combo.count()):
+            mode = self.shard_combo.itemData(i)
+            self.shard_combo.setItemText(i, T[f"shard_{mode}"].format(count=SHARD_MESSAGE_COUNT))
         self.select_chat_btn.setText(T["select_chat_btn"])
         if self.chat_file_label.text() in (TRANSLATIONS["en"]["chat_file_label"], TRANSLATIONS["fr"]["chat_file_label"]):
             self.chat_file_label.setText(T["chat_file_label"])
@@ -474,6 +597,15 @@ class MainWindow(QWidget):
         else:
             self.lang_button.setText(T["lang_btn_en"])
 
+    def _schedule_preload(self, *_args):
+        self.preload_timer.start()
+
+    def _preload_model(self, *_args):
+        """Load the selected Whisper model in the background while the build is set up.
+        Not during a build: the build loads the model it was started with."""
+        if self.transcribe_checkbox.isChecked() and self.worker is None:
+            preload_whisper_model(self.whisper_model_combo.currentIndex())
+
     @Slot(bool)
     def on_encrypt_toggled(self, checked):
         if checked:
@@ -503,6 +635,8 @@ class MainWindow(QWidget):
 
     def _reset_buttons(self):
         T = TRANSLATIONS[self.current_lang]
+        self.worker = None
+        self.worker_thread = None
         self.run_btn.setEnabled(True)
         self.select_chat_btn.setEnabled(True)
         self.stop_btn.hide()
@@ -742,6 +876,16 @@ class MainWindow(QWidget):
             timezone_str,
             date_from,
             date_to,
+            transcode_video=self.transcode_checkbox.isChecked(),
+            compact_audio=self.compact_audio_checkbox.isChecked(),
+            shard_mode=self.shard_combo.currentData() or "none",
+            virtual_rendering=self.virtual_checkbox.isChecked(),
+            transcript_sidecar=self.transcript_sidecar_checkbox.isChecked(),
+            shared_assets=self.shared_assets_checkbox.isChecked(),
+            minify_output=self.minify_checkbox.isChecked(),
+            precompress_output=self.precompress_checkbox.isChecked(),
+            profile=self.profile_act.isChecked() or self.profile_memory_act.isChecked(),
+            profile_memory=self.profile_memory_act.isChecked(),
         )
         self.worker.moveToThread(self.worker_thread)
         self.worker_thread.started.connect(self.worker.run)
@@ -787,8 +931,24 @@ class MainWindow(QWidget):
             self.status_label.setText(text)
             self.spinner_base_text = ""
 
-    @Slot(str, float)
-    def on_finished(self, out_file_path, transcription_time):
+    def _stages_table(self, stages: dict) -> str:
+        """The build report's stage figures as a rich-text table for the finished dialog."""
+        T = TRANSLATIONS[self.current_lang]
+        columns = ("stage", "time", "cpu", "items", "read", "written", "memory")
+        header = "".join(f"<th>{html.escape(T['stages_col_' + c])}</th>" for c in columns)
+        rows = []
+        for name, cells in stage_rows(stages):
+            label = html.escape(T.get("stage_" + name, name))
+            if name == "transcription":
+                label = "&nbsp;&nbsp;" + label  # part of the HTML stage
+            elif name == "total":
+                label = f"<b>{label}</b>"
+            rows.append(f"<tr><td>{label}</td>" + "".join(f'<td align="right">{c}</td>' for c in cells) + "</tr>")
+        return (f"<b>{html.escape(T['stages_title'])}</b>"
+                f'<table cellspacing="0" cellpadding="3"><tr>{header}</tr>{"".join(rows)}</table>')
+
+    @Slot(str, float, dict)
+    def on_finished(self, out_file_path, transcription_time, stages):
         T = TRANSLATIONS[self.current_lang]
         if self.spinner_timer.isActive():
             self.spinner_timer.stop()
@@ -796,9 +956,12 @@ class MainWindow(QWidget):
         self.progress_bar.setValue(self.progress_bar.maximum())
         if self.encrypt_checkbox.isChecked():
             msg = T["finish_msg_encrypt"].format(file=out_file_path, folder=f"{Path(out_file_path).stem}_media")
-            QMessageBox.information(self, T["finish_title"], msg)
         else:
-            QMessageBox.information(self, T["finish_title"], T["finish_msg"].format(file=out_file_path))
+            msg = T["finish_msg"].format(file=out_file_path)
+        box = QMessageBox(QMessageBox.Icon.Information, T["finish_title"], msg, QMessageBox.StandardButton.Ok, self)
+        if stages:
+            box.setInformativeText(self._stages_table(stages))
+        box.exec()
         if transcription_time > 0:
             self.status_label.setText(T["status_done_time"].format(time=transcription_time))
         else:
@@ -825,4 +988,6 @@ def main():
     app.setStyleSheet(LIGHT_STYLE)
     window = MainWindow(app)
     window.show()
+    # Once the window is up; Whisper and torch are not imported before that.
+    QTimer.singleShot(0, window._preload_model)
     sys.exit(app.exec())
@@ -1,4 +1,7 @@
 """HTML archive builder package."""
-from whatsapp_archive.html_builder.builder import build_html
+from whatsapp_archive.html_builder.assets import SharedAssets
+from whatsapp_archive.html_builder.builder import build_html, message_id
+from whatsapp_archive.html_builder.page_state import PageState
+from whatsapp_archive.html_builder.shards import SHARD_MODES, build_sharded_html
 
-__all__ = ["build_html"]
+__all__ = ["SHARD_MODES", "PageState", "SharedAssets", "build_html", "build_sharded_html", "message_id"]
@@ -0,0 +1,76 @@
+"""Shared static assets: the archive's CSS and JS as content-hashed files instead of inline.
+
+Archives built with shared assets link to
+
+    <assets folder>/archive.<hash>.css       HTML_CSS
+    <assets folder>/archive.<hash>.js        JS_FUNCTIONS and JS_WHISPER
+    <assets folder>/archive-<part>.<hash>.*  decryption, virtual rows, shard and index scripts
+
+loaded with `defer` from <head>, so the browser fetches them while the page parses and
+caches them for every archive pointing at the same folder. The hash is taken from the
+content: a file is written once, never changes, and an upgrade that changes the code
+writes new names next to the old ones. What differs per page (translations, participant
+colors, the key of an encrypted archive) stays inline, ahead of the deferred scripts.
+Assets are classic scripts: browsers refuse module scripts from file://.
+"""
+import hashlib
+import html
+import os
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from whatsapp_archive.html_builder.minify import minify_css, minify_js
+from whatsapp_archive.html_builder.precompress import Precompressor
+from whatsapp_archive.utils import temp_path
+
+HASH_LENGTH = 12
+
+
+class SharedAssets:
+    """Publishes assets into `folder` and links pages to them. With `minify`, assets are
+    minified before they are hashed; new or not, each one is handed to `compressor`."""
+
+    def __init__(self, folder: Path, minify: bool = False, compressor: Optional[Precompressor] = None):
+        self.folder = folder
+        self.minify = minify
+        self.compressor = compressor
+        self.published: dict[str, int] = {}  # file name -> size, every asset a page links to
+        self.bytes_written = 0  # assets this build created (others were already there)
+
+    def publish(self, name: str, content: str, ext: str) -> Path:
+        """Write <name>.<hash>.<ext> unless it exists, and return its path."""
+        if self.minify:
+            content = minify_css(content) if ext == "css" else minify_js(content)
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        path = self.folder / f"{name}.{digest}.{ext}"
+        if path.name not in self.published:
+            if not path.exists():
+                self.folder.mkdir(parents=True, exist_ok=True)
+                # Concurrent builds (see batch) may publish the same asset: one temporary name each.
+                part = temp_path(path, ".part")
+                try:
+                    part.write_bytes(data)
+                    os.replace(part, path)
+                finally:
+                    part.unlink(missing_ok=True)
+                self.bytes_written += len(data)
+            self.published[path.name] = len(data)
+            if self.compressor:
+                self.compressor.submit(path)
+        return path
+
+    def _href(self, path: Path, page: Path) -> str:
+        try:
+            href = quote(Path(os.path.relpath(path, page.parent)).as_posix())
+        except ValueError:  # another drive (Windows): no relative path
+            href = path.resolve().as_uri()
+        return html.escape(href)
+
+    def stylesheet(self, name: str, content: str, page: Path) -> str:
+        return f'<link rel="stylesheet" href="{self._href(self.publish(name, content, "css"), page)}">'
+
+    def script(self, name: str, content: str, page: Path) -> str:
+        # data-asset: kept in <head> by the page's pruned export (see exportHead).
+        return f'<script defer src="{self._href(self.publish(name, content, "js"), page)}" data-asset></script>'
@@ -4,7 +4,7 @@ import json
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional, TextIO
 
 _FRENCH_DAYS = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
 _FRENCH_MONTHS = [
@@ -17,31 +17,168 @@ def _format_french_date(dt: datetime) -> str:
     day_name = _FRENCH_DAYS[dt.weekday()]
     return f"{day_name} {dt.day} {_FRENCH_MONTHS[dt.month]} {dt.year}"
 
-from whatsapp_archive.config import AUDIO_EXTENSIONS, IMAGE_EXTENSIONS
-from whatsapp_archive.encryptor import encrypt_file
+
+def _image_attrs(src_attr: str, full_url: str, thumb: Optional[dict], thumb_url: Optional[str]) -> str:
+    """Source attributes for an <img>: the preview (if any) now, the full image on click."""
+    dims = f' width="{thumb["width"]}" height="{thumb["height"]}"' if thumb else ""
+    if thumb_url:
+        return f'{src_attr}="{html.escape(thumb_url)}" data-full="{html.escape(full_url)}"{dims}'
+    return f'{src_attr}="{html.escape(full_url)}"{dims}'
+
+from whatsapp_archive.config import AUDIO_EXTENSIONS, IMAGE_EXTENSIONS, VIDEO_EXTENSIONS
+from whatsapp_archive.html_builder.assets import SharedAssets
+from whatsapp_archive.html_builder.css import HTML_CSS
+from whatsapp_archive.html_builder.js import JS_DECRYPT, JS_FUNCTIONS, JS_SHARD, JS_VIRTUAL, JS_WHISPER
+from whatsapp_archive.html_builder.minify import MinifyingWriter
+from whatsapp_archive.html_builder.page_state import PageState
+from whatsapp_archive.html_builder.precompress import Precompressor, refresh_copies
+from whatsapp_archive.html_builder.search_index import SearchIndex
+from whatsapp_archive.html_builder.transcripts import sidecar_name, write_sidecar
 from whatsapp_archive.parser import (
-    MEDIA_FILENAME_RE,
     MEDIA_OMITTED_RE,
     UTC_TZ,
     get_media_path,
+    media_filename_match,
 )
 from whatsapp_archive.translations import TRANSLATIONS
 from whatsapp_archive.transcriber import transcribe_audio_file
+from whatsapp_archive.utils import temp_path
 
 if TYPE_CHECKING:
-    from whatsapp_archive.gui.worker import ChatWorker
+    from whatsapp_archive.pipeline import ArchivePipeline
+
+
+def _json_for_script(value) -> str:
+    """JSON that is safe inside a <script> element."""
+    return json.dumps(value, ensure_ascii=False).replace("</", "<\\/").replace("<!--", "<\\u0021--")
+
+
+def _css_string(text: str) -> str:
+    """`text` as a quoted CSS string that is safe inside a <style> element."""
+    escaped = text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\a ").replace("<", "\\3c ")
+    return f'"{escaped}"'
+
+
+def message_id(m: dict, index: int) -> str:
+    """Id of the message at `index` in the full sorted chat; pages key their state on it."""
+    return m["datetime_obj"].strftime('%Y%m%d%H%M%S') + f"-{index}"
+
+
+def _transcript_block(pre_id: str, msg_id: str, text: str, summary: str,
+                      transcripts: Optional[dict], edited: bool = False) -> str:
+    """Editable transcription; left empty for the page to fill from the sidecar if `transcripts` is set.
+    `edited` marks text taken from a page state, so the page exports it again."""
+    attrs = ' contenteditable="true"' + (" data-edited" if edited else "")
+    if transcripts is not None:
+        transcripts[msg_id] = text
+        return f'<details class="trans"><summary>{summary}</summary><pre id="{pre_id}"{attrs} data-lazy></pre></details>'
+    return (f'<details class="trans"><summary>{summary}</summary>'
+            f'<pre id="{pre_id}"{attrs}>{html.escape(text)}</pre></details>')
+
+
+def _legacy_markup_overhead(color_pair: Optional[dict], participant: Optional[str], number: int,
+                            note_placeholder_bytes: int, is_external: bool, has_transcript: bool) -> int:
+    """Estimate of the bytes a message used to spend on inline styles, handler attributes
+    and duplicated attributes, now carried by CSS classes and delegated listeners. Computed
+    from the attributes the old markup had, not measured against an old build."""
+    if color_pair is None and not is_external:
+        color_pair = {"light": "var(--bubble-light)", "dark": "var(--bubble-dark)", "border": "transparent"}
+    style = "" if is_external else (
+        f'--bubble-bg-light: {color_pair["light"]}; --bubble-bg-dark: {color_pair["dark"]}; '
+        f'--bubble-bg-vibrant: {color_pair["dark"]}; border-left-color: {color_pair["border"]};'
+    )
+    removed = (
+        len(f' style="{style}"'.encode("utf-8")) + len(f' data-original-number="{number}"')
+        + len(' style="margin-top:4px;"') + len(' style="flex:1"') + len(' onclick="cyclePriority(event)"')
+        + len(' data-placeholder=""') + note_placeholder_bytes
+        + len(' oninput="onNoteInput(this)" onpaste="onNotePaste(event)"') + len(' style="display:none"')
+        + (len(' style="font-style: italic;"') if is_external else 0)
+        + (len(' oninput="saveEdit(this)"') if has_transcript else 0)
+    )
+    added = len(' class="msg-main"') + (len(f" {participant}") if participant else 0)
+    return removed - added
+
+
+# Output is written through a buffer of this size, so memory stays flat however long the chat is.
+WRITE_BUFFER_SIZE = 1024 * 1024
 
 
 def build_html(messages, media_root: Path, out_html: Path, title: str,
-               model, worker: 'ChatWorker', transcribe_audio: bool,
+               model, worker: 'ArchivePipeline', transcribe_audio: bool,
                total_audio_files: int, encryption_key: str,
-               media_output_folder: Path, lang: str, media_lookup: dict):
+               media_output_folder: Path, lang: str, media_lookup: dict,
+               thumbnails: Optional[dict] = None, videos: Optional[dict] = None,
+               compact_audios: Optional[dict] = None, shard: Optional[dict] = None,
+               virtual: bool = False, transcript_sidecar: bool = False,
+               stats: Optional[dict] = None, state: Optional[PageState] = None,
+               assets: Optional[SharedAssets] = None, minify: bool = False,
+               compressor: Optional[Precompressor] = None):
+    """Write the archive to `out_html`, streaming each message as it is rendered.
+
+    The document goes to a temporary `.part` file that replaces `out_html` only once
+    it is complete; a stopped or failed build leaves any previous archive untouched.
+    `shard` is set when writing one page of a sharded archive (see html_builder.shards).
+    With `virtual`, messages are embedded as JSON and rendered near the viewport only.
+    With `transcript_sidecar`, transcriptions go to a separate script the page loads
+    when one is opened or searched (see html_builder.transcripts).
+    `stats`, if given, accumulates the bytes the compact message markup saved (for the
+    build report; regular pages only).
+    With `state` (see html_builder.page_state), selections, notes, priorities and
+    transcription edits are written into the page, which then ignores saved browser state.
+    Messages carrying an "archive_index" keep the id and number they have in the full chat,
+    so a pruned message list still matches the state.
+    With `assets` (see html_builder.assets), the stylesheet and scripts are linked from the
+    shared assets folder instead of inlined.
+    With `minify`, the page goes through html_builder.minify.MinifyingWriter. The page and
+    its sidecar are handed to `compressor` once written (see html_builder.precompress).
+    Returns True if the archive was written, False if the worker asked to stop.
+    """
+    part_path = temp_path(out_html, ".part")
+    transcripts = {} if transcript_sidecar else None
+    completed = False
+    try:
+        with open(part_path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+            out = MinifyingWriter(f) if minify else f
+            completed = _write_html(out, messages, media_root, out_html, title, model, worker,
+                                    transcribe_audio, total_audio_files, encryption_key,
+                                    media_output_folder, lang, media_lookup, thumbnails,
+                                    videos, compact_audios, shard, virtual, transcripts, stats, state,
+                                    assets)
+            if completed and minify:
+                out.finish()
+                worker.report.count("html", minified_bytes_saved=out.bytes_saved)
+        if completed and transcripts is not None:
+            sidecar = write_sidecar(out_html, transcripts, encryption_key)
+            worker.report.count("html", bytes_written=sidecar.stat().st_size)
+            refresh_copies(sidecar, compressor)
+    finally:
+        if completed:
+            os.replace(part_path, out_html)
+            worker.report.count("html", items=len(messages), bytes_written=out_html.stat().st_size)
+            refresh_copies(out_html, compressor)
+        part_path.unlink(missing_ok=True)
+    return completed
+
+
+def _write_html(out: TextIO, messages, media_root: Path, out_html: Path, title: str,
+                model, worker: 'ArchivePipeline', transcribe_audio: bool,
+                total_audio_files: int, encryption_key: str,
+                media_output_folder: Path, lang: str, media_lookup: dict,
+                thumbnails: Optional[dict], videos: Optional[dict],
+                compact_audios: Optional[dict], shard: Optional[dict], virtual: bool,
+                transcripts: Optional[dict], stats: Optional[dict],
+                state: Optional[PageState] = None, assets: Optional[SharedAssets] = None) -> bool:
+    """Render the document into `out`, collecting transcriptions into `transcripts` if it
+    is set. Returns False if the worker asked to stop."""
     html_t = TRANSLATIONS.get(lang, TRANSLATIONS["en"])
 
     cache_dir = media_root / "_transcriptions_cache"
+    # Encrypted archives seal the sidecar; its text must not reach the plain search data,
+    # so the page searches it once decrypted instead.
+    sealed_transcripts = transcripts is not None and bool(encryption_key)
 
-    from whatsapp_archive.html_builder.css import HTML_CSS
-    css = HTML_CSS
+    # With shared assets, only the rules that differ per page stay inline.
+    css = "" if assets else HTML_CSS
 
     # --- MODIFIED: JS updated to fix syntax errors and add new features ---
     js_constants = f'''
@@ -49,9 +186,12 @@ const HTML_STATES_SAVED = {json.dumps(html_t["html_states_saved"])};
 const HTML_STATES_RESET = {json.dumps(html_t["html_states_reset"])};
 const HTML_NOTES_SAVED = {json.dumps(html_t["html_notes_saved"])};
 const HTML_MESSAGE_DELETED = {json.dumps(html_t["html_message_deleted"])};
+const HTML_EXPORT_PROGRESS = {json.dumps(html_t["html_export_progress"])};
 const HTML_SHOW_MY_INTERVENTIONS = {json.dumps(html_t["html_show_my_interventions"])};
 const HTML_SHOW_ALL_MSGS = {json.dumps(html_t["html_show_all_msgs"])};
 const PRIORITIES = ["none", "red", "amber", "orange", "white"];
+const TRANSCRIPTS_SCRIPT = {json.dumps(sidecar_name(out_html) if transcripts is not None else None)};
+const TRANSCRIPTS_UNINDEXED = {json.dumps(sealed_transcripts)};
 const REPORT_TITLE = {json.dumps(html_t["html_report_title"])};
 const REPORT_SUBTITLE = {json.dumps(html_t["html_report_subtitle"])};
 const REPORT_DATE = {json.dumps(html_t["html_report_date"])};
@@ -71,667 +211,8 @@ const REPORT_PRIORITY_ORANGE = {json.dumps(html_t["html_report_priority_orange"]
 const REPORT_PRIORITY_WHITE = {json.dumps(html_t["html_report_priority_white"])};
 '''
 
-    js_functions = r'''
-const FILE_KEY = location.pathname.split('/').pop() || 'default';
-function storageKey(key) { return FILE_KEY + ':' + key; }
-function migrateKey(oldKey) {
-    var val = localStorage.getItem(storageKey(oldKey));
-    if (val) return val;
-    val = localStorage.getItem(oldKey);
-    if (val) { localStorage.setItem(storageKey(oldKey), val); }
-    return val;
-}
-
-let currentTheme='light';
-function setTheme(t){
- document.body.classList.remove('theme-dark','theme-light','theme-vibrant');
- document.body.classList.add('theme-'+t);currentTheme=t;
- document.querySelector('.toolbar select').value = t;
-}
-function rotateImage(id){
- const img=document.getElementById(id);
- const angle=parseInt(img.getAttribute('data-angle')||'0')+90;
- img.style.transform='rotate('+angle+'deg)';
- img.setAttribute('data-angle',angle);
-}
-function pauseAllOtherAudios(currentAudio){
- document.querySelectorAll('audio').forEach(function(a){
-  if(a!==currentAudio&&!a.paused){ a.pause(); }
- });
-}
-function escapeRegex(s){ return s.replace(/[.*+?^${}()|[\]\\]/g,'\\$&'); }
-function clearSearchHighlights(){
- document.querySelectorAll('.msg').forEach(m=>m.classList.remove('msg-highlight'));
- document.querySelectorAll('.content, .msg-deleted-placeholder, .trans pre').forEach(el=>{
-   el.querySelectorAll('mark.search-highlight').forEach(m=>m.replaceWith(document.createTextNode(m.textContent)));
- });
-}
-function applyTextHighlights(term){
- if (!term) return;
- const esc = escapeRegex(term);
- const re = new RegExp(esc,'gi');
- document.querySelectorAll('.msg').forEach(msg=>{
-   if (window.getComputedStyle(msg).display === 'none') return;
-   msg.querySelectorAll('.content, .msg-deleted-placeholder, .trans pre').forEach(el=>{
-     const raw = el.textContent;
-     const escaped = raw.replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');
-     el.innerHTML = escaped.replace(re,m=>'<mark class="search-highlight">'+m+'</mark>');
-   });
- });
-}
-var showOnlyInterventions = false;
-function msgHasIntervention(msg) {
- var note = msg.querySelector('.msg-note');
- var hasNote = note && note.innerText.trim().length > 0;
- var marker = msg.querySelector('.msg-priority-marker');
- var hasPriority = marker && (marker.dataset.priority || 'none') !== 'none';
- return hasNote || hasPriority;
-}
-function toggleInterventionsFilter() {
- showOnlyInterventions = !showOnlyInterventions;
- var btn = document.getElementById('btn-interventions');
- if (btn) {
-   btn.textContent = showOnlyInterventions ? HTML_SHOW_ALL_MSGS : HTML_SHOW_MY_INTERVENTIONS;
-   btn.classList.toggle('active', showOnlyInterventions);
- }
- filterMessages();
-}
-function filterMessages(){
- const input = document.getElementById('q').value.trim();
- const q = input.toLowerCase();
- const numMatch = input.match(/^(?:#|message|msg)?\s*(\d+)\s*$/i);
- const targetNum = numMatch ? parseInt(numMatch[1], 10) : null;
-
- clearSearchHighlights();
-
- if (targetNum !== null) {
-   document.querySelectorAll('.msg').forEach(c => { c.style.display = ''; });
-   updateMessageNumbers();
-   const targetMsg = document.querySelector('.msg[data-original-number="' + targetNum + '"]');
-   if (targetMsg) {
-     targetMsg.classList.add('msg-highlight');
-     requestAnimationFrame(function(){
-       requestAnimationFrame(function(){
-         targetMsg.scrollIntoView({ behavior: 'smooth', block: 'center', inline: 'nearest' });
-       });
-     });
-   }
-   return;
- }
- document.querySelectorAll('.msg').forEach(c=>{
-   const t=c.innerText.toLowerCase();
-   const showBySearch = !q || t.includes(q);
-   const showByInterventions = !showOnlyInterventions || msgHasIntervention(c);
-   c.style.display = (showBySearch && showByInterventions) ? '' : 'none';
- });
- updateMessageNumbers();
- if (q) applyTextHighlights(q);
-}
-function getAllCards(){return Array.from(document.querySelectorAll('.msg'));}
-function selectAll(){getAllCards().forEach(c=>{const cb=c.querySelector('.msg-body input[type="checkbox"]');if(cb)cb.checked=true;});}
-function clearAll(){getAllCards().forEach(c=>{const cb=c.querySelector('.msg-body input[type="checkbox"]');if(cb)cb.checked=false;});}
-function invertSel(){getAllCards().forEach(c=>{const cb=c.querySelector('.msg-body input[type="checkbox"]');if(cb)cb.checked=!cb.checked;});}
-function deleteSelected(){
-    getAllCards().filter(c=>{
-        const cb=c.querySelector('.msg-body input[type="checkbox"]');
-        return cb && cb.checked && !c.dataset.deleted;
-    }).forEach(c=>{
-        const num = c.getAttribute('data-original-number');
-        c.dataset.deleted = 'true';
-        c.classList.add('msg-deleted');
-        const body = c.querySelector('.msg-body');
-        const ph = c.querySelector('.msg-deleted-placeholder');
-        if (body) body.style.display = 'none';
-        if (ph) {
-            ph.textContent = HTML_MESSAGE_DELETED.replace('{num}', num);
-            ph.style.display = 'block';
-            ph.removeAttribute('aria-hidden');
-        }
-    });
-    saveDeletedStates();
-    updateMessageNumbers();
-}
-function downloadHTML(){
- // 1. Ensure badge text is permanent number; bake priorities
- updateMessageNumbers();
- document.querySelectorAll('.msg').forEach(msg => {
-    const marker = msg.querySelector('.msg-priority-marker');
-    if (marker) marker.setAttribute('data-priority', marker.dataset.priority || 'none');
- });
-
- // 2. Snapshot note HTML so they survive cloneNode
- const noteSnapshots = {};
- document.querySelectorAll('.msg-note').forEach(el => {
-     noteSnapshots[el.id] = el.innerText.trim() ? sanitizeNoteHtml(el.innerHTML) : '';
- });
-
- // 3. Clone the document
- const clonedDoc = document.cloneNode(true);
-
- // 4. Bake note HTML into the clone
- clonedDoc.querySelectorAll('.msg-note').forEach(el => {
-     const val = noteSnapshots[el.id] || '';
-     el.innerHTML = val;
-     el.setAttribute('data-baked', 'true');
-     if (val.trim()) {
-         el.classList.add('has-content');
-         el.classList.remove('empty');
-     } else {
-         el.classList.remove('has-content');
-         el.classList.add('empty');
-     }
-     el.removeAttribute('oninput');
-     el.removeAttribute('onpaste');
- });
-
- // 5. Bake checkbox states into the HTML (keep them, don't remove)
- clonedDoc.querySelectorAll('.msg input[type="checkbox"]').forEach(cb => {
-   if (cb.checked) {
-     cb.setAttribute('checked', 'checked');
-   } else {
-     cb.removeAttribute('checked');
-   }
- });
-
- // 6. Bake transcription edits from live DOM into the clone
- document.querySelectorAll('pre[contenteditable="true"][id^="transcription-pre-"]').forEach(srcPre => {
-   const clonedPre = clonedDoc.getElementById(srcPre.id);
-   if (clonedPre) {
-     clonedPre.textContent = srcPre.innerText;
-   }
- });
-
- // 7. Mark the file as "baked" so loaded copies skip localStorage
- const bakedMeta = clonedDoc.createElement('meta');
- bakedMeta.setAttribute('name', 'baked-state');
- bakedMeta.setAttribute('content', 'true');
- clonedDoc.querySelector('head').appendChild(bakedMeta);
-
- // 8. Clean interactive-only buttons from the clone
- clonedDoc.querySelectorAll('.msg-priority-marker').forEach(el => el.removeAttribute('onclick'));
-const buttonsToRemove = [
-   "selectAll()",
-   "clearAll()",
-   "invertSel()",
-   "deleteSelected()",
-   "toggleInterventionsFilter()",
-   "downloadHTML()",
-   "saveCheckboxStates()",
-   "resetCheckboxStates()",
-   "downloadReportPDF()",
-   "downloadReportWord()"
-];
- clonedDoc.querySelectorAll('.toolbar button').forEach(btn => {
-   const onclick = btn.getAttribute('onclick');
-   if (buttonsToRemove.includes(onclick)) {
-     btn.remove();
-   }
- });
-
- // 9. Set badge text to permanent number in clone
- clonedDoc.querySelectorAll('.msg').forEach(msg => {
-    const numBadge = msg.querySelector('.msg-number');
-    const num = msg.getAttribute('data-original-number');
-    if (numBadge && num) {
-        numBadge.textContent = num;
-        numBadge.style.display = 'flex';
-    }
- });
-
- const doctype='<!doctype html>';
- const html=clonedDoc.documentElement.outerHTML;
- const blob=new Blob([doctype+'\n'+html],{type:'text/html'});
- const a=document.createElement('a');
- a.href=URL.createObjectURL(blob);
- const ts=new Date().toISOString().replace(/[:.]/g,'-');
- a.download='chat_exported_'+ts+'.html';document.body.appendChild(a);a.click();a.remove();
-}
-function saveEdit(element) {
-  if (element.id && window.localStorage) {
-    try {
-      localStorage.setItem(storageKey(element.id), element.innerText);
-    } catch (e) {
-      console.error("LocalStorage save failed:", e);
-    }
-  }
-}
-function loadEdits() {
-  if (!window.localStorage) return;
-  const pres = document.querySelectorAll('pre[contenteditable="true"][id^="transcription-pre-"]');
-  pres.forEach(pre => {
-    var savedText = localStorage.getItem(storageKey(pre.id));
-    if (savedText === null) {
-      savedText = localStorage.getItem(pre.id);
-      if (savedText !== null) { localStorage.setItem(storageKey(pre.id), savedText); }
-    }
-    if (savedText !== null) {
-      pre.innerText = savedText;
-    }
-  });
-}
-
-/* --- Checkbox Persistence --- */
-function saveCheckboxStates() {
-    try {
-        const states = {};
-        document.querySelectorAll('.msg input[type="checkbox"]').forEach(cb => {
-            if(cb.id) { states[cb.id] = cb.checked; }
-        });
-        localStorage.setItem(storageKey('checkboxStates'), JSON.stringify(states));
-        alert(HTML_STATES_SAVED);
-    } catch (e) {
-        console.error("Failed to save checkbox states:", e);
-        alert("Error saving states. Browser storage might be full or disabled.");
-    }
-}
-function loadCheckboxStates() {
-    try {
-        const states = JSON.parse(migrateKey('checkboxStates') || '{}');
-        Object.keys(states).forEach(id => {
-            const cb = document.getElementById(id);
-            if (cb) { cb.checked = states[id]; }
-        });
-    } catch (e) {
-        console.error("Failed to load checkbox states:", e);
-    }
-}
-function resetCheckboxStates() {
-    localStorage.removeItem(storageKey('checkboxStates'));
-    document.querySelectorAll('.msg input[type="checkbox"]').forEach(cb => {
-        cb.checked = false;
-    });
-    alert(HTML_STATES_RESET);
-}
-/* --- End Checkbox Persistence --- */
-
-/* --- Notes Logic (rich-text: contenteditable, preserves lists/indent) --- */
-var ALLOWED_NOTE_TAGS = {'P':1,'BR':1,'DIV':1,'SPAN':1,'UL':1,'OL':1,'LI':1,'STRONG':1,'EM':1,'B':1,'I':1,'U':1,'SUB':1,'SUP':1};
-function sanitizeNoteHtml(html) {
-    if (!html || !html.trim()) return '';
-    var doc = document.implementation.createHTMLDocument('');
-    var root = doc.body;
-    root.innerHTML = html;
-    function go(node) {
-        if (node.nodeType === 3) return node.cloneNode(true);
-        if (node.nodeType !== 1) return null;
-        var tag = node.tagName.toUpperCase();
-        if (!ALLOWED_NOTE_TAGS[tag]) return null;
-        var out = doc.createElement(tag);
-        var an = node.attributes;
-        for (var i = 0; i < an.length; i++) {
-            var n = an[i].name.toLowerCase(), v = an[i].value;
-            if ((n === 'style' || n === 'class') && (tag === 'P' || tag === 'DIV' || tag === 'SPAN' || tag === 'LI')) out.setAttribute(n, v);
-        }
-        for (var j = 0; j < node.childNodes.length; j++) {
-            var c = go(node.childNodes[j]);
-            if (c) out.appendChild(c);
-        }
-        return out;
-    }
-    var wrap = doc.createElement('div');
-    for (var k = 0; k < root.childNodes.length; k++) {
-        var c = go(root.childNodes[k]);
-        if (c) wrap.appendChild(c);
-    }
-    return wrap.innerHTML;
-}
-function onNotePaste(ev) {
-    var html = ev.clipboardData && ev.clipboardData.getData('text/html');
-    var text = ev.clipboardData && ev.clipboardData.getData('text/plain');
-    if (html && html.trim()) {
-        ev.preventDefault();
-        var clean = sanitizeNoteHtml(html);
-        if (clean) document.execCommand('insertHTML', false, clean);
-    } else if (text) {
-        ev.preventDefault();
-        document.execCommand('insertText', false, text);
-    }
-}
-function onNoteInput(el) {
-    var has = el.innerText.trim().length > 0;
-    if (!has) { el.innerHTML = ''; el.classList.add('empty'); } else { el.classList.remove('empty'); }
-    el.classList.toggle('has-content', has);
-    saveNotes();
-}
-function saveNotes() {
-    try {
-        const notes = {};
-        document.querySelectorAll('.msg-note').forEach(el => {
-            if (el.id && el.innerText.trim()) { notes[el.id] = sanitizeNoteHtml(el.innerHTML); }
-        });
-        localStorage.setItem(storageKey('msgNotes'), JSON.stringify(notes));
-    } catch (e) {
-        console.error("Failed to save notes:", e);
-    }
-}
-function loadNotes() {
-    try {
-        document.querySelectorAll('.msg-note[data-baked="true"]').forEach(el => {
-            el.removeAttribute('data-baked');
-            var has = el.innerText.trim().length > 0;
-            if (!has) { el.innerHTML = ''; el.classList.add('empty'); } else { el.classList.remove('empty'); }
-            el.classList.toggle('has-content', has);
-        });
-        const notes = JSON.parse(migrateKey('msgNotes') || '{}');
-        Object.keys(notes).forEach(id => {
-            const el = document.getElementById(id);
-            if (el && !el.innerText.trim()) {
-                el.innerHTML = sanitizeNoteHtml(notes[id]);
-                el.classList.remove('empty');
-                el.classList.toggle('has-content', el.innerText.trim().length > 0);
-            }
-        });
-    } catch (e) {
-        console.error("Failed to load notes:", e);
-    }
-}
-/* --- End Notes Logic --- */
-
-/* --- NEW: Priority Logic --- */
-function cyclePriority(event) {
-    event.stopPropagation();
-    const marker = event.currentTarget;
-    const currentPriority = marker.dataset.priority || 'none';
-    const currentIndex = PRIORITIES.indexOf(currentPriority);
-    const nextIndex = (currentIndex + 1) % PRIORITIES.length;
-    marker.dataset.priority = PRIORITIES[nextIndex];
-    savePriorities(); // Save to localStorage on change
-}
-function savePriorities() {
-    try {
-        const priorities = {};
-        document.querySelectorAll('.msg[data-msg-id]').forEach(msg => {
-            const id = msg.dataset.msgId;
-            const priority = msg.querySelector('.msg-priority-marker').dataset.priority;
-            priorities[id] = priority;
-        });
-        localStorage.setItem(storageKey('msgPriorities'), JSON.stringify(priorities));
-    } catch (e) {
-        console.error("Failed to save priorities:", e);
-    }
-}
-function loadPriorities() {
-    try {
-        const priorities = JSON.parse(migrateKey('msgPriorities') || '{}');
-        Object.keys(priorities).forEach(id => {
-            const msg = document.querySelector(`.msg[data-msg-id="${id}"]`);
-            if (msg) {
-                const marker = msg.querySelector('.msg-priority-marker');
-                if (marker) {
-                    marker.dataset.priority = priorities[id] || 'none';
-                }
-            }
-        });
-    } catch (e) {
-        console.error("Failed to load priorities:", e);
-    }
-}
-/* --- End Priority Logic --- */
-
-/* --- Interventions Report (PDF / Word) --- */
-function reportPriorityLabel(p) {
-    if (p === 'red') return REPORT_PRIORITY_RED;
-    if (p === 'amber') return REPORT_PRIORITY_AMBER;
-    if (p === 'orange') return REPORT_PRIORITY_ORANGE;
-    if (p === 'white') return REPORT_PRIORITY_WHITE;
-    return '';
-}
-function getReportEntries() {
-    const entries = [];
-    document.querySelectorAll('.msg').forEach(function(msg) {
-        if (!msgHasIntervention(msg)) return;
-        var num = msg.getAttribute('data-original-number') || '';
-        var metaEl = msg.querySelector('.meta');
-        var metaText = metaEl ? metaEl.innerText.trim() : '';
-        var nameEl = metaEl ? metaEl.querySelector('.name') : null;
-        var name = nameEl ? nameEl.innerText.trim() : '';
-        var noteEl = msg.querySelector('.msg-note');
-        var note = noteEl && noteEl.innerText.trim() ? noteEl.innerText.trim() : '';
-        var marker = msg.querySelector('.msg-priority-marker');
-        var priority = marker ? (marker.dataset.priority || 'none') : 'none';
-        var isDeleted = msg.dataset.deleted === 'true';
-        var content = '';
-        var transcription = '';
-        if (isDeleted) {
-            content = REPORT_MESSAGE_HIDDEN;
-        } else {
-            var contentEl = msg.querySelector('.content');
-            if (contentEl) content = contentEl.innerText.trim();
-            var transPre = msg.querySelector('.trans pre') || msg.querySelector('.attach pre[id^="transcription-pre-"]') || msg.querySelector('pre[id^="transcription-pre-"]');
-            if (transPre) transcription = transPre.textContent.trim();
-        }
-        entries.push({ metaText: metaText, num: num, name: name, note: note, priority: priority, content: content, transcription: transcription, isDeleted: isDeleted });
-    });
-    entries.sort(function(a, b) { return parseInt(a.num, 10) - parseInt(b.num, 10); });
-    return entries;
-}
-function loadScript(src) {
-    return new Promise(function(resolve, reject) {
-        var s = document.createElement('script');
-        s.src = src;
-        s.onload = resolve;
-        s.onerror = reject;
-        document.head.appendChild(s);
-    });
-}
-function downloadReportPDF() {
-    var entries = getReportEntries();
-    if (!entries.length) { alert(REPORT_NO_INTERVENTIONS); return; }
-    var title = document.querySelector('.header h1') ? document.querySelector('.header h1').textContent : (document.title || 'Archive');
-    var genDate = new Date().toLocaleString();
-    loadScript('https://cdnjs.cloudflare.com/ajax/libs/jspdf/2.5.1/jspdf.umd.min.js').then(function() {
-        var jsPDF = window.jspdf.jsPDF;
-        var doc = new jsPDF();
-        var margin = 18;
-        var marginBottom = 22;
-        var lineHeight = 5.5;
-        var sectionGap = 4;
-        var pageHeight = doc.internal.pageSize.height;
-        var maxWidth = doc.internal.pageSize.width - margin * 2;
-        doc.setFontSize(18);
-        doc.setFont(undefined, 'bold');
-        doc.text(REPORT_TITLE, margin, 22);
-        doc.setFont(undefined, 'normal');
-        doc.setFontSize(10);
-        doc.text(REPORT_SUBTITLE.replace('{title}', title).replace('{date}', genDate), margin, 30);
-        var y = 40;
-        entries.forEach(function(entry, idx) {
-            if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
-            if (idx > 0) { y += sectionGap; }
-            doc.setFont(undefined, 'bold');
-            doc.setFontSize(11);
-            var metaLine = entry.metaText + '   ·   ' + REPORT_MSG_NUM + ' ' + entry.num;
-            var metaLines = doc.splitTextToSize(metaLine, maxWidth);
-            metaLines.forEach(function(line) {
-                if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
-                doc.text(line, margin, y);
-                y += lineHeight;
-            });
-            doc.setFont(undefined, 'normal');
-            doc.setFontSize(10);
-            y += 2;
-            if (entry.note) {
-                var noteLines = doc.splitTextToSize(REPORT_NOTE + ': ' + entry.note, maxWidth);
-                noteLines.forEach(function(line) {
-                    if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
-                    doc.text(line, margin, y);
-                    y += lineHeight;
-                });
-                y += 2;
-            }
-            if (entry.priority !== 'none') {
-                doc.text(REPORT_PRIORITY + ': ' + reportPriorityLabel(entry.priority), margin, y);
-                y += lineHeight + 2;
-            }
-            var contentBlock = '';
-            if (entry.isDeleted) {
-                contentBlock = REPORT_CONTENT + ':\n' + REPORT_MESSAGE_HIDDEN;
-            } else {
-                contentBlock = REPORT_CONTENT + ':';
-                if (entry.content) contentBlock += '\n' + entry.content + (entry.transcription ? ':' : '');
-                if (entry.transcription) contentBlock += '\n' + REPORT_TRANSCRIPTION + ':\n' + entry.transcription;
-                if (!entry.content && !entry.transcription) contentBlock += '\n';
-            }
-            if (contentBlock) {
-                var contentLines = doc.splitTextToSize(contentBlock, maxWidth);
-                contentLines.forEach(function(line) {
-                    if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
-                    doc.text(line, margin, y);
-                    y += lineHeight;
-                });
-            }
-            y += sectionGap;
-        });
-        if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
-        y += 4;
-        doc.setFontSize(8);
-        doc.setTextColor(100, 100, 100);
-        var footer = REPORT_FOOTER.replace('{date}', genDate);
-        var footerLines = doc.splitTextToSize(footer, maxWidth);
-        footerLines.forEach(function(line) {
-            if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
-            doc.text(line, margin, y);
-            y += lineHeight;
-        });
-        doc.setTextColor(0, 0, 0);
-        doc.save('rapport_interventions_' + new Date().toISOString().slice(0, 10) + '.pdf');
-    }).catch(function(e) { alert('PDF export failed: ' + (e && e.message ? e.message : e)); });
-}
-function downloadReportWord() {
-    var entries = getReportEntries();
-    if (!entries.length) { alert(REPORT_NO_INTERVENTIONS); return; }
-    var title = document.querySelector('.header h1') ? document.querySelector('.header h1').textContent : (document.title || 'Archive');
-    var genDate = new Date().toLocaleString();
-    var escapeHtml = function(s) {
-        if (!s) return '';
-        return String(s).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
-    };
-    var nl2br = function(s) { return escapeHtml(s).replace(/\n/g, '<br>'); };
-    var style = 'body{font-family:Segoe UI,Calibri,Arial,sans-serif;font-size:11pt;line-height:1.4;margin:1in;color:#222;}';
-    style += 'h1{font-size:18pt;margin-bottom:6px;color:#1a1a1a;}';
-    style += '.subtitle{font-size:10pt;color:#555;margin-bottom:24px;}';
-    style += '.entry{margin-bottom:28px;padding-bottom:20px;border-bottom:1px solid #ddd;}';
-    style += '.meta{font-size:11pt;font-weight:bold;margin-bottom:8px;color:#333;}';
-    style += '.field{margin:6px 0;font-size:10.5pt;}';
-    style += '.field-label{font-style:italic;color:#444;}';
-    style += '.content-block{margin-top:8px;padding:10px 0;white-space:pre-wrap;}';
-    style += '.footer{font-size:9pt;color:#777;margin-top:32px;padding-top:16px;border-top:1px solid #eee;}';
-    var blocks = [];
-    blocks.push('<html xmlns:o="urn:schemas-microsoft-com:office:office" xmlns:w="urn:schemas-microsoft-com:office:word"><head><meta charset="utf-8"><title>' + escapeHtml(REPORT_TITLE) + '</title><style>' + style + '</style></head><body>');
-    blocks.push('<h1>' + escapeHtml(REPORT_TITLE) + '</h1>');
-    blocks.push('<p class="subtitle">' + escapeHtml(REPORT_SUBTITLE.replace('{title}', title).replace('{date}', genDate)) + '</p>');
-    entries.forEach(function(entry) {
-        blocks.push('<div class="entry">');
-        blocks.push('<p class="meta">' + escapeHtml(entry.metaText) + ' &nbsp; ' + REPORT_MSG_NUM + ' ' + escapeHtml(entry.num) + '</p>');
-        if (entry.note) blocks.push('<p class="field"><span class="field-label">' + REPORT_NOTE + ':</span> ' + nl2br(entry.note) + '</p>');
-        if (entry.priority !== 'none') blocks.push('<p class="field"><span class="field-label">' + REPORT_PRIORITY + ':</span> ' + escapeHtml(reportPriorityLabel(entry.priority)) + '</p>');
-        blocks.push('<p class="field"><span class="field-label">' + REPORT_CONTENT + ':</span></p>');
-        if (entry.isDeleted) {
-            blocks.push('<p class="content-block">' + escapeHtml(REPORT_MESSAGE_HIDDEN) + '</p>');
-        } else {
-            if (entry.content) blocks.push('<p class="content-block">' + nl2br(entry.content) + (entry.transcription ? ':' : '') + '</p>');
-            if (entry.transcription) blocks.push('<p class="field"><span class="field-label">' + REPORT_TRANSCRIPTION + ':</span></p><p class="content-block">' + nl2br(entry.transcription) + '</p>');
-        }
-        blocks.push('</div>');
-    });
-    blocks.push('<p class="footer">' + escapeHtml(REPORT_FOOTER.replace('{date}', genDate)) + '</p>');
-    blocks.push('</body></html>');
-    var html = blocks.join('');
-    var blob = new Blob(['\ufeff' + html], { type: 'application/msword' });
-    var blobUrl = URL.createObjectURL(blob);
-    var a = document.createElement('a');
-    a.href = blobUrl;
-    a.download = 'rapport_interventions_' + new Date().toISOString().slice(0, 10) + '.doc';
-    document.body.appendChild(a);
-    a.click();
-    a.remove();
-    URL.revokeObjectURL(blobUrl);
-}
-/* --- End Interventions Report --- */
-
-/* --- Permanent numbering: badge shows data-original-number, visibility follows filter --- */
-function updateMessageNumbers() {
-    document.querySelectorAll('.msg').forEach(msg => {
-        const numBadge = msg.querySelector('.msg-number');
-        if (!numBadge) return;
-        const num = msg.getAttribute('data-original-number');
-        numBadge.textContent = num || '';
-        numBadge.setAttribute('data-original-number', num || '');
-        if (msg.dataset.deleted === 'true') {
-            numBadge.style.display = 'flex';
-        } else {
-            numBadge.style.display = (window.getComputedStyle(msg).display !== 'none') ? 'flex' : 'none';
-        }
-    });
-}
-/* --- End Numbering Logic --- */
-
-/* --- Deleted state persistence --- */
-function saveDeletedStates() {
-    try {
-        const ids = [];
-        document.querySelectorAll('.msg[data-deleted="true"]').forEach(msg => {
-            if (msg.dataset.msgId) ids.push(msg.dataset.msgId);
-        });
-        localStorage.setItem(storageKey('msgDeletedIds'), JSON.stringify(ids));
-    } catch (e) { console.error("Failed to save deleted states:", e); }
-}
-function loadDeletedStates() {
-    try {
-        const ids = JSON.parse(migrateKey('msgDeletedIds') || '[]');
-        ids.forEach(id => {
-            const msg = document.querySelector('.msg[data-msg-id="' + id + '"]');
-            if (msg && !msg.dataset.deleted) {
-                const num = msg.getAttribute('data-original-number');
-                msg.dataset.deleted = 'true';
-                msg.classList.add('msg-deleted');
-                const body = msg.querySelector('.msg-body');
-                const ph = msg.querySelector('.msg-deleted-placeholder');
-                if (body) body.style.display = 'none';
-                if (ph) {
-                    ph.textContent = HTML_MESSAGE_DELETED.replace('{num}', num);
-                    ph.style.display = 'block';
-                    ph.removeAttribute('aria-hidden');
-                }
-            }
-        });
-    } catch (e) { console.error("Failed to load deleted states:", e); }
-}
-/* --- End Deleted state --- */
-
-document.addEventListener('DOMContentLoaded', () => {
-    document.addEventListener('play', function(ev) {
-        if (ev.target.tagName === 'AUDIO') { pauseAllOtherAudios(ev.target); }
-    }, true);
-
-    const isBaked = !!document.querySelector('meta[name="baked-state"][content="true"]');
-
-    if (!isBaked) {
-        loadEdits();
-        loadCheckboxStates();
-        loadPriorities();
-        loadDeletedStates();
-    }
-    loadNotes();
-    updateMessageNumbers();
-
-    try {
-        if (window.matchMedia && window.matchMedia('(prefers-color-scheme: dark)').matches) {
-            setTheme('dark');
-        } else {
-            setTheme('light');
-        }
-
-        window.matchMedia('(prefers-color-scheme: dark)').addEventListener('change', e => {
-            setTheme(e.matches ? 'dark' : 'light');
-        });
-    } catch (e) {
-        console.error("Error setting preferred color scheme:", e);
-    }
-});
-'''
     # Combine the constants and functions into the final JS block
-    js = js_constants + js_functions
+    js = js_constants + JS_FUNCTIONS
     # --- END JS MODIFICATION ---
 
     # --- MODIFIED: Fixed JS f-string interpolation bug with QUADRUPLE braces ---
@@ -739,137 +220,17 @@ document.addEventListener('DOMContentLoaded', () => {
     js_whisper_constants = f'''
 const HTML_SHOW_TRANSCRIPTION = {json.dumps(html_t["html_show_transcription"])};
 '''
-    js_whisper_functions = r'''
-// In-browser transcription pipeline
-let pipelinePromise = null;
-const modelName = 'Xenova/whisper-tiny';
-const modelRevision = 'v4.0.0-compat';
-
-async function initWhisperTranscription(button, audioSrc) {
-    try {
-        button.disabled = true;
-        button.textContent = 'Loading model (one-time download)...';
-        if (!pipelinePromise) {
-            const { pipeline } = await import('https://cdn.jsdelivr.net/npm/@xenova/transformers@2.17.1');
-            pipelinePromise = pipeline('automatic-speech-recognition', modelName, {
-                revision: modelRevision,
-                progress_callback: (progress) => {
-                    const firstButton = document.querySelector('.transcribe-btn[disabled]');
-                    if (firstButton) {
-                        firstButton.textContent = `Loading model... ${progress.status} (${Math.round(progress.progress)}%)`;
-                    }
-                }
-            });
-        }
-        const recognizer = await pipelinePromise;
-        button.textContent = 'Processing audio...';
-        const output = await recognizer(audioSrc, {
-            chunk_length_s: 30,
-            stride_length_s: 5
-        });
-        const text = output.text ? output.text.trim() : '(No speech detected)';
-        const details = document.createElement('details');
-        details.className = 'trans';
-        details.open = true;
-        const summary = document.createElement('summary');
-        summary.textContent = HTML_SHOW_TRANSCRIPTION;
-        const pre = document.createElement('pre');
-        pre.contentEditable = 'true';
-        const placeholderId = button.parentElement.id;
-        const preId = placeholderId.replace('transcribe-placeholder-', 'transcription-pre-');
-        pre.id = preId;
-        pre.setAttribute('oninput', 'saveEdit(this)');
-        pre.textContent = text;
-        details.appendChild(summary);
-        details.appendChild(pre);
-        button.parentElement.replaceWith(details);
-    } catch (error) {
-        console.error('Transcription failed:', error);
-        button.textContent = 'Transcription Failed (Check console/internet)';
-        button.disabled = false;
-    }
-}
-'''
-    js_whisper = js_whisper_constants + js_whisper_functions
+    js_whisper = js_whisper_constants + JS_WHISPER
     # --- END JS_WHISPER MODIFICATION ---
 
-    js_decrypt = ""
-    if encryption_key:
-        js_decrypt = r'''
-/* --- DECRYPTION LOGIC --- */
-(async function() {
-    if (!window.ENC_KEY) {
-        console.log("No encryption key found.");
-        return;
-    }
-
-    const hexToBytes = (hex) => {
-        const bytes = new Uint8Array(hex.length / 2);
-        for (let c = 0; c < hex.length; c += 2) {
-            bytes[c / 2] = parseInt(hex.substr(c, 2), 16);
-        }
-        return bytes;
-    };
-
-    let cryptoKey;
-    try {
-        const keyBytes = hexToBytes(window.ENC_KEY);
-        cryptoKey = await window.crypto.subtle.importKey(
-            "raw", keyBytes, "AES-GCM", true, ["decrypt"]
-        );
-    } catch (e) {
-        console.error("Failed to import encryption key:", e);
-        return;
-    }
-
-    const elementsToDecrypt = document.querySelectorAll('[data-src-encrypted]');
-
-    async function decryptMedia(element, url) {
-        try {
-            const response = await fetch(url);
-            if (!response.ok) {
-                throw new Error(`Failed to fetch: ${url}`);
-            }
-            const encryptedData = await response.arrayBuffer();
-
-            const nonce = encryptedData.slice(0, 16);
-            const tag = encryptedData.slice(16, 32);
-            const ciphertext = encryptedData.slice(32);
-
-            const combinedData = new Uint8Array(ciphertext.byteLength + tag.byteLength);
-            combinedData.set(new Uint8Array(ciphertext), 0);
-            combinedData.set(new Uint8Array(tag), ciphertext.byteLength);
-
-            const decryptedData = await window.crypto.subtle.decrypt(
-                { name: "AES-GCM", iv: nonce },
-                cryptoKey,
-                combinedData
-            );
-
-            const blob = new Blob([decryptedData]);
-            const objectURL = URL.createObjectURL(blob);
-            element.src = objectURL;
-            element.style.opacity = 1;
-            element.style.border = 'none';
-            element.removeAttribute('data-src-encrypted'); 
-
-        } catch (e) {
-            console.error("Failed to decrypt:", url, e);
-            if (element.tagName === 'IMG') {
-                element.alt = "Decryption Failed";
-            }
-        }
-    }
-
-    for (const el of elementsToDecrypt) {
-        decryptMedia(el, el.dataset.srcEncrypted);
-    }
-})();
-'''
+    js_decrypt = JS_DECRYPT if encryption_key else ""
 
     # --- MODIFIED: Use light/dark pairs for the two user colors ---
     unique_names_list = sorted(
         list({m.get("name") for m in messages if m.get("name") and m.get("name") != "External RECORDED Audio"}))
+    if shard:
+        # Same colors on every page of a sharded archive.
+        unique_names_list = shard["participants"]
 
     # Define light and dark pairs for the two users
     color_palette = [
@@ -884,16 +245,110 @@ async function initWhisperTranscription(button, audioSrc) {
     colors["External RECORDED Audio"] = {'light': '', 'dark': '', 'border': ''}
     # --- END MODIFICATION ---
 
-    blocks = []
-    audio_file_counter = 0
-    total_messages = len(messages)
+    # One class per participant instead of the same custom properties on every message.
+    participant_classes = {name: f"p{i}" for i, name in enumerate(unique_names_list)}
+    css += "".join(
+        f'\n.{participant_classes[name]}{{--bubble-bg-light:{colors[name]["light"]};'
+        f'--bubble-bg-dark:{colors[name]["dark"]};--bubble-bg-vibrant:{colors[name]["dark"]};'
+        f'border-left-color:{colors[name]["border"]}}}'
+        for name in unique_names_list
+    )
+    css += f"\n.container{{--note-placeholder:{_css_string(html_t['html_note_placeholder'])}}}"
+
+    key_script = f"<script>window.ENC_KEY = '{encryption_key}';</script>" if encryption_key else ""
+    decrypt_script = f"<script>{js_decrypt}</script>" if encryption_key else ""
 
-    for i, m in enumerate(messages):
+    virtual_script = f"\n<script>\n{JS_VIRTUAL}\n</script>" if virtual else ""
+    # Saved browser state is not applied over the state written into the page; unlike a
+    # pruned export (baked-state), the page stays editable.
+    baked_meta = '\n<meta name="ignore-saved-state" content="true">' if state else ""
+
+    shard_nav = shard_results = shard_constants = ""
+    if shard:
+        nav = [f'<a href="{html.escape(shard["index"])}">{html_t["html_shard_index"]}</a>']
+        if shard["prev"]:
+            nav.append(f'<a href="{html.escape(shard["prev"])}" rel="prev">{html_t["html_shard_prev"]}</a>')
+        nav.append(f'<span class="shard-label">{html.escape(shard["label"])}</span>')
+        if shard["next"]:
+            nav.append(f'<a href="{html.escape(shard["next"])}" rel="next">{html_t["html_shard_next"]}</a>')
+        shard_nav = f'\n<div class="shard-nav">{" ".join(nav)}</div>'
+        shard_results = '\n<div id="shard-results" class="shard-results" hidden></div>'
+        shard_constants = f'''
+const SEARCH_SCRIPT = {json.dumps(shard["search_script"])};
+const HTML_SHARD_OTHER_PAGES = {json.dumps(html_t["html_shard_other_pages"])};
+'''
+
+    if assets:
+        # Deferred: they run in this order once the page is parsed, after the inline constants.
+        head_assets = [assets.stylesheet("archive", HTML_CSS, out_html),
+                       assets.script("archive", JS_FUNCTIONS + JS_WHISPER, out_html)]
+        if encryption_key:
+            head_assets.append(assets.script("archive-decrypt", JS_DECRYPT, out_html))
+        if virtual:
+            head_assets.append(assets.script("archive-virtual", JS_VIRTUAL, out_html))
+        if shard:
+            head_assets.append(assets.script("archive-shard", JS_SHARD, out_html))
+        head_assets_html = "\n" + "\n".join(head_assets) + "\n"
+        scripts = f"{key_script}\n<script>{js_constants}{js_whisper_constants}{shard_constants}</script>"
+    else:
+        head_assets_html = ""
+        shard_script = f"\n<script>{shard_constants}{JS_SHARD}\n</script>" if shard else ""
+        scripts = f'''{key_script}
+<script>
+{js}
+</script>
+<script type="module">
+{js_whisper}
+</script>
+{decrypt_script}{virtual_script}{shard_script}'''
+
+    # --- MODIFIED: Added Save States and Reset States buttons to toolbar ---
+    out.write(f'''<!doctype html><html lang="en"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">{baked_meta}
+<title>{html.escape(title)}</title>{head_assets_html}<style>{css}</style></head>
+<body class="theme-light"><div class="sticky-top">
+<div class="header"><h1>{html.escape(title)}</h1></div>{shard_nav}
+<div class="toolbar">
+<button onclick="selectAll()">{html_t["html_select_all"]}</button>
+<button onclick="clearAll()">{html_t["html_clear"]}</button>
+<button onclick="invertSel()">{html_t["html_invert"]}</button>
+<button onclick="deleteSelected()">{html_t["html_delete_selected"]}</button>
+<button onclick="toggleInterventionsFilter()" id="btn-interventions">{html_t["html_show_my_interventions"]}</button>
+<button onclick="downloadHTML()">{html_t["html_download_pruned"]}</button>
+<button onclick="downloadState()">{html_t["html_export_state"]}</button>
+<button onclick="saveCheckboxStates()">{html_t["html_save_states"]}</button>
+<button onclick="resetCheckboxStates()">{html_t["html_reset_states"]}</button>
+<button onclick="downloadReportPDF()">{html_t["html_report_pdf"]}</button>
+<button onclick="downloadReportWord()">{html_t["html_report_word"]}</button>
+<select onchange="setTheme(this.value)">
+<option value="light">{html_t["html_theme_light"]}</option>
+<option value="dark">{html_t["html_theme_dark"]}</option>
+<option value="vibrant">{html_t["html_theme_vibrant"]}</option>
+</select></div>
+<div class="search"><input id="q" type="search" placeholder="{html_t["html_search_placeholder"]}" oninput="scheduleFilter()"></div>{shard_results}
+</div>
+<div class="container">''')
+    if virtual:
+        out.write('<div id="vs-top"></div><div id="vs-rows"></div><div id="vs-bottom"></div>\n'
+                  '<script type="application/json" id="msg-data">[')
+
+    audio_file_counter = 0
+    total_messages = shard["total"] if shard else len(messages)
+    number_offset = shard["offset"] if shard else 0
+    # Ordinals follow the order messages are written, which is what the page searches by.
+    search_index = SearchIndex()
+    markup_bytes_saved_estimate = 0
+    note_placeholder_bytes = len(html.escape(html_t["html_note_placeholder"]).encode("utf-8"))
+
+    for i, m in enumerate(messages, start=number_offset):
         if worker.stop_requested:
-            return
+            return False
         worker.progress_updated.emit(i + 1, total_messages)
+        text = ""
 
-        msg_id = m.get("datetime_obj").strftime('%Y%m%d%H%M%S') + f"-{i}"
+        index = m.get("archive_index", i)
+        msg_id = message_id(m, index)
+        edited = bool(state) and msg_id in state.edits
 
         # --- NEW: Create a unique, stable ID for the checkbox ---
         checkbox_id = f"cb-{msg_id}"
@@ -901,17 +356,8 @@ async function initWhisperTranscription(button, audioSrc) {
         date, time, name, msg = m.get("date", ""), m.get("time", ""), m.get("name"), m.get("msg", "")
         is_external = m.get("is_external_audio", False)
 
-        # --- MODIFIED: Get color pair and set CSS variables ---
-        default_pair = {'light': 'var(--bubble-light)', 'dark': 'var(--bubble-dark)', 'border': 'transparent'}
-        color_pair = colors.get(name or "", default_pair)
-
-        style_vars = (
-            f'--bubble-bg-light: {color_pair["light"]}; '
-            f'--bubble-bg-dark: {color_pair["dark"]}; '
-            f'--bubble-bg-vibrant: {color_pair["dark"]}; '  # Use dark for vibrant
-            f'border-left-color: {color_pair["border"]};'
-        )
-        # --- END MODIFICATION ---
+        # Messages without a participant class keep the theme's default bubble.
+        participant = participant_classes.get(name or "")
 
         media_block = ""
         fn = None
@@ -919,9 +365,9 @@ async function initWhisperTranscription(button, audioSrc) {
         if is_external:
             fn = msg
             name = html_t["html_external_audio_name"]
-            style_vars = ""  # Reset for external, use CSS class
+            participant = None  # Styled by the msg-external class
         else:
-            mf = MEDIA_FILENAME_RE.search(msg) or MEDIA_FILENAME_RE.fullmatch(msg.strip())
+            mf = media_filename_match(msg)
             if mf:
                 fn = mf.group("fname")
             elif MEDIA_OMITTED_RE.search(msg):
@@ -932,29 +378,40 @@ async function initWhisperTranscription(button, audioSrc) {
             if abs_match:
                 esc_fn = html.escape(fn)
                 if encryption_key:
-                    output_filename = fn + ".aes"
-                    output_path = media_output_folder / output_filename
-                    rel_path = f"{media_output_folder.name}/{output_filename}"
-
-                    if not output_path.exists():
-                        worker.status_updated.emit("status_encrypting", {"filename": fn})
-                        encrypt_file(abs_match, output_path, encryption_key, worker)
+                    # Encrypted by the encryption stage before the build (see stages.encryption).
+                    rel_path = f"{media_output_folder.name}/{fn}.aes"
 
                     if fn.lower().endswith(IMAGE_EXTENSIONS):
                         img_id = f"img_{msg_id}"
-                        media_block = f'''<div class="attach"><img id="{img_id}" data-src-encrypted="{html.escape(rel_path)}" alt="{esc_fn}" loading="lazy">
+                        thumb = (thumbnails or {}).get(abs_match)
+                        thumb_url = f"{media_output_folder.name}/{thumb['path'].name}.aes" if thumb and thumb["path"] else None
+                        img_attrs = _image_attrs("data-src-encrypted", rel_path, thumb, thumb_url)
+                        media_block = f'''<div class="attach"><img id="{img_id}" {img_attrs} alt="{esc_fn}" loading="lazy">
 <button class="rotate-btn" onclick="rotateImage('{img_id}')">↻ Rotate</button></div>'''
                     elif fn.lower().endswith(AUDIO_EXTENSIONS):
                         pre_id = f"transcription-pre-{msg_id}"
                         text = transcribe_audio_file(model, abs_match, cache_dir, worker,
                                                      audio_file_counter, total_audio_files)
-                        if worker.stop_requested: return
+                        if worker.stop_requested: return False
+                        if edited:
+                            text = state.edits[msg_id]
                         worker.status_updated.emit("status_processing", {})
-                        esc_text = html.escape(text)
+                        compact = (compact_audios or {}).get(abs_match)
+                        if compact:
+                            rel_path = f"{media_output_folder.name}/{compact.name}.aes"
+                        trans_block = _transcript_block(pre_id, msg_id, text, html_t["html_show_transcription"],
+                                                        transcripts, edited)
                         media_block = f'''<div class="attach"><audio controls preload="none" data-src-encrypted="{html.escape(rel_path)}"></audio>
-<details class="trans"><summary>{html_t["html_show_transcription"]}</summary><pre id="{pre_id}" contenteditable="true" oninput="saveEdit(this)">{esc_text}</pre></details></div>'''
-                    elif fn.lower().endswith(('.mp4', '.mov', '.mkv', '.webm')):
-                        media_block = f'''<div class="attach"><video controls preload="none" data-src-encrypted="{html.escape(rel_path)}"></video></div>'''
+{trans_block}</div>'''
+                    elif fn.lower().endswith(VIDEO_EXTENSIONS):
+                        video = (videos or {}).get(abs_match, {})
+                        if video.get("video"):
+                            rel_path = f"{media_output_folder.name}/{video['video'].name}.aes"
+                        poster_attr = ""
+                        if video.get("poster"):
+                            poster_url = f"{media_output_folder.name}/{video['poster'].name}.aes"
+                            poster_attr = f' data-poster-encrypted="{html.escape(poster_url)}"'
+                        media_block = f'''<div class="attach"><video controls preload="none" data-src-encrypted="{html.escape(rel_path)}"{poster_attr}></video></div>'''
                     else:
                         media_block = f'''<div class="attach"><a href="{html.escape(rel_path)}" target="_blank">{esc_fn} (Encrypted)</a></div>'''
 
@@ -964,21 +421,31 @@ async function initWhisperTranscription(button, audioSrc) {
 
                     if fn.lower().endswith(IMAGE_EXTENSIONS):
                         img_id = f"img_{msg_id}"
-                        media_block = f'''<div class="attach"><img id="{img_id}" src="{esc_rel_path}" alt="{esc_fn}" loading="lazy">
+                        thumb = (thumbnails or {}).get(abs_match)
+                        thumb_url = os.path.relpath(thumb["path"], out_html.parent) if thumb and thumb["path"] else None
+                        img_attrs = _image_attrs("src", rel_path, thumb, thumb_url)
+                        media_block = f'''<div class="attach"><img id="{img_id}" {img_attrs} alt="{esc_fn}" loading="lazy">
 <button class="rotate-btn" onclick="rotateImage('{img_id}')">↻ Rotate</button></div>'''
                     elif fn.lower().endswith(AUDIO_EXTENSIONS):
                         pre_id = f"transcription-pre-{msg_id}"
+                        # Whisper reads the original; the page plays the compact copy if there is one.
+                        compact = (compact_audios or {}).get(abs_match)
+                        if compact:
+                            esc_rel_path = html.escape(os.path.relpath(compact, out_html.parent))
                         if transcribe_audio and model:
                             cache_file = cache_dir / (abs_match.stem + ".json")
                             if not cache_file.exists():
                                 audio_file_counter += 1
                             text = transcribe_audio_file(model, abs_match, cache_dir, worker,
                                                          audio_file_counter, total_audio_files)
-                            if worker.stop_requested: return
+                            if worker.stop_requested: return False
+                            if edited:
+                                text = state.edits[msg_id]
                             worker.status_updated.emit("status_processing", {})
-                            esc_text = html.escape(text)
+                            trans_block = _transcript_block(pre_id, msg_id, text, html_t["html_show_transcription"],
+                                                            transcripts, edited)
                             media_block = f'''<div class="attach"><audio controls preload="none" src="{esc_rel_path}"></audio>
-<details class="trans"><summary>{html_t["html_show_transcription"]}</summary><pre id="{pre_id}" contenteditable="true" oninput="saveEdit(this)">{esc_text}</pre></details></div>'''
+{trans_block}</div>'''
                         else:
                             btn_container_id = f"transcribe-placeholder-{msg_id}"
                             media_block = f'''<div class="attach">
@@ -987,8 +454,14 @@ async function initWhisperTranscription(button, audioSrc) {
         <button class="transcribe-btn" onclick="initWhisperTranscription(this, '{esc_rel_path}')">{html_t["html_transcribe_in_browser"]}</button>
     </div>
 </div>'''
-                    elif fn.lower().endswith(('.mp4', '.mov', '.mkv', '.webm')):
-                        media_block = f'''<div class="attach"><video controls preload="none" src="{esc_rel_path}"></video></div>'''
+                    elif fn.lower().endswith(VIDEO_EXTENSIONS):
+                        video = (videos or {}).get(abs_match, {})
+                        if video.get("video"):
+                            esc_rel_path = html.escape(os.path.relpath(video["video"], out_html.parent))
+                        poster_attr = ""
+                        if video.get("poster"):
+                            poster_attr = f' poster="{html.escape(os.path.relpath(video["poster"], out_html.parent))}"'
+                        media_block = f'''<div class="attach"><video controls preload="none" src="{esc_rel_path}"{poster_attr}></video></div>'''
                     else:
                         media_block = f'''<div class="attach"><a href="{esc_rel_path}" target="_blank">{esc_fn}</a></div>'''
 
@@ -1008,72 +481,84 @@ async function initWhisperTranscription(button, audioSrc) {
             meta = f'<span class="name">{html.escape(name)}</span> · {meta}'
         # --- END NEW ---
 
-        external_class = ' msg-external' if is_external else ''
-
-        if is_external:
-            content_block = f'<div class="content" style="font-style: italic;">{html.escape(msg)}</div>'
-        else:
-            content_block = f'<div class="content">{html.escape(msg)}</div>'
+        msg_class = "msg" + (" msg-external" if is_external else "") + (f" {participant}" if participant else "")
+        content_block = f'<div class="content">{html.escape(msg)}</div>'
 
         note_id = f"note-{msg_id}"
-        note_placeholder = html.escape(html_t["html_note_placeholder"])
-        original_num = i + 1
-
-        blocks.append(f'''
-<div class="msg{external_class}" style="{style_vars}" data-msg-id="{msg_id}" data-original-number="{original_num}">
-<div class="msg-number" data-original-number="{original_num}">{original_num}</div>
+        original_num = index + 1
+        selected = bool(state) and msg_id in state.selected
+        priority = state.priorities.get(msg_id, "none") if state else "none"
+        note_html = state.notes.get(msg_id, "") if state else ""
+        # A sealed sidecar's text stays out of the plain search data (see TRANSCRIPTS_UNINDEXED).
+        indexed_text = "" if sealed_transcripts else text
+        if shard:
+            shard["search_entries"].append((msg_id, f"{name or ''} {msg} {indexed_text}".lower()))
+        search_index.add(f"{name or ''} {date_str} {msg} {indexed_text}")
+
+        if virtual:
+            # Same fields as the markup below; the page builds rows from them (see JS_VIRTUAL).
+            row = {"i": msg_id, "n": original_num, "d": f"{date_str} {time_str}", "g": gmt_time_str}
+            if participant:
+                row["p"] = int(participant[1:])
+            if name:
+                row["nm"] = name
+            if is_external:
+                row["x"] = 1
+            if msg:
+                row["t"] = msg
+            if media_block:
+                row["m"] = media_block
+            if 'id="transcription-pre-' in media_block:
+                if transcripts is None:
+                    row["tr"] = text
+                else:
+                    row["lz"] = 1  # Text is in the transcript sidecar
+                if edited:
+                    row["ed"] = text
+            if selected:
+                row["sel"] = 1
+            if priority != "none":
+                row["pr"] = priority
+            if note_html:
+                row["nt"] = note_html
+            out.write(("," if i > number_offset else "") + "\n" + _json_for_script(row))
+            continue
+
+        # Handlers are delegated from .container (see bindMessageHandlers in JS_FUNCTIONS).
+        note_class, note_baked = ("has-content", ' data-baked="true"') if note_html else ("empty", "")
+        out.write(f'''
+<div class="{msg_class}" data-msg-id="{msg_id}" data-original-number="{original_num}">
+<div class="msg-number">{original_num}</div>
 <div class="msg-body">
-<input type="checkbox" style="margin-top:4px;" id="{checkbox_id}">
-<div style="flex:1">
-<div class="msg-priority-marker" data-priority="none" onclick="cyclePriority(event)"></div>
+<input type="checkbox" id="{checkbox_id}"{" checked" if selected else ""}>
+<div class="msg-main">
+<div class="msg-priority-marker" data-priority="{priority}"></div>
 <div class="meta">{meta}</div>
 {content_block}
 {media_block}
 </div>
-<div class="msg-note empty" id="{note_id}" contenteditable="true" data-placeholder="{note_placeholder}" oninput="onNoteInput(this)" onpaste="onNotePaste(event)"></div>
+<div class="msg-note {note_class}" id="{note_id}" contenteditable="true"{note_baked}>{note_html}</div>
 </div>
-<div class="msg-deleted-placeholder" style="display:none" aria-hidden="true"></div>
+<div class="msg-deleted-placeholder" aria-hidden="true"></div>
 </div>''')
-    # --- END MODIFICATION ---
-
-    key_script = f"<script>window.ENC_KEY = '{encryption_key}';</script>" if encryption_key else ""
-    decrypt_script = f"<script>{js_decrypt}</script>" if encryption_key else ""
-
-    # --- MODIFIED: Added Save States and Reset States buttons to toolbar ---
-    html_doc = f'''<!doctype html><html lang="en"><head><meta charset="utf-8">
-<meta name="viewport" content="width=device-width, initial-scale=1">
-<title>{html.escape(title)}</title><style>{css}</style></head>
-<body class="theme-light"><div class="sticky-top">
-<div class="header"><h1>{html.escape(title)}</h1></div>
-<div class="toolbar">
-<button onclick="selectAll()">{html_t["html_select_all"]}</button>
-<button onclick="clearAll()">{html_t["html_clear"]}</button>
-<button onclick="invertSel()">{html_t["html_invert"]}</button>
-<button onclick="deleteSelected()">{html_t["html_delete_selected"]}</button>
-<button onclick="toggleInterventionsFilter()" id="btn-interventions">{html_t["html_show_my_interventions"]}</button>
-<button onclick="downloadHTML()">{html_t["html_download_pruned"]}</button>
-<button onclick="saveCheckboxStates()">{html_t["html_save_states"]}</button>
-<button onclick="resetCheckboxStates()">{html_t["html_reset_states"]}</button>
-<button onclick="downloadReportPDF()">{html_t["html_report_pdf"]}</button>
-<button onclick="downloadReportWord()">{html_t["html_report_word"]}</button>
-<select onchange="setTheme(this.value)">
-<option value="light">{html_t["html_theme_light"]}</option>
-<option value="dark">{html_t["html_theme_dark"]}</option>
-<option value="vibrant">{html_t["html_theme_vibrant"]}</option>
-</select></div>
-<div class="search"><input id="q" type="search" placeholder="{html_t["html_search_placeholder"]}" oninput="filterMessages()"></div>
-</div>
-<div class="container">{''.join(blocks)}</div>
+        markup_bytes_saved_estimate += _legacy_markup_overhead(
+            colors.get(m.get("name") or "") if not is_external else None, participant,
+            original_num, note_placeholder_bytes, is_external, 'id="transcription-pre-' in media_block)
+
+    if virtual:
+        out.write("]</script>")
+    elif stats is not None:
+        stats["messages"] = stats.get("messages", 0) + len(messages)
+        stats["bytes_saved_estimate"] = stats.get("bytes_saved_estimate", 0) + markup_bytes_saved_estimate
+    pruned_script = ""
+    if state and state.deleted:
+        # Ids already pruned from the archive; the page exports them with its own state.
+        pruned_script = f'\n<script type="application/json" id="pruned-ids">{_json_for_script(sorted(state.deleted))}</script>'
+    out.write(f'''</div>
+<script type="application/json" id="search-index">{_json_for_script(search_index.to_dict())}</script>{pruned_script}
 <div class="footer">{html_t["html_footer"]}</div>
-{key_script}
-<script>
-{js}
-</script>
-<script type="module">
-{js_whisper}
-</script>
-{decrypt_script}
-</body></html>'''
-    out_html.write_text(html_doc, encoding="utf-8")
+{scripts}
+</body></html>''')
+    return True
 
 
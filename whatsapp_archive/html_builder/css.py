@@ -33,6 +33,10 @@ body.theme-vibrant .sticky-top{background:var(--bg-vibrant)}
 .container{max-width:960px;margin:auto;padding:16px}
 .msg{display:flex;gap:8px;align-items:flex-start;border-radius:14px;padding:10px 12px;margin:10px 0;line-height:1.35; border-left: 4px solid transparent; position: relative; scroll-margin-top: 220px;}
 .msg-body{display:flex;gap:8px;align-items:flex-start;flex:1;min-width:0;margin-left:2px;}
+.msg-main{flex:1}
+.export-progress{position:fixed;right:16px;bottom:16px;z-index:1000;padding:8px 12px;border-radius:8px;background:#111827;color:#fff;font-size:13px;box-shadow:0 2px 8px rgba(0,0,0,0.3)}
+.msg-body > input[type="checkbox"]{margin-top:4px}
+.msg.msg-external .content{font-style:italic}
 .msg-deleted-placeholder{display:none;flex:1;font-size:12px;font-style:italic;opacity:.85;padding:8px 0;}
 .msg.msg-deleted .msg-body{display:none !important;}
 .msg.msg-deleted .msg-deleted-placeholder{display:block !important;}
@@ -51,7 +55,8 @@ body.theme-dark .msg.msg-external{background:rgba(59,130,246,0.1) !important}
 .content{white-space:pre-wrap;word-wrap:break-word}
 .attach img,.attach video{max-width:100%;height:auto;border-radius:8px;margin-top:8px}
 .attach img{transition:transform .2s}
-.attach img[data-src-encrypted], .attach audio[data-src-encrypted] {
+.attach img[data-full]{cursor:zoom-in}
+.attach img[data-src-encrypted]:not([data-decrypted]), .attach audio[data-src-encrypted]:not([data-decrypted]) {
     opacity: 0.5;
     border: 2px dashed #aaa;
 }
@@ -68,7 +73,7 @@ body.theme-dark .msg.msg-external{background:rgba(59,130,246,0.1) !important}
  overflow-wrap:break-word;word-wrap:break-word;white-space:pre-wrap;
  outline:none;
 }
-.msg-note.empty::before{content:attr(data-placeholder);color:#999;font-style:italic;}
+.msg-note.empty::before{content:var(--note-placeholder);color:#999;font-style:italic;}
 .msg-note:focus{outline:2px solid #3b82f6;border-color:#3b82f6;outline-offset:0}
 .msg-note ul,.msg-note ol{margin:0.25em 0;padding-left:1.5em;}
 .msg-note li{margin:0.1em 0;}
@@ -83,6 +88,12 @@ body.theme-vibrant .msg-note.empty::before{color:#777}
 body.theme-dark .msg-note.has-content{background:rgba(255,255,200,0.1)}
 body.theme-vibrant .msg-note.has-content{background:rgba(255,255,200,0.1)}
 .footer{text-align:center;font-size:12px;color:#888;padding:20px}
+#vs-rows{display:flex;flex-direction:column}
+.shard-nav{padding:0 16px 8px;display:flex;gap:12px;align-items:center;flex-wrap:wrap}
+.shard-nav a{color:inherit}
+.shard-label{font-weight:600}
+.shard-results{padding:0 16px 8px;font-size:13px}
+.shard-results a{color:inherit}
 .transcribe-btn{margin-top:8px;padding:6px 10px;font-size:12px;font-weight:500;background:#3b82f6;color:#fff;border:none;border-radius:6px;cursor:pointer}
 .transcribe-btn:disabled{background:#555;cursor:default;opacity:0.8}
 body.theme-light .transcribe-btn{background:#2563eb}
@@ -155,3 +166,17 @@ body.theme-dark .msg-priority-marker[data-priority="white"] { background-color:
  .msg-priority-marker { width: 20px; height: 10px; }
 }
 """
+
+# Index page of a sharded archive (used together with HTML_CSS).
+INDEX_CSS = r"""
+.index{max-width:960px;margin:0 auto;padding:16px}
+.index h2{font-size:18px;margin:24px 0 8px}
+.calendar{border-collapse:collapse;width:100%;font-size:13px}
+.calendar th,.calendar td{border:1px solid #ccc;padding:6px;text-align:center}
+.calendar td a{display:block;color:inherit;font-weight:600}
+.calendar td.empty{color:#aaa}
+.shard-list li{margin:4px 0}
+#index-results{padding-left:18px;font-size:14px}
+#index-results li{margin:6px 0}
+#index-results .index-note{list-style:none;color:#888}
+"""
@@ -0,0 +1,2132 @@
+"""Embedded JavaScript for the generated HTML archive.
+
+Static code only; the per-archive constants (translations, key) are emitted by the builder.
+"""
+
+# Query and text folding shared by every search: the page's own, and the sharded archive's
+# cross-page search (JS_SHARD, JS_INDEX). Must fold like search_index.py.
+JS_SEARCH_TEXT = r'''
+function foldText(s){ return s.toLowerCase().normalize('NFD').replace(/\p{M}/gu, ''); }
+function searchTokens(q){ return foldText(q).match(/[\p{L}\p{N}_]+/gu) || []; }
+'''
+
+JS_FUNCTIONS = JS_SEARCH_TEXT + r'''
+const FILE_KEY = location.pathname.split('/').pop() || 'default';
+function storageKey(key) { return FILE_KEY + ':' + key; }
+function migrateKey(oldKey) {
+    var val = localStorage.getItem(storageKey(oldKey));
+    if (val) return val;
+    val = localStorage.getItem(oldKey);
+    if (val) { localStorage.setItem(storageKey(oldKey), val); }
+    return val;
+}
+
+/* --- State store: per-message records in IndexedDB, written in debounced batches --- */
+// Records are {file, kind, id, value}, keyed by [file, kind, id]; ids are message ids and
+// kinds are the keys of stateStore.maps. Everything for this file is read in one cursor
+// pass at load. Legacy localStorage keys are migrated once; where IndexedDB is unavailable
+// the maps are written back to those keys instead.
+const STATE_DB = 'whatsapp-archive-state';
+const STATE_FLUSH_DELAY = 400;
+const stateStore = {
+    db: null,
+    ready: false,
+    maps: { selected: new Map(), note: new Map(), priority: new Map(), deleted: new Map(), edit: new Map() },
+    pending: new Map(),   // kind + '\n' + id -> record; value undefined means delete
+    timer: 0,
+};
+function openStateDb() {
+    return new Promise((resolve, reject) => {
+        if (!window.indexedDB) { reject(new Error('IndexedDB unavailable')); return; }
+        const req = indexedDB.open(STATE_DB, 1);
+        req.onupgradeneeded = () => req.result.createObjectStore('records', { keyPath: ['file', 'kind', 'id'] });
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => reject(req.error);
+        req.onblocked = () => reject(new Error('IndexedDB blocked'));
+    });
+}
+// One pass over this file's records; resolves true if the legacy keys were already migrated.
+function readStateRecords(db) {
+    return new Promise((resolve, reject) => {
+        let migrated = false;
+        const range = IDBKeyRange.bound([FILE_KEY], [FILE_KEY, []]);
+        const req = db.transaction('records').objectStore('records').openCursor(range);
+        req.onsuccess = () => {
+            const cursor = req.result;
+            if (!cursor) { resolve(migrated); return; }
+            const r = cursor.value;
+            if (r.kind === 'meta') migrated = true;
+            else if (stateStore.maps[r.kind]) stateStore.maps[r.kind].set(r.id, r.value);
+            cursor.continue();
+        };
+        req.onerror = () => reject(req.error);
+    });
+}
+function readLegacyState() {
+    const maps = stateStore.maps;
+    const parse = (key, fallback) => {
+        try { return JSON.parse(migrateKey(key) || fallback); }
+        catch (e) { console.error("Failed to read " + key + ":", e); return JSON.parse(fallback); }
+    };
+    Object.entries(parse('checkboxStates', '{}')).forEach(([id, on]) => { if (on) maps.selected.set(id.replace(/^cb-/, ''), 1); });
+    Object.entries(parse('msgNotes', '{}')).forEach(([id, html]) => maps.note.set(id.replace(/^note-/, ''), html));
+    Object.entries(parse('msgPriorities', '{}')).forEach(([id, p]) => { if (p && p !== 'none') maps.priority.set(id, p); });
+    parse('msgDeletedIds', '[]').forEach(id => maps.deleted.set(id, 1));
+    // Transcription edits have one key each; unprefixed keys predate per-file storage.
+    const prefixed = storageKey('transcription-pre-');
+    for (let k = 0; k < localStorage.length; k++) {
+        const key = localStorage.key(k);
+        if (key.startsWith(prefixed)) {
+            maps.edit.set(key.slice(prefixed.length), localStorage.getItem(key));
+        } else if (key.startsWith('transcription-pre-')) {
+            const id = key.slice('transcription-pre-'.length);
+            if (!maps.edit.has(id) && pageHasMessage(id)) maps.edit.set(id, localStorage.getItem(key));
+        }
+    }
+}
+function legacyStateKeys() {
+    const keys = ['checkboxStates', 'msgNotes', 'msgPriorities', 'msgDeletedIds'].map(storageKey);
+    stateStore.maps.edit.forEach((text, id) => keys.push(storageKey('transcription-pre-' + id)));
+    return keys;
+}
+function migrateLegacyState(db) {
+    try { readLegacyState(); } catch (e) { console.error("Failed to read saved state:", e); }
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction('records', 'readwrite');
+        const store = tx.objectStore('records');
+        Object.entries(stateStore.maps).forEach(([kind, map]) => {
+            map.forEach((value, id) => store.put({ file: FILE_KEY, kind: kind, id: id, value: value }));
+        });
+        store.put({ file: FILE_KEY, kind: 'meta', id: 'migrated', value: Date.now() });
+        tx.oncomplete = () => {
+            // The records now live in IndexedDB; free the localStorage quota.
+            try { legacyStateKeys().forEach(key => localStorage.removeItem(key)); } catch (e) {}
+            resolve();
+        };
+        tx.onerror = tx.onabort = () => reject(tx.error);
+    });
+}
+function loadState() {
+    return openStateDb().then(db =>
+        readStateRecords(db).then(migrated => migrated ? null : migrateLegacyState(db)).then(() => { stateStore.db = db; })
+    ).catch(e => {
+        console.warn("IndexedDB unavailable, keeping state in localStorage:", e);
+        Object.values(stateStore.maps).forEach(map => map.clear());
+        try { readLegacyState(); } catch (e2) { console.error("Failed to read saved state:", e2); }
+    }).then(() => {
+        stateStore.ready = true;
+        if (stateStore.pending.size) scheduleStateFlush();
+    });
+}
+function stateSet(kind, id, value) {
+    if (value === undefined) stateStore.maps[kind].delete(id); else stateStore.maps[kind].set(id, value);
+    stateStore.pending.set(kind + '\n' + id, { file: FILE_KEY, kind: kind, id: id, value: value });
+    scheduleStateFlush();
+}
+function stateDelete(kind, id) { stateSet(kind, id, undefined); }
+function stateClear(kind) { Array.from(stateStore.maps[kind].keys()).forEach(id => stateDelete(kind, id)); }
+function scheduleStateFlush() {
+    if (!stateStore.ready || stateStore.timer) return;
+    stateStore.timer = setTimeout(() => {
+        flushState().catch(e => console.error("Failed to save state:", e));
+    }, STATE_FLUSH_DELAY);
+}
+// Write the pending records: one IndexedDB transaction, or the touched legacy keys.
+function flushState() {
+    clearTimeout(stateStore.timer);
+    stateStore.timer = 0;
+    if (!stateStore.ready || !stateStore.pending.size) return Promise.resolve();
+    const batch = Array.from(stateStore.pending.values());
+    stateStore.pending.clear();
+    // On failure the batch goes back in the queue, behind any newer change to the same record.
+    const requeue = (e) => {
+        batch.forEach(r => {
+            const key = r.kind + '\n' + r.id;
+            if (!stateStore.pending.has(key)) stateStore.pending.set(key, r);
+        });
+        throw e;
+    };
+    if (!stateStore.db) {
+        try { writeLegacyState(batch); } catch (e) { return Promise.reject(e).catch(requeue); }
+        return Promise.resolve();
+    }
+    return new Promise((resolve, reject) => {
+        const tx = stateStore.db.transaction('records', 'readwrite');
+        const store = tx.objectStore('records');
+        batch.forEach(r => {
+            if (r.value === undefined) store.delete([r.file, r.kind, r.id]);
+            else store.put(r);
+        });
+        tx.oncomplete = () => resolve();
+        tx.onerror = tx.onabort = () => reject(tx.error);
+    }).catch(requeue);
+}
+function writeLegacyState(batch) {
+    const maps = stateStore.maps;
+    const kinds = new Set(batch.map(r => r.kind));
+    const asObject = (map, prefix) => {
+        const out = {};
+        map.forEach((value, id) => { out[prefix + id] = value; });
+        return JSON.stringify(out);
+    };
+    if (kinds.has('selected')) localStorage.setItem(storageKey('checkboxStates'), asObject(maps.selected, 'cb-'));
+    if (kinds.has('note')) localStorage.setItem(storageKey('msgNotes'), asObject(maps.note, 'note-'));
+    if (kinds.has('priority')) localStorage.setItem(storageKey('msgPriorities'), asObject(maps.priority, ''));
+    if (kinds.has('deleted')) localStorage.setItem(storageKey('msgDeletedIds'), JSON.stringify(Array.from(maps.deleted.keys())));
+    batch.forEach(r => {
+        if (r.kind !== 'edit') return;
+        const key = storageKey('transcription-pre-' + r.id);
+        if (r.value === undefined) localStorage.removeItem(key); else localStorage.setItem(key, r.value);
+    });
+}
+document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') flushState().catch(e => console.error("Failed to save state:", e));
+});
+window.addEventListener('pagehide', () => { flushState().catch(() => {}); });
+function pageHasMessage(msgId) { return !!document.getElementById('cb-' + msgId); }
+function cardById(msgId) {
+    const cb = document.getElementById('cb-' + msgId);
+    return cb ? cb.closest('.msg') : null;
+}
+/* --- End State store --- */
+
+let currentTheme='light';
+function setTheme(t){
+ document.body.classList.remove('theme-dark','theme-light','theme-vibrant');
+ document.body.classList.add('theme-'+t);currentTheme=t;
+ document.querySelector('.toolbar select').value = t;
+}
+function rotateImage(id){
+ const img=document.getElementById(id);
+ const angle=parseInt(img.getAttribute('data-angle')||'0')+90;
+ img.style.transform='rotate('+angle+'deg)';
+ img.setAttribute('data-angle',angle);
+}
+function pauseAllOtherAudios(currentAudio){
+ document.querySelectorAll('audio').forEach(function(a){
+  if(a!==currentAudio&&!a.paused){ a.pause(); }
+ });
+}
+function escapeRegex(s){ return s.replace(/[.*+?^${}()|[\]\\]/g,'\\$&'); }
+/* --- Search: answered from the build-time index (html_builder/search_index.py) --- */
+function escapeHtmlText(s){ return s.replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;'); }
+let searchIndex = null;
+function getSearchIndex(){
+ if (searchIndex !== null) return searchIndex;
+ searchIndex = false;
+ const el = document.getElementById('search-index');
+ if (!el) return searchIndex;
+ try {
+   const raw = JSON.parse(el.textContent);
+   const bytes = (b64) => Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+   const offsets = bytes(raw.offsets);
+   searchIndex = { tokens: raw.tokens, offsets: new Uint32Array(offsets.buffer), postings: bytes(raw.postings) };
+ } catch (e) {
+   console.error("Search index unavailable:", e);
+ }
+ return searchIndex;
+}
+// A sealed transcript sidecar is left out of the index: its words are matched here, once
+// decrypted. Returns the words of each message's transcription by ordinal, or null.
+let transcriptWords = null;
+function unindexedTranscriptWords(count){
+ if (!TRANSCRIPTS_UNINDEXED) return null;
+ if (!loadedTranscripts) {
+   loadTranscripts().then(() => filterMessages(), e => console.error("Failed to load transcriptions:", e));
+   return null;
+ }
+ if (!transcriptWords) {
+   transcriptWords = new Array(count);
+   for (let i = 0; i < count; i++) {
+     const text = loadedTranscripts[searchOrdinalId(i)];
+     if (text) transcriptWords[i] = searchTokens(text);
+   }
+ }
+ return transcriptWords;
+}
+function searchOrdinalId(i){ return (searchCards || (searchCards = getAllCards()))[i].dataset.msgId; }
+// Messages (by page ordinal) containing a word starting with every query token.
+// Returns { mask, terms }, or null when there is no index or nothing to look up.
+function searchMatches(q, count){
+ const index = getSearchIndex();
+ const terms = searchTokens(q);
+ if (!index || !terms.length) return null;
+ const words = unindexedTranscriptWords(count);
+ let result = null;
+ for (const term of terms) {
+   const mask = new Uint8Array(count);
+   let lo = 0, hi = index.tokens.length;
+   while (lo < hi) { const mid = (lo + hi) >> 1; if (index.tokens[mid] < term) lo = mid + 1; else hi = mid; }
+   for (let k = lo; k < index.tokens.length && index.tokens[k].startsWith(term); k++) {
+     let p = index.offsets[k], ordinal = 0;
+     const end = index.offsets[k + 1];
+     while (p < end) {
+       let delta = 0, shift = 0, b;
+       do { b = index.postings[p++]; delta |= (b & 0x7f) << shift; shift += 7; } while (b & 0x80);
+       ordinal += delta;
+       if (ordinal < count) mask[ordinal] = 1;
+     }
+   }
+   if (words) words.forEach((list, i) => { if (list.some(word => word.startsWith(term))) mask[i] = 1; });
+   if (result) { for (let i = 0; i < count; i++) result[i] &= mask[i]; } else { result = mask; }
+ }
+ return { mask: result, terms: terms };
+}
+// Wrap accent-insensitive occurrences of the terms (at word starts) in <mark>.
+function highlightFolded(el, terms){
+ if (!terms.length || document.activeElement === el) return;
+ const raw = el.textContent;
+ let folded = '';
+ const map = [];
+ for (let k = 0; k < raw.length; k++) {
+   const f = foldText(raw[k]);
+   for (let j = 0; j < f.length; j++) { folded += f[j]; map.push(k); }
+ }
+ const ranges = [];
+ for (const term of terms) {
+   for (let at = folded.indexOf(term); at >= 0; at = folded.indexOf(term, at + 1)) {
+     if (at === 0 || !/[\p{L}\p{N}_]/u.test(folded[at - 1])) ranges.push([map[at], map[at + term.length - 1] + 1]);
+   }
+ }
+ if (!ranges.length) return;
+ ranges.sort((a, b) => a[0] - b[0]);
+ let html = '', pos = 0;
+ for (const [start, end] of ranges) {
+   if (end <= pos) continue;
+   const from = Math.max(start, pos);
+   html += escapeHtmlText(raw.slice(pos, from)) + '<mark class="search-highlight">' + escapeHtmlText(raw.slice(from, end)) + '</mark>';
+   pos = end;
+ }
+ el.innerHTML = html + escapeHtmlText(raw.slice(pos));
+}
+let searchCards = null;  // .msg elements in page order, i.e. by index ordinal
+const highlightedCards = new Set();
+let highlightTerms = [];
+let highlightObserver = null;
+function highlightCard(card){
+ highlightedCards.add(card);
+ const apply = () => {
+   if (!highlightedCards.has(card)) return;
+   card.querySelectorAll('.content, .msg-deleted-placeholder, .trans pre').forEach(el => highlightFolded(el, highlightTerms));
+ };
+ if (card.querySelector('pre[data-lazy]')) fillTranscripts(card).then(apply); else apply();
+}
+function clearSearchHighlights(){
+ document.querySelectorAll('.msg.msg-highlight').forEach(m=>m.classList.remove('msg-highlight'));
+ if (highlightObserver) highlightObserver.disconnect();
+ highlightedCards.forEach(card=>{
+   card.querySelectorAll('mark.search-highlight').forEach(m=>m.replaceWith(document.createTextNode(m.textContent)));
+ });
+ highlightedCards.clear();
+}
+// Highlight hits lazily, as they come near the viewport.
+function applyTextHighlights(terms, cards){
+ highlightTerms = terms;
+ if (!terms.length) return;
+ if (!('IntersectionObserver' in window)) { cards.forEach(highlightCard); return; }
+ if (!highlightObserver) {
+   highlightObserver = new IntersectionObserver(entries => entries.forEach(entry => {
+     if (!entry.isIntersecting) return;
+     highlightObserver.unobserve(entry.target);
+     highlightCard(entry.target);
+   }), { rootMargin: '600px 0px' });
+ }
+ cards.forEach(card => highlightObserver.observe(card));
+}
+let filterTimer = null;
+function scheduleFilter(){
+ clearTimeout(filterTimer);
+ filterTimer = setTimeout(filterMessages, 150);
+}
+var showOnlyInterventions = false;
+function msgHasIntervention(msg) {
+ var note = msg.querySelector('.msg-note');
+ var hasNote = note && note.innerText.trim().length > 0;
+ var marker = msg.querySelector('.msg-priority-marker');
+ var hasPriority = marker && (marker.dataset.priority || 'none') !== 'none';
+ return hasNote || hasPriority;
+}
+function toggleInterventionsFilter() {
+ showOnlyInterventions = !showOnlyInterventions;
+ var btn = document.getElementById('btn-interventions');
+ if (btn) {
+   btn.textContent = showOnlyInterventions ? HTML_SHOW_ALL_MSGS : HTML_SHOW_MY_INTERVENTIONS;
+   btn.classList.toggle('active', showOnlyInterventions);
+ }
+ filterMessages();
+}
+function filterMessages(){
+ const input = document.getElementById('q').value.trim();
+ const q = input.toLowerCase();
+ const numMatch = input.match(/^(?:#|message|msg)?\s*(\d+)\s*$/i);
+ const targetNum = numMatch ? parseInt(numMatch[1], 10) : null;
+
+ clearSearchHighlights();
+
+ if (targetNum !== null) {
+   document.querySelectorAll('.msg').forEach(c => { c.style.display = ''; });
+   updateMessageNumbers();
+   const targetMsg = document.querySelector('.msg[data-original-number="' + targetNum + '"]');
+   if (targetMsg) {
+     targetMsg.classList.add('msg-highlight');
+     requestAnimationFrame(function(){
+       requestAnimationFrame(function(){
+         targetMsg.scrollIntoView({ behavior: 'smooth', block: 'center', inline: 'nearest' });
+       });
+     });
+   }
+   return;
+ }
+ const cards = searchCards || (searchCards = getAllCards());
+ const found = q ? searchMatches(q, cards.length) : null;
+ const shown = [];
+ cards.forEach((c, i)=>{
+   const showBySearch = !q || (found ? found.mask[i] === 1 : c.innerText.toLowerCase().includes(q));
+   const showByInterventions = !showOnlyInterventions || msgHasIntervention(c);
+   const display = (showBySearch && showByInterventions) ? '' : 'none';
+   if (c.style.display !== display) c.style.display = display;
+   if (q && !display) shown.push(c);
+ });
+ updateMessageNumbers();
+ if (q) applyTextHighlights(found ? found.terms : searchTokens(q), shown);
+}
+function getAllCards(){return Array.from(document.querySelectorAll('.msg'));}
+function selectAll(){getAllCards().forEach(c=>{const cb=c.querySelector('.msg-body input[type="checkbox"]');if(cb)cb.checked=true;});}
+function clearAll(){getAllCards().forEach(c=>{const cb=c.querySelector('.msg-body input[type="checkbox"]');if(cb)cb.checked=false;});}
+function invertSel(){getAllCards().forEach(c=>{const cb=c.querySelector('.msg-body input[type="checkbox"]');if(cb)cb.checked=!cb.checked;});}
+function deleteSelected(){
+    getAllCards().filter(c=>{
+        const cb=c.querySelector('.msg-body input[type="checkbox"]');
+        return cb && cb.checked && !c.dataset.deleted;
+    }).forEach(c=>{
+        const num = c.getAttribute('data-original-number');
+        c.dataset.deleted = 'true';
+        c.classList.add('msg-deleted');
+        const body = c.querySelector('.msg-body');
+        const ph = c.querySelector('.msg-deleted-placeholder');
+        if (body) body.style.display = 'none';
+        if (ph) {
+            ph.textContent = HTML_MESSAGE_DELETED.replace('{num}', num);
+            ph.style.display = 'block';
+            ph.removeAttribute('aria-hidden');
+        }
+        if (c.dataset.msgId) stateSet('deleted', c.dataset.msgId, 1);
+    });
+    updateMessageNumbers();
+}
+function downloadHTML(){ withTranscripts(writePrunedHTML); }
+function downloadState(){ withTranscripts(writeStateFile); }
+/* --- Pruned export: the page is serialized piece by piece into Blob parts, in idle slices --- */
+const EXPORT_REMOVED_BUTTONS = ["selectAll()", "clearAll()", "invertSel()", "deleteSelected()", "toggleInterventionsFilter()",
+    "downloadHTML()", "downloadState()", "saveCheckboxStates()", "resetCheckboxStates()", "downloadReportPDF()", "downloadReportWord()"];
+let exportRunning = false;
+function whenIdle(fn) {
+    if (window.requestIdleCallback) requestIdleCallback(fn, { timeout: 200 });
+    else setTimeout(() => fn({ timeRemaining: () => 8 }), 0);
+}
+// Calls render(i) for every i < count, a batch per idle period, appending the output to parts.
+function renderInSlices(count, render, parts) {
+    return new Promise((resolve, reject) => {
+        let i = 0;
+        const slice = (deadline) => {
+            try {
+                const chunk = [];
+                while (i < count && (chunk.length < 50 || deadline.timeRemaining() > 1)) chunk.push(render(i++));
+                parts.push(chunk.join(''));
+                showExportProgress(count ? i / count : 1);
+                if (i < count) whenIdle(slice); else resolve();
+            } catch (e) { reject(e); }
+        };
+        whenIdle(slice);
+    });
+}
+function showExportProgress(fraction) {
+    let el = document.getElementById('export-progress');
+    if (fraction === null) { if (el) el.remove(); return; }
+    if (!el) {
+        el = document.createElement('div');
+        el.id = 'export-progress';
+        el.className = 'export-progress';
+        el.setAttribute('role', 'status');
+        document.body.appendChild(el);
+    }
+    el.textContent = HTML_EXPORT_PROGRESS.replace('{percent}', Math.round(fraction * 100));
+}
+function openTag(el) {
+    const html = el.cloneNode(false).outerHTML;
+    return html.slice(0, html.lastIndexOf('</'));
+}
+function exportHead() {
+    let html = openTag(document.head);
+    Array.from(document.head.children).forEach(el => {
+        // Scripts in <head> are added at runtime (report libraries, sidecars), apart from
+        // shared assets (see assets.py), which the export links to like the page does.
+        if ((el.tagName !== 'SCRIPT' || el.hasAttribute('data-asset'))
+            && el.getAttribute('name') !== 'baked-state' && el.getAttribute('name') !== 'ignore-saved-state') {
+            html += el.outerHTML;
+        }
+    });
+    // Marks the file as "baked" so loaded copies skip saved state.
+    return html + '<meta name="baked-state" content="true"></head>';
+}
+// Everything outside the message container: copied as is, minus the interactive-only buttons.
+function exportChrome(node) {
+    if (node.nodeType === Node.TEXT_NODE) return escapeHtmlText(node.textContent);
+    if (node.nodeType !== Node.ELEMENT_NODE || node.id === 'export-progress') return '';
+    if (!node.querySelector('.toolbar')) return node.outerHTML;
+    const copy = node.cloneNode(true);
+    copy.querySelectorAll('.toolbar button').forEach(btn => {
+        if (EXPORT_REMOVED_BUTTONS.includes(btn.getAttribute('onclick'))) btn.remove();
+    });
+    return copy.outerHTML;
+}
+// One message with its current state baked in; reads the state store, not the rest of the page.
+function exportCard(card) {
+    if (!card.classList.contains('msg')) return card.outerHTML + '\n';
+    const id = card.dataset.msgId;
+    const copy = card.cloneNode(true);
+    const cb = card.querySelector('.msg-body input[type="checkbox"]');
+    const cbCopy = copy.querySelector('.msg-body input[type="checkbox"]');
+    if (cbCopy) {
+        if (cb.checked) cbCopy.setAttribute('checked', 'checked'); else cbCopy.removeAttribute('checked');
+    }
+    const note = copy.querySelector('.msg-note');
+    if (note) {
+        const html = stateStore.maps.note.has(id) ? stateStore.maps.note.get(id)
+            : (note.classList.contains('has-content') ? sanitizeNoteHtml(note.innerHTML) : '');
+        note.innerHTML = html;
+        note.setAttribute('data-baked', 'true');
+        note.classList.toggle('has-content', !!html.trim());
+        note.classList.toggle('empty', !html.trim());
+    }
+    const pre = copy.querySelector('pre[id^="transcription-pre-"]');
+    if (pre) {
+        if (stateStore.maps.edit.has(id)) {
+            pre.textContent = stateStore.maps.edit.get(id);
+            pre.removeAttribute('data-lazy');
+        } else if (pre.hasAttribute('data-lazy') && loadedTranscripts) {
+            // Inline sidecar transcriptions so the export stands on its own.
+            pre.textContent = loadedTranscripts[id] || '';
+            pre.removeAttribute('data-lazy');
+        }
+    }
+    const badge = copy.querySelector('.msg-number');
+    if (badge) {
+        badge.textContent = card.getAttribute('data-original-number');
+        badge.style.display = 'flex';
+    }
+    // Drop session-only object URLs so encrypted media decrypts again on load.
+    copy.querySelectorAll('[data-src-encrypted]').forEach(el => {
+        el.removeAttribute('src');
+        el.removeAttribute('data-decrypted');
+        el.removeAttribute('style');
+        if (el.hasAttribute('data-poster-encrypted')) el.removeAttribute('poster');
+    });
+    return copy.outerHTML + '\n';
+}
+function exportContainer(container, parts) {
+    const cards = Array.from(container.children);
+    parts.push(openTag(container) + '\n');
+    return renderInSlices(cards.length, i => exportCard(cards[i]), parts).then(() => parts.push('</div>'));
+}
+function writePrunedHTML() {
+    if (exportRunning) return;
+    exportRunning = true;
+    const parts = ['<!doctype html>\n', openTag(document.documentElement), exportHead(), openTag(document.body)];
+    const nodes = Array.from(document.body.childNodes);
+    showExportProgress(0);
+    nodes.reduce((chain, node) => chain.then(() => {
+        if (node.classList && node.classList.contains('container')) return exportContainer(node, parts);
+        parts.push(exportChrome(node));
+    }), Promise.resolve()).then(() => {
+        parts.push('</body></html>');
+        const a = document.createElement('a');
+        a.href = URL.createObjectURL(new Blob(parts, { type: 'text/html' }));
+        a.download = 'chat_exported_' + new Date().toISOString().replace(/[:.]/g, '-') + '.html';
+        document.body.appendChild(a); a.click(); a.remove();
+        setTimeout(() => URL.revokeObjectURL(a.href), 10000);
+    }).catch(e => {
+        console.error("Export failed:", e);
+    }).finally(() => {
+        exportRunning = false;
+        showExportProgress(null);
+    });
+}
+
+/* --- State export: the page's state as JSON, for rebuilding the archive with it (see page_state.py) --- */
+// Ids of messages a rebuild already removed; they stay deleted in the next state.
+function prunedIds() {
+    const el = document.getElementById('pruned-ids');
+    return el ? JSON.parse(el.textContent) : [];
+}
+function collectPageState() {
+    const state = { selected: [], deleted: prunedIds(), notes: {}, priorities: {}, edits: {} };
+    const idOf = el => el.closest('.msg').dataset.msgId;
+    document.querySelectorAll('.msg-body input[type="checkbox"]:checked').forEach(cb => state.selected.push(idOf(cb)));
+    document.querySelectorAll('.msg[data-deleted="true"]').forEach(msg => state.deleted.push(msg.dataset.msgId));
+    document.querySelectorAll('.msg-priority-marker:not([data-priority="none"])').forEach(marker => {
+        state.priorities[idOf(marker)] = marker.dataset.priority;
+    });
+    document.querySelectorAll('.msg-note.has-content').forEach(note => {
+        state.notes[idOf(note)] = sanitizeNoteHtml(note.innerHTML);
+    });
+    // Edits written in by a rebuild are marked data-edited; later ones are in the state store.
+    document.querySelectorAll('pre[data-edited]').forEach(pre => {
+        const id = transcriptId(pre);
+        state.edits[id] = pre.hasAttribute('data-lazy') ? (loadedTranscripts || {})[id] || '' : pre.textContent;
+    });
+    stateStore.maps.edit.forEach((text, id) => { state.edits[id] = text; });
+    return state;
+}
+function writeStateFile() {
+    const state = Object.assign({ format: 'whatsapp-archive-state', version: 1, page: FILE_KEY,
+        exported: new Date().toISOString() }, collectPageState());
+    const a = document.createElement('a');
+    a.href = URL.createObjectURL(new Blob([JSON.stringify(state)], { type: 'application/json' }));
+    a.download = FILE_KEY.replace(/\.html?$/i, '') + '_state.json';
+    document.body.appendChild(a); a.click(); a.remove();
+    setTimeout(() => URL.revokeObjectURL(a.href), 10000);
+}
+function saveEdit(element) {
+  if (element.id) stateSet('edit', transcriptId(element), element.innerText);
+}
+function loadEdits() {
+  stateStore.maps.edit.forEach((text, id) => {
+    const pre = document.getElementById('transcription-pre-' + id);
+    if (pre) {
+      pre.innerText = text;
+      pre.removeAttribute('data-lazy');
+    }
+  });
+}
+
+/* --- Transcript sidecar: <pre data-lazy> blocks are filled from TRANSCRIPTS_SCRIPT on demand --- */
+let transcriptsPromise = null;
+let loadedTranscripts = null;
+function transcriptId(pre) { return pre.id.slice('transcription-pre-'.length); }
+function loadTranscripts() {
+  if (!transcriptsPromise) {
+    transcriptsPromise = loadScript(TRANSCRIPTS_SCRIPT).then(async () => {
+      if (window.ARCHIVE_TRANSCRIPTS) return window.ARCHIVE_TRANSCRIPTS;
+      // Encrypted archives: the JSON is sealed like the media files (see JS_DECRYPT).
+      const sealed = Uint8Array.from(atob(window.ARCHIVE_TRANSCRIPTS_SEALED), c => c.charCodeAt(0));
+      const keyBytes = new Uint8Array(window.ENC_KEY.match(/../g).map(h => parseInt(h, 16)));
+      const key = await crypto.subtle.importKey("raw", keyBytes, "AES-GCM", false, ["decrypt"]);
+      const blob = await createMediaDecryptor().decryptBytes(sealed, key);
+      return JSON.parse(await blob.text());
+    }).then(transcripts => {
+      loadedTranscripts = transcripts;
+      return transcripts;
+    }, e => {
+      transcriptsPromise = null;
+      throw e;
+    });
+  }
+  return transcriptsPromise;
+}
+// Fill the lazy transcriptions under root; resolves once they are in place (or failed to load).
+function fillTranscripts(root) {
+  if (!TRANSCRIPTS_SCRIPT || !root.querySelector('pre[data-lazy]')) return Promise.resolve();
+  return loadTranscripts().then(transcripts => {
+    root.querySelectorAll('pre[data-lazy]').forEach(pre => {
+      pre.removeAttribute('data-lazy');
+      if (!pre.textContent) pre.textContent = transcripts[transcriptId(pre)] || '';
+    });
+  }).catch(e => console.error("Failed to load transcriptions:", e));
+}
+// Reports and the pruned export need every transcription, not just the opened ones.
+function withTranscripts(fn) {
+  if (!TRANSCRIPTS_SCRIPT || loadedTranscripts) return fn();
+  loadTranscripts().catch(e => console.error("Failed to load transcriptions:", e)).then(() => fn());
+}
+
+/* --- Checkbox Persistence --- */
+function saveCheckboxStates() {
+    document.querySelectorAll('.msg[data-msg-id]').forEach(msg => {
+        const cb = msg.querySelector('.msg-body input[type="checkbox"]');
+        const on = cb && cb.checked;
+        if (on !== stateStore.maps.selected.has(msg.dataset.msgId)) stateSet('selected', msg.dataset.msgId, on ? 1 : undefined);
+    });
+    flushState().then(() => alert(HTML_STATES_SAVED)).catch(e => {
+        console.error("Failed to save checkbox states:", e);
+        alert("Error saving states. Browser storage might be full or disabled.");
+    });
+}
+function loadCheckboxStates() {
+    stateStore.maps.selected.forEach((on, id) => {
+        const cb = document.getElementById('cb-' + id);
+        if (cb) cb.checked = true;
+    });
+}
+function resetCheckboxStates() {
+    stateClear('selected');
+    document.querySelectorAll('.msg input[type="checkbox"]').forEach(cb => {
+        cb.checked = false;
+    });
+    flushState().catch(e => console.error("Failed to reset checkbox states:", e));
+    alert(HTML_STATES_RESET);
+}
+/* --- End Checkbox Persistence --- */
+
+/* --- Notes Logic (rich-text: contenteditable, preserves lists/indent) --- */
+var ALLOWED_NOTE_TAGS = {'P':1,'BR':1,'DIV':1,'SPAN':1,'UL':1,'OL':1,'LI':1,'STRONG':1,'EM':1,'B':1,'I':1,'U':1,'SUB':1,'SUP':1};
+function sanitizeNoteHtml(html) {
+    if (!html || !html.trim()) return '';
+    var doc = document.implementation.createHTMLDocument('');
+    var root = doc.body;
+    root.innerHTML = html;
+    function go(node) {
+        if (node.nodeType === 3) return node.cloneNode(true);
+        if (node.nodeType !== 1) return null;
+        var tag = node.tagName.toUpperCase();
+        if (!ALLOWED_NOTE_TAGS[tag]) return null;
+        var out = doc.createElement(tag);
+        var an = node.attributes;
+        for (var i = 0; i < an.length; i++) {
+            var n = an[i].name.toLowerCase(), v = an[i].value;
+            if ((n === 'style' || n === 'class') && (tag === 'P' || tag === 'DIV' || tag === 'SPAN' || tag === 'LI')) out.setAttribute(n, v);
+        }
+        for (var j = 0; j < node.childNodes.length; j++) {
+            var c = go(node.childNodes[j]);
+            if (c) out.appendChild(c);
+        }
+        return out;
+    }
+    var wrap = doc.createElement('div');
+    for (var k = 0; k < root.childNodes.length; k++) {
+        var c = go(root.childNodes[k]);
+        if (c) wrap.appendChild(c);
+    }
+    return wrap.innerHTML;
+}
+function onNotePaste(ev) {
+    var html = ev.clipboardData && ev.clipboardData.getData('text/html');
+    var text = ev.clipboardData && ev.clipboardData.getData('text/plain');
+    if (html && html.trim()) {
+        ev.preventDefault();
+        var clean = sanitizeNoteHtml(html);
+        if (clean) document.execCommand('insertHTML', false, clean);
+    } else if (text) {
+        ev.preventDefault();
+        document.execCommand('insertText', false, text);
+    }
+}
+function onNoteInput(el) {
+    var has = el.innerText.trim().length > 0;
+    if (!has) { el.innerHTML = ''; el.classList.add('empty'); } else { el.classList.remove('empty'); }
+    el.classList.toggle('has-content', has);
+    stateSet('note', el.id.replace(/^note-/, ''), has ? sanitizeNoteHtml(el.innerHTML) : undefined);
+}
+function loadNotes() {
+    try {
+        document.querySelectorAll('.msg-note[data-baked="true"]').forEach(el => {
+            el.removeAttribute('data-baked');
+            var has = el.innerText.trim().length > 0;
+            if (!has) { el.innerHTML = ''; el.classList.add('empty'); } else { el.classList.remove('empty'); }
+            el.classList.toggle('has-content', has);
+        });
+        stateStore.maps.note.forEach((html, id) => {
+            const el = document.getElementById('note-' + id);
+            if (el && !el.innerText.trim()) {
+                el.innerHTML = sanitizeNoteHtml(html);
+                el.classList.remove('empty');
+                el.classList.toggle('has-content', el.innerText.trim().length > 0);
+            }
+        });
+    } catch (e) {
+        console.error("Failed to load notes:", e);
+    }
+}
+/* --- End Notes Logic --- */
+
+/* --- NEW: Priority Logic --- */
+function cyclePriority(marker) {
+    const currentPriority = marker.dataset.priority || 'none';
+    const currentIndex = PRIORITIES.indexOf(currentPriority);
+    const nextIndex = (currentIndex + 1) % PRIORITIES.length;
+    marker.dataset.priority = PRIORITIES[nextIndex];
+    const msg = marker.closest('.msg');
+    if (msg && msg.dataset.msgId) stateSet('priority', msg.dataset.msgId, nextIndex ? PRIORITIES[nextIndex] : undefined);
+}
+function loadPriorities() {
+    stateStore.maps.priority.forEach((priority, id) => {
+        const msg = cardById(id);
+        const marker = msg ? msg.querySelector('.msg-priority-marker') : null;
+        if (marker) marker.dataset.priority = priority || 'none';
+    });
+}
+function reportPriorityLabel(p) {
+    if (p === 'red') return REPORT_PRIORITY_RED;
+    if (p === 'amber') return REPORT_PRIORITY_AMBER;
+    if (p === 'orange') return REPORT_PRIORITY_ORANGE;
+    if (p === 'white') return REPORT_PRIORITY_WHITE;
+    return '';
+}
+function getReportEntries() {
+    const entries = [];
+    document.querySelectorAll('.msg').forEach(function(msg) {
+        if (!msgHasIntervention(msg)) return;
+        var num = msg.getAttribute('data-original-number') || '';
+        var metaEl = msg.querySelector('.meta');
+        var metaText = metaEl ? metaEl.innerText.trim() : '';
+        var nameEl = metaEl ? metaEl.querySelector('.name') : null;
+        var name = nameEl ? nameEl.innerText.trim() : '';
+        var noteEl = msg.querySelector('.msg-note');
+        var note = noteEl && noteEl.innerText.trim() ? noteEl.innerText.trim() : '';
+        var marker = msg.querySelector('.msg-priority-marker');
+        var priority = marker ? (marker.dataset.priority || 'none') : 'none';
+        var isDeleted = msg.dataset.deleted === 'true';
+        var content = '';
+        var transcription = '';
+        if (isDeleted) {
+            content = REPORT_MESSAGE_HIDDEN;
+        } else {
+            var contentEl = msg.querySelector('.content');
+            if (contentEl) content = contentEl.innerText.trim();
+            var transPre = msg.querySelector('.trans pre') || msg.querySelector('.attach pre[id^="transcription-pre-"]') || msg.querySelector('pre[id^="transcription-pre-"]');
+            if (transPre) {
+                transcription = transPre.hasAttribute('data-lazy')
+                    ? ((loadedTranscripts || {})[transcriptId(transPre)] || '').trim()
+                    : transPre.textContent.trim();
+            }
+        }
+        entries.push({ metaText: metaText, num: num, name: name, note: note, priority: priority, content: content, transcription: transcription, isDeleted: isDeleted });
+    });
+    entries.sort(function(a, b) { return parseInt(a.num, 10) - parseInt(b.num, 10); });
+    return entries;
+}
+function loadScript(src) {
+    return new Promise(function(resolve, reject) {
+        var s = document.createElement('script');
+        s.src = src;
+        s.onload = resolve;
+        s.onerror = reject;
+        document.head.appendChild(s);
+    });
+}
+function downloadReportPDF() { withTranscripts(writeReportPDF); }
+function writeReportPDF() {
+    var entries = getReportEntries();
+    if (!entries.length) { alert(REPORT_NO_INTERVENTIONS); return; }
+    var title = document.querySelector('.header h1') ? document.querySelector('.header h1').textContent : (document.title || 'Archive');
+    var genDate = new Date().toLocaleString();
+    loadScript('https://cdnjs.cloudflare.com/ajax/libs/jspdf/2.5.1/jspdf.umd.min.js').then(function() {
+        var jsPDF = window.jspdf.jsPDF;
+        var doc = new jsPDF();
+        var margin = 18;
+        var marginBottom = 22;
+        var lineHeight = 5.5;
+        var sectionGap = 4;
+        var pageHeight = doc.internal.pageSize.height;
+        var maxWidth = doc.internal.pageSize.width - margin * 2;
+        doc.setFontSize(18);
+        doc.setFont(undefined, 'bold');
+        doc.text(REPORT_TITLE, margin, 22);
+        doc.setFont(undefined, 'normal');
+        doc.setFontSize(10);
+        doc.text(REPORT_SUBTITLE.replace('{title}', title).replace('{date}', genDate), margin, 30);
+        var y = 40;
+        entries.forEach(function(entry, idx) {
+            if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
+            if (idx > 0) { y += sectionGap; }
+            doc.setFont(undefined, 'bold');
+            doc.setFontSize(11);
+            var metaLine = entry.metaText + '   ·   ' + REPORT_MSG_NUM + ' ' + entry.num;
+            var metaLines = doc.splitTextToSize(metaLine, maxWidth);
+            metaLines.forEach(function(line) {
+                if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
+                doc.text(line, margin, y);
+                y += lineHeight;
+            });
+            doc.setFont(undefined, 'normal');
+            doc.setFontSize(10);
+            y += 2;
+            if (entry.note) {
+                var noteLines = doc.splitTextToSize(REPORT_NOTE + ': ' + entry.note, maxWidth);
+                noteLines.forEach(function(line) {
+                    if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
+                    doc.text(line, margin, y);
+                    y += lineHeight;
+                });
+                y += 2;
+            }
+            if (entry.priority !== 'none') {
+                doc.text(REPORT_PRIORITY + ': ' + reportPriorityLabel(entry.priority), margin, y);
+                y += lineHeight + 2;
+            }
+            var contentBlock = '';
+            if (entry.isDeleted) {
+                contentBlock = REPORT_CONTENT + ':\n' + REPORT_MESSAGE_HIDDEN;
+            } else {
+                contentBlock = REPORT_CONTENT + ':';
+                if (entry.content) contentBlock += '\n' + entry.content + (entry.transcription ? ':' : '');
+                if (entry.transcription) contentBlock += '\n' + REPORT_TRANSCRIPTION + ':\n' + entry.transcription;
+                if (!entry.content && !entry.transcription) contentBlock += '\n';
+            }
+            if (contentBlock) {
+                var contentLines = doc.splitTextToSize(contentBlock, maxWidth);
+                contentLines.forEach(function(line) {
+                    if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
+                    doc.text(line, margin, y);
+                    y += lineHeight;
+                });
+            }
+            y += sectionGap;
+        });
+        if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
+        y += 4;
+        doc.setFontSize(8);
+        doc.setTextColor(100, 100, 100);
+        var footer = REPORT_FOOTER.replace('{date}', genDate);
+        var footerLines = doc.splitTextToSize(footer, maxWidth);
+        footerLines.forEach(function(line) {
+            if (y > pageHeight - marginBottom) { doc.addPage(); y = margin; }
+            doc.text(line, margin, y);
+            y += lineHeight;
+        });
+        doc.setTextColor(0, 0, 0);
+        doc.save('rapport_interventions_' + new Date().toISOString().slice(0, 10) + '.pdf');
+    }).catch(function(e) { alert('PDF export failed: ' + (e && e.message ? e.message : e)); });
+}
+function downloadReportWord() { withTranscripts(writeReportWord); }
+function writeReportWord() {
+    var entries = getReportEntries();
+    if (!entries.length) { alert(REPORT_NO_INTERVENTIONS); return; }
+    var title = document.querySelector('.header h1') ? document.querySelector('.header h1').textContent : (document.title || 'Archive');
+    var genDate = new Date().toLocaleString();
+    var escapeHtml = function(s) {
+        if (!s) return '';
+        return String(s).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+    };
+    var nl2br = function(s) { return escapeHtml(s).replace(/\n/g, '<br>'); };
+    var style = 'body{font-family:Segoe UI,Calibri,Arial,sans-serif;font-size:11pt;line-height:1.4;margin:1in;color:#222;}';
+    style += 'h1{font-size:18pt;margin-bottom:6px;color:#1a1a1a;}';
+    style += '.subtitle{font-size:10pt;color:#555;margin-bottom:24px;}';
+    style += '.entry{margin-bottom:28px;padding-bottom:20px;border-bottom:1px solid #ddd;}';
+    style += '.meta{font-size:11pt;font-weight:bold;margin-bottom:8px;color:#333;}';
+    style += '.field{margin:6px 0;font-size:10.5pt;}';
+    style += '.field-label{font-style:italic;color:#444;}';
+    style += '.content-block{margin-top:8px;padding:10px 0;white-space:pre-wrap;}';
+    style += '.footer{font-size:9pt;color:#777;margin-top:32px;padding-top:16px;border-top:1px solid #eee;}';
+    var blocks = [];
+    blocks.push('<html xmlns:o="urn:schemas-microsoft-com:office:office" xmlns:w="urn:schemas-microsoft-com:office:word"><head><meta charset="utf-8"><title>' + escapeHtml(REPORT_TITLE) + '</title><style>' + style + '</style></head><body>');
+    blocks.push('<h1>' + escapeHtml(REPORT_TITLE) + '</h1>');
+    blocks.push('<p class="subtitle">' + escapeHtml(REPORT_SUBTITLE.replace('{title}', title).replace('{date}', genDate)) + '</p>');
+    entries.forEach(function(entry) {
+        blocks.push('<div class="entry">');
+        blocks.push('<p class="meta">' + escapeHtml(entry.metaText) + ' &nbsp; ' + REPORT_MSG_NUM + ' ' + escapeHtml(entry.num) + '</p>');
+        if (entry.note) blocks.push('<p class="field"><span class="field-label">' + REPORT_NOTE + ':</span> ' + nl2br(entry.note) + '</p>');
+        if (entry.priority !== 'none') blocks.push('<p class="field"><span class="field-label">' + REPORT_PRIORITY + ':</span> ' + escapeHtml(reportPriorityLabel(entry.priority)) + '</p>');
+        blocks.push('<p class="field"><span class="field-label">' + REPORT_CONTENT + ':</span></p>');
+        if (entry.isDeleted) {
+            blocks.push('<p class="content-block">' + escapeHtml(REPORT_MESSAGE_HIDDEN) + '</p>');
+        } else {
+            if (entry.content) blocks.push('<p class="content-block">' + nl2br(entry.content) + (entry.transcription ? ':' : '') + '</p>');
+            if (entry.transcription) blocks.push('<p class="field"><span class="field-label">' + REPORT_TRANSCRIPTION + ':</span></p><p class="content-block">' + nl2br(entry.transcription) + '</p>');
+        }
+        blocks.push('</div>');
+    });
+    blocks.push('<p class="footer">' + escapeHtml(REPORT_FOOTER.replace('{date}', genDate)) + '</p>');
+    blocks.push('</body></html>');
+    var html = blocks.join('');
+    var blob = new Blob(['\ufeff' + html], { type: 'application/msword' });
+    var blobUrl = URL.createObjectURL(blob);
+    var a = document.createElement('a');
+    a.href = blobUrl;
+    a.download = 'rapport_interventions_' + new Date().toISOString().slice(0, 10) + '.doc';
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
+    URL.revokeObjectURL(blobUrl);
+}
+/* --- End Interventions Report --- */
+
+/* --- Permanent numbering: badge shows data-original-number, visibility follows filter --- */
+function updateMessageNumbers() {
+    document.querySelectorAll('.msg').forEach(msg => {
+        const numBadge = msg.querySelector('.msg-number');
+        if (!numBadge) return;
+        const num = msg.getAttribute('data-original-number');
+        numBadge.textContent = num || '';
+        if (msg.dataset.deleted === 'true') {
+            numBadge.style.display = 'flex';
+        } else {
+            numBadge.style.display = (msg.style.display !== 'none') ? 'flex' : 'none';
+        }
+    });
+}
+/* --- End Numbering Logic --- */
+
+/* --- Deleted state persistence --- */
+function loadDeletedStates() {
+    stateStore.maps.deleted.forEach((on, id) => {
+        const msg = cardById(id);
+        if (msg && !msg.dataset.deleted) {
+            const num = msg.getAttribute('data-original-number');
+            msg.dataset.deleted = 'true';
+            msg.classList.add('msg-deleted');
+            const body = msg.querySelector('.msg-body');
+            const ph = msg.querySelector('.msg-deleted-placeholder');
+            if (body) body.style.display = 'none';
+            if (ph) {
+                ph.textContent = HTML_MESSAGE_DELETED.replace('{num}', num);
+                ph.style.display = 'block';
+                ph.removeAttribute('aria-hidden');
+            }
+        }
+    });
+}
+/* --- End Deleted state --- */
+
+/* --- Message interactions: delegated from .container instead of per-message attributes --- */
+// Baked (exported) copies keep their notes and priorities as they were saved.
+function bindMessageHandlers(isBaked) {
+    const container = document.querySelector('.container');
+    if (!container) return;
+    container.addEventListener('input', ev => {
+        const pre = ev.target.closest('pre[id^="transcription-pre-"]');
+        if (pre) saveEdit(pre);
+    });
+    // 'toggle' does not bubble; listen in the capture phase.
+    container.addEventListener('toggle', ev => {
+        if (ev.target.open && ev.target.matches('details.trans')) fillTranscripts(ev.target);
+    }, true);
+    if (isBaked) return;
+    container.addEventListener('click', ev => {
+        const marker = ev.target.closest('.msg-priority-marker');
+        if (marker) cyclePriority(marker);
+    });
+    container.addEventListener('input', ev => {
+        const note = ev.target.closest('.msg-note');
+        if (note) onNoteInput(note);
+    });
+    container.addEventListener('paste', ev => {
+        if (ev.target.closest('.msg-note')) onNotePaste(ev);
+    });
+}
+/* --- End Message interactions --- */
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.addEventListener('play', function(ev) {
+        if (ev.target.tagName === 'AUDIO') { pauseAllOtherAudios(ev.target); }
+    }, true);
+    // Previews: swap in the full-resolution image on click (encrypted ones are handled by the decryptor).
+    document.addEventListener('click', function(ev) {
+        const img = ev.target;
+        if (img.tagName === 'IMG' && img.dataset.full && !img.dataset.srcEncrypted) {
+            img.src = img.dataset.full;
+            img.removeAttribute('data-full');
+        }
+    });
+
+    // Pruned exports are read-only; pages built with a state file (see page_state.py) stay
+    // editable. Both show the state written into them, not the state saved in the browser.
+    const isBaked = !!document.querySelector('meta[name="baked-state"][content="true"]');
+    const ignoreSavedState = isBaked || !!document.querySelector('meta[name="ignore-saved-state"][content="true"]');
+    bindMessageHandlers(isBaked);
+
+    loadState().then(() => {
+        if (!ignoreSavedState) {
+            loadEdits();
+            loadCheckboxStates();
+            loadPriorities();
+            loadDeletedStates();
+        }
+        loadNotes();
+        updateMessageNumbers();
+    });
+
+    try {
+        if (window.matchMedia && window.matchMedia('(prefers-color-scheme: dark)').matches) {
+            setTheme('dark');
+        } else {
+            setTheme('light');
+        }
+
+        window.matchMedia('(prefers-color-scheme: dark)').addEventListener('change', e => {
+            setTheme(e.matches ? 'dark' : 'light');
+        });
+    } catch (e) {
+        console.error("Error setting preferred color scheme:", e);
+    }
+});
+'''
+
+# In-browser Whisper transcription (loaded as a module script).
+JS_WHISPER = r'''
+// In-browser transcription pipeline
+let pipelinePromise = null;
+const modelName = 'Xenova/whisper-tiny';
+const modelRevision = 'v4.0.0-compat';
+
+async function initWhisperTranscription(button, audioSrc) {
+    try {
+        button.disabled = true;
+        button.textContent = 'Loading model (one-time download)...';
+        if (!pipelinePromise) {
+            const { pipeline } = await import('https://cdn.jsdelivr.net/npm/@xenova/transformers@2.17.1');
+            pipelinePromise = pipeline('automatic-speech-recognition', modelName, {
+                revision: modelRevision,
+                progress_callback: (progress) => {
+                    const firstButton = document.querySelector('.transcribe-btn[disabled]');
+                    if (firstButton) {
+                        firstButton.textContent = `Loading model... ${progress.status} (${Math.round(progress.progress)}%)`;
+                    }
+                }
+            });
+        }
+        const recognizer = await pipelinePromise;
+        button.textContent = 'Processing audio...';
+        const output = await recognizer(audioSrc, {
+            chunk_length_s: 30,
+            stride_length_s: 5
+        });
+        const text = output.text ? output.text.trim() : '(No speech detected)';
+        const details = document.createElement('details');
+        details.className = 'trans';
+        details.open = true;
+        const summary = document.createElement('summary');
+        summary.textContent = HTML_SHOW_TRANSCRIPTION;
+        const pre = document.createElement('pre');
+        pre.contentEditable = 'true';
+        const placeholderId = button.parentElement.id;
+        const preId = placeholderId.replace('transcribe-placeholder-', 'transcription-pre-');
+        pre.id = preId;
+        pre.textContent = text;
+        details.appendChild(summary);
+        details.appendChild(pre);
+        button.parentElement.replaceWith(details);
+    } catch (error) {
+        console.error('Transcription failed:', error);
+        button.textContent = 'Transcription Failed (Check console/internet)';
+        button.disabled = false;
+    }
+}
+'''
+
+# Lazy media decryption; only included in encrypted archives.
+JS_DECRYPT = r'''
+/* --- DECRYPTION LOGIC --- */
+// Self-contained (no outer references) so the same code can run in the decryption
+// Web Workers: createWorkerPool ships it to them via Function.prototype.toString.
+function createMediaDecryptor() {
+    // Chunked format written by encryptor.encrypt_file:
+    //   "WAE2" + uint32 chunk size, then per chunk: nonce(12) + ciphertext + tag(16).
+    // Each chunk authenticates (uint32 index, final flag) as additional data.
+    const CHUNK_MAGIC = [0x57, 0x41, 0x45, 0x32];
+    const HEADER_SIZE = 8;
+    const NONCE_SIZE = 12;
+    const TAG_SIZE = 16;
+
+    function isChunked(bytes) {
+        if (bytes.length < HEADER_SIZE) return false;
+        for (let i = 0; i < CHUNK_MAGIC.length; i++) {
+            if (bytes[i] !== CHUNK_MAGIC[i]) return false;
+        }
+        return true;
+    }
+
+    function chunkAad(index, final) {
+        const aad = new Uint8Array(5);
+        new DataView(aad.buffer).setUint32(0, index);
+        aad[4] = final ? 1 : 0;
+        return aad;
+    }
+
+    async function decryptChunk(record, index, final, key) {
+        // WebCrypto expects ciphertext || tag, which is exactly the record minus its nonce.
+        return crypto.subtle.decrypt(
+            { name: "AES-GCM", iv: record.subarray(0, NONCE_SIZE), additionalData: chunkAad(index, final) },
+            key,
+            record.subarray(NONCE_SIZE)
+        );
+    }
+
+    async function decryptLegacy(encryptedData, key) {
+        // Pre-chunking format: nonce(16) + tag(16) + ciphertext for the whole file.
+        const nonce = encryptedData.slice(0, 16);
+        const tag = encryptedData.slice(16, 32);
+        const ciphertext = encryptedData.slice(32);
+
+        const combinedData = new Uint8Array(ciphertext.byteLength + tag.byteLength);
+        combinedData.set(new Uint8Array(ciphertext), 0);
+        combinedData.set(new Uint8Array(tag), ciphertext.byteLength);
+
+        return [await crypto.subtle.decrypt(
+            { name: "AES-GCM", iv: nonce },
+            key,
+            combinedData
+        )];
+    }
+
+    // Byte queue over the incoming network chunks; take(n) copies out exactly n bytes.
+    function ByteQueue() {
+        this.parts = [];
+        this.length = 0;
+    }
+    ByteQueue.prototype.push = function(bytes) {
+        if (bytes.length) { this.parts.push(bytes); this.length += bytes.length; }
+    };
+    ByteQueue.prototype.take = function(n) {
+        const out = new Uint8Array(n);
+        let offset = 0;
+        while (offset < n) {
+            const head = this.parts[0];
+            const needed = n - offset;
+            if (head.length <= needed) {
+                out.set(head, offset);
+                offset += head.length;
+                this.parts.shift();
+            } else {
+                out.set(head.subarray(0, needed), offset);
+                this.parts[0] = head.subarray(needed);
+                offset += needed;
+            }
+        }
+        this.length -= n;
+        return out;
+    };
+
+    function wholeBodyReader(arrayBuffer) {
+        let sent = false;
+        return { read: async () => {
+            if (sent) return { done: true, value: undefined };
+            sent = true;
+            return { done: false, value: new Uint8Array(arrayBuffer) };
+        } };
+    }
+
+    // Reads the response chunk by chunk and decrypts each record as soon as it has
+    // fully arrived, so decryption overlaps the download instead of following it.
+    async function decryptStream(reader, key) {
+        const queue = new ByteQueue();
+        const parts = [];
+        let recordSize = 0;
+        let index = 0;
+        let legacy = false;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (value) queue.push(value);
+            if (!recordSize && !legacy && (queue.length >= HEADER_SIZE || done)) {
+                const header = queue.take(Math.min(HEADER_SIZE, queue.length));
+                if (isChunked(header)) {
+                    recordSize = NONCE_SIZE + new DataView(header.buffer).getUint32(4) + TAG_SIZE;
+                } else {
+                    legacy = true;
+                    queue.parts.unshift(header);
+                    queue.length += header.length;
+                }
+            }
+            // A full record is only known to be non-final once more bytes follow it.
+            while (recordSize && queue.length > recordSize) {
+                parts.push(await decryptChunk(queue.take(recordSize), index++, false, key));
+            }
+            if (done) break;
+        }
+
+        if (legacy) {
+            return decryptLegacy(queue.take(queue.length).buffer, key);
+        }
+        if (!recordSize || queue.length < NONCE_SIZE + TAG_SIZE) {
+            throw new Error("Truncated encrypted file");
+        }
+        parts.push(await decryptChunk(queue.take(queue.length), index, true, key));
+        return parts;
+    }
+
+    async function fetchAndDecrypt(url, key) {
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error(`Failed to fetch: ${url}`);
+        }
+        const reader = (response.body && response.body.getReader)
+            ? response.body.getReader()
+            : wholeBodyReader(await response.arrayBuffer());
+        return new Blob(await decryptStream(reader, key));
+    }
+
+    async function decryptBytes(bytes, key) {
+        return new Blob(await decryptStream(wholeBodyReader(bytes.buffer), key));
+    }
+
+    return { fetchAndDecrypt: fetchAndDecrypt, decryptBytes: decryptBytes };
+}
+
+// Pool of decryption workers sized from navigator.hardwareConcurrency. Workers fetch,
+// re-layout and decrypt off the main thread and post back a ready Blob. Returns null
+// when workers are unavailable; `broken` is set if a worker dies so callers fall back.
+function createWorkerPool(cryptoKey) {
+    if (!window.Worker || !window.Blob || !window.URL) return null;
+    const size = Math.max(1, Math.min(4, (navigator.hardwareConcurrency || 2) - 1));
+    const source = 'const decryptor = (' + createMediaDecryptor.toString() + ')();\n' +
+        'let key = null;\n' +
+        'self.onmessage = function(ev) {\n' +
+        '    const msg = ev.data;\n' +
+        '    if (msg.key) { key = msg.key; return; }\n' +
+        '    decryptor.fetchAndDecrypt(msg.url, key).then(\n' +
+        '        function(blob) { self.postMessage({ id: msg.id, blob: blob }); },\n' +
+        '        function(e) { self.postMessage({ id: msg.id, error: String((e && e.message) || e) }); });\n' +
+        '};\n';
+    const entries = [];
+    const pending = new Map();
+    let nextId = 0;
+    const pool = { size: size, broken: false };
+
+    try {
+        const workerUrl = URL.createObjectURL(new Blob([source], { type: 'text/javascript' }));
+        for (let i = 0; i < size; i++) {
+            const entry = { worker: new Worker(workerUrl), busy: 0 };
+            entry.worker.postMessage({ key: cryptoKey });
+            entries.push(entry);
+        }
+    } catch (e) {
+        console.warn("Decryption workers unavailable, decrypting on the main thread:", e);
+        entries.forEach(entry => entry.worker.terminate());
+        return null;
+    }
+
+    entries.forEach(entry => {
+        entry.worker.onmessage = function(ev) {
+            const job = pending.get(ev.data.id);
+            if (!job) return;
+            pending.delete(ev.data.id);
+            entry.busy--;
+            if (ev.data.error) { job.reject(new Error(ev.data.error)); } else { job.resolve(ev.data.blob); }
+        };
+        entry.worker.onerror = function(ev) {
+            console.warn("Decryption worker failed, falling back to the main thread:", ev.message || ev);
+            pool.broken = true;
+            pending.forEach((job, id) => {
+                if (job.entry === entry) { pending.delete(id); job.reject(new Error("worker failed")); }
+            });
+        };
+    });
+
+    pool.decrypt = function(url) {
+        const entry = entries.reduce((a, b) => (b.busy < a.busy ? b : a));
+        const id = nextId++;
+        entry.busy++;
+        return new Promise((resolve, reject) => {
+            pending.set(id, { resolve: resolve, reject: reject, entry: entry });
+            entry.worker.postMessage({ id: id, url: url });
+        });
+    };
+    return pool;
+}
+
+(async function() {
+    if (!window.ENC_KEY) {
+        console.log("No encryption key found.");
+        return;
+    }
+
+    const hexToBytes = (hex) => {
+        const bytes = new Uint8Array(hex.length / 2);
+        for (let c = 0; c < hex.length; c += 2) {
+            bytes[c / 2] = parseInt(hex.substr(c, 2), 16);
+        }
+        return bytes;
+    };
+
+    let cryptoKey;
+    try {
+        const keyBytes = hexToBytes(window.ENC_KEY);
+        cryptoKey = await window.crypto.subtle.importKey(
+            "raw", keyBytes, "AES-GCM", true, ["decrypt"]
+        );
+    } catch (e) {
+        console.error("Failed to import encryption key:", e);
+        return;
+    }
+
+    const elementsToDecrypt = document.querySelectorAll('[data-src-encrypted]');
+    const decryptor = createMediaDecryptor();
+    const workerPool = createWorkerPool(cryptoKey);
+
+    async function decryptToBlob(url) {
+        // Workers resolve relative URLs against their blob: URL, so pass an absolute one.
+        const absoluteUrl = new URL(url, document.baseURI).href;
+        if (workerPool && !workerPool.broken) {
+            try {
+                return await workerPool.decrypt(absoluteUrl);
+            } catch (e) {
+                if (!workerPool.broken) throw e;
+            }
+        }
+        return decryptor.fetchAndDecrypt(absoluteUrl, cryptoKey);
+    }
+
+    async function decryptMedia(element, url) {
+        try {
+            const blob = await decryptToBlob(url);
+            if (element.dataset.srcEncrypted !== url) {
+                return false;  // Swapped for the full image while this preview was loading.
+            }
+            const objectURL = URL.createObjectURL(blob);
+            element.src = objectURL;
+            element._objectURL = objectURL;
+            element.dataset.decrypted = 'true';
+            element.style.opacity = 1;
+            element.style.border = 'none';
+            return true;
+
+        } catch (e) {
+            console.error("Failed to decrypt:", url, e);
+            if (element.tagName === 'IMG') {
+                element.alt = "Decryption Failed";
+            }
+            return false;
+        }
+    }
+
+    /* Viewport-driven scheduling: images decrypt as they approach the viewport, with at
+       most MAX_CONCURRENT downloads in flight; audio/video decrypt only when played.
+       Object URLs are revoked once an element scrolls far away. */
+    const MAX_CONCURRENT = workerPool ? Math.max(4, workerPool.size * 2) : 4;
+    const queue = [];
+    let active = 0;
+
+    function pump() {
+        while (active < MAX_CONCURRENT && queue.length) {
+            const el = queue.shift();
+            if (el.posterOf) { startPoster(el.posterOf); continue; }
+            if (el._decryptState !== 'queued') continue;
+            const url = el.dataset.srcEncrypted;
+            el._decryptState = 'loading';
+            active++;
+            el._decryptPromise = decryptMedia(el, url).then(ok => {
+                if (el.dataset.srcEncrypted === url) el._decryptState = ok ? 'done' : 'failed';
+                return ok;
+            }).finally(() => { active--; pump(); });
+        }
+    }
+
+    function schedule(el, urgent) {
+        if (el._decryptState === 'loading' || el._decryptState === 'done') return;
+        if (el._decryptState !== 'queued') {
+            el._decryptState = 'queued';
+            el._decryptPromise = null;
+        } else if (!urgent) {
+            return;
+        }
+        if (urgent) { queue.unshift(el); } else { queue.push(el); }
+        pump();
+    }
+
+    // Video posters are decrypted like images, into the poster attribute, through the same queue.
+    function schedulePoster(video) {
+        if (video._posterState) return;
+        video._posterState = 'queued';
+        queue.push({ posterOf: video });
+        pump();
+    }
+
+    function startPoster(video) {
+        if (video._posterState !== 'queued') return;
+        video._posterState = 'loading';
+        active++;
+        decryptToBlob(video.dataset.posterEncrypted).then(blob => {
+            video._posterURL = URL.createObjectURL(blob);
+            video.poster = video._posterURL;
+            video._posterState = 'done';
+        }).catch(e => {
+            console.error("Failed to decrypt poster:", video.dataset.posterEncrypted, e);
+            video._posterState = 'failed';
+        }).finally(() => { active--; pump(); });
+    }
+
+    function whenDecrypted(el) {
+        schedule(el, true);
+        if (el._decryptPromise) return el._decryptPromise;
+        return new Promise(resolve => {
+            const poll = () => el._decryptPromise ? el._decryptPromise.then(resolve) : setTimeout(poll, 50);
+            poll();
+        });
+    }
+
+    function release(el) {
+        if (el._posterState === 'queued') el._posterState = null;
+        if (el._posterState === 'done' && el._posterURL) {
+            el.removeAttribute('poster');
+            URL.revokeObjectURL(el._posterURL);
+            el._posterURL = null;
+            el._posterState = null;
+        }
+        if (el._decryptState === 'queued') { el._decryptState = null; return; }
+        if (el._decryptState !== 'done' || !el._objectURL) return;
+        if ((el.tagName === 'AUDIO' || el.tagName === 'VIDEO') && !el.paused) return;
+        if (el.tagName !== 'IMG') el.dataset.resumeAt = String(el.currentTime || 0);
+        el.removeAttribute('src');
+        if (el.load && el.tagName !== 'IMG') el.load();
+        URL.revokeObjectURL(el._objectURL);
+        el._objectURL = null;
+        el._decryptState = null;
+        delete el.dataset.decrypted;
+        el.style.opacity = '';
+        el.style.border = '';
+    }
+
+    const isMedia = (el) => el.tagName === 'AUDIO' || el.tagName === 'VIDEO';
+    let nearObserver = null, farObserver = null;
+
+    // Audio/video: decrypt on first play (or pointer press, to get a head start), then resume.
+    document.addEventListener('play', function(ev) {
+        const el = ev.target;
+        if (!el.dataset || !el.dataset.srcEncrypted || el._decryptState === 'done') return;
+        whenDecrypted(el).then(ok => {
+            if (!ok) return;
+            if (el.dataset.resumeAt) { el.currentTime = parseFloat(el.dataset.resumeAt) || 0; delete el.dataset.resumeAt; }
+            el.play().catch(() => {});
+        });
+    }, true);
+    // Previews: on click, replace the decrypted thumbnail with the full-resolution image.
+    document.addEventListener('click', function(ev) {
+        const el = ev.target;
+        if (el.tagName !== 'IMG' || !el.dataset.full || !el.dataset.srcEncrypted) return;
+        el.dataset.srcEncrypted = el.dataset.full;
+        el.removeAttribute('data-full');
+        if (el._objectURL) { URL.revokeObjectURL(el._objectURL); el._objectURL = null; }
+        el._decryptState = null;
+        schedule(el, true);
+    });
+    document.addEventListener('pointerdown', function(ev) {
+        const el = ev.target;
+        if (el && el.dataset && el.dataset.srcEncrypted && isMedia(el)) schedule(el, true);
+    }, true);
+
+    // Rows of a virtualized page come and go; they register their media through these hooks.
+    window.archiveMediaDetach = (root) => root.querySelectorAll('[data-src-encrypted]').forEach(el => {
+        if (nearObserver) { nearObserver.unobserve(el); farObserver.unobserve(el); }
+        release(el);
+    });
+
+    if (!('IntersectionObserver' in window)) {
+        const decryptAll = (elements) => {
+            for (const el of elements) {
+                if (!isMedia(el)) schedule(el, false);
+                if (el.dataset.posterEncrypted) schedulePoster(el);
+            }
+        };
+        window.archiveMediaAttach = (root) => decryptAll(root.querySelectorAll('[data-src-encrypted]'));
+        decryptAll(elementsToDecrypt);
+        return;
+    }
+
+    nearObserver = new IntersectionObserver((entries) => {
+        entries.forEach(entry => {
+            const el = entry.target;
+            if (entry.isIntersecting) {
+                if (!isMedia(el)) schedule(el, false);
+                if (el.dataset.posterEncrypted) schedulePoster(el);
+            } else {
+                if (el._decryptState === 'queued') el._decryptState = null;
+                if (el._posterState === 'queued') el._posterState = null;
+            }
+        });
+    }, { rootMargin: '800px 0px' });
+    farObserver = new IntersectionObserver((entries) => {
+        entries.forEach(entry => { if (!entry.isIntersecting) release(entry.target); });
+    }, { rootMargin: '5000px 0px' });
+
+    window.archiveMediaAttach = (root) => root.querySelectorAll('[data-src-encrypted]').forEach(el => {
+        nearObserver.observe(el);
+        farObserver.observe(el);
+    });
+    for (const el of elementsToDecrypt) {
+        nearObserver.observe(el);
+        farObserver.observe(el);
+    }
+})();
+'''
+
+# Sharded archives: loads <stem>_search.js (a plain script, so it also works from file://).
+JS_SEARCH_LOADER = r'''
+let archiveSearchPromise = null;
+function loadArchiveSearch() {
+    if (!archiveSearchPromise) {
+        archiveSearchPromise = new Promise((resolve, reject) => {
+            const script = document.createElement('script');
+            script.src = SEARCH_SCRIPT;
+            script.onload = () => resolve(window.ARCHIVE_SEARCH);
+            script.onerror = () => { archiveSearchPromise = null; reject(new Error('search data unavailable')); };
+            document.head.appendChild(script);
+        });
+    }
+    return archiveSearchPromise;
+}
+// Search entries matching every query token at a word start, as the page's own search does;
+// each entry's text is folded once, on first use.
+function archiveSearchMatches(data, q) {
+    const patterns = searchTokens(q).map(term => new RegExp('(?:^|[^\\p{L}\\p{N}_])' + term, 'u'));
+    if (!patterns.length) return [];
+    if (!data.folded) data.folded = data.entries.map(entry => foldText(entry[2]));
+    return data.entries.filter((entry, k) => patterns.every(re => re.test(data.folded[k])));
+}
+'''
+
+# One page of a sharded archive: matches on other pages, and #q= / #msg- deep links.
+JS_SHARD = JS_SEARCH_LOADER + r'''
+(function() {
+    const input = document.getElementById('q');
+    const box = document.getElementById('shard-results');
+    const thisPage = decodeURIComponent(location.pathname.split('/').pop());
+    let timer = null;
+
+    function showOtherPages(q) {
+        if (!q || /^(?:#|message|msg)?\s*\d+\s*$/i.test(q)) {
+            box.hidden = true;
+            box.textContent = '';
+            return;
+        }
+        loadArchiveSearch().then(data => {
+            if (input.value.trim().toLowerCase() !== q) return;
+            const counts = new Map();
+            for (const [page] of archiveSearchMatches(data, q)) {
+                counts.set(page, (counts.get(page) || 0) + 1);
+            }
+            box.textContent = '';
+            data.pages.forEach((p, idx) => {
+                if (p.file === thisPage || !counts.has(idx)) return;
+                box.append(box.childNodes.length ? ' · ' : HTML_SHARD_OTHER_PAGES + ' ');
+                const a = document.createElement('a');
+                a.href = encodeURI(p.file) + '#q=' + encodeURIComponent(q);
+                a.textContent = p.label + ' (' + counts.get(idx) + ')';
+                box.append(a);
+            });
+            box.hidden = !box.childNodes.length;
+        }).catch(() => { box.hidden = true; });
+    }
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const q = input.value.trim().toLowerCase();
+        timer = setTimeout(() => showOtherPages(q), 300);
+    });
+
+    function openHash() {
+        const hash = decodeURIComponent(location.hash.slice(1));
+        if (hash.startsWith('q=')) {
+            input.value = hash.slice(2);
+            filterMessages();
+            showOtherPages(input.value.trim().toLowerCase());
+        } else if (hash.startsWith('msg-') && typeof revealMessage === 'function') {
+            revealMessage(hash.slice(4));
+        } else if (hash.startsWith('msg-')) {
+            const el = document.querySelector('.msg[data-msg-id="' + CSS.escape(hash.slice(4)) + '"]');
+            if (el) {
+                el.classList.add('msg-highlight');
+                el.scrollIntoView({ block: 'center' });
+            }
+        }
+    }
+    window.addEventListener('hashchange', openHash);
+    if (location.hash) openHash();
+})();
+'''
+
+# Index page of a sharded archive: search across every page.
+JS_INDEX = JS_SEARCH_TEXT + JS_SEARCH_LOADER + r'''
+(function() {
+    const MAX_RESULTS = 200;
+    const input = document.getElementById('q');
+    const list = document.getElementById('index-results');
+    let timer = null;
+
+    // Around the first word starting like the first query token (positions taken from the
+    // folded text, which can differ slightly in length from the original).
+    function snippet(text, q) {
+        const term = searchTokens(q)[0];
+        const at = Math.max(0, foldText(text).search(new RegExp('(?:^|[^\\p{L}\\p{N}_])' + term, 'u')));
+        const start = Math.max(0, at - 60);
+        return (start ? '…' : '') + text.slice(start, at + term.length + 100);
+    }
+
+    function search() {
+        const q = input.value.trim().toLowerCase();
+        list.textContent = '';
+        if (!q) return;
+        loadArchiveSearch().then(data => {
+            if (input.value.trim().toLowerCase() !== q) return;
+            let found = 0;
+            for (const [page, msgId, text] of archiveSearchMatches(data, q)) {
+                if (++found > MAX_RESULTS) break;
+                const li = document.createElement('li');
+                const a = document.createElement('a');
+                a.href = encodeURI(data.pages[page].file) + '#msg-' + encodeURIComponent(msgId);
+                a.textContent = data.pages[page].label;
+                li.append(a, ' ', snippet(text, q));
+                list.append(li);
+            }
+            const note = document.createElement('li');
+            note.className = 'index-note';
+            if (!found) note.textContent = HTML_INDEX_NO_RESULTS;
+            else if (found > MAX_RESULTS) note.textContent = HTML_INDEX_MORE_RESULTS.replace('{count}', MAX_RESULTS);
+            if (note.textContent) list.append(note);
+        }).catch(() => {});
+    }
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(search, 300);
+    });
+})();
+'''
+
+# Virtualized page: rows are built from the JSON payload near the viewport only. The
+# functions below replace their DOM-walking namesakes in JS_FUNCTIONS and keep state in
+# arrays indexed by message; storage keys and formats are unchanged, so saved state is
+# shared with regular pages.
+JS_VIRTUAL = r'''
+const ROWS = JSON.parse(document.getElementById('msg-data').textContent);
+const ROW_COUNT = ROWS.length;
+const ROW_ESTIMATE = 120;
+const OVERSCAN_PX = 1200;
+
+const rowIndexById = new Map();
+const rowIndexByNumber = new Map();
+const rowSelected = new Uint8Array(ROW_COUNT);
+const rowDeleted = new Uint8Array(ROW_COUNT);
+const rowPriority = new Array(ROW_COUNT).fill('none');
+const rowNotes = new Map();   // message index -> sanitized note HTML
+const rowEdits = new Map();   // transcription <pre> id -> edited text
+const rowAngles = new Map();  // image id -> rotation in degrees
+const rowSearchText = new Array(ROW_COUNT);
+
+ROWS.forEach((r, i) => {
+    rowIndexById.set(r.i, i);
+    rowIndexByNumber.set(r.n, i);
+    // State baked into a pruned export.
+    if (r.sel) rowSelected[i] = 1;
+    if (r.del) rowDeleted[i] = 1;
+    if (r.pr) rowPriority[i] = r.pr;
+    if (r.nt) rowNotes.set(i, r.nt);
+    if (r.ed !== undefined) rowEdits.set('transcription-pre-' + r.i, r.ed);
+});
+
+const vs = {
+    top: document.getElementById('vs-top'),
+    rows: document.getElementById('vs-rows'),
+    bottom: document.getElementById('vs-bottom'),
+    heights: new Float64Array(ROW_COUNT).fill(ROW_ESTIMATE),
+    visible: new Int32Array(0),     // message indices passing the current filter
+    offsets: new Float64Array(1),   // offsets[k] = total height of visible[0..k)
+    start: 0,
+    end: 0,
+    rendered: new Map(),            // message index -> row element
+    query: '',
+    terms: [],
+    rowMargin: null,
+    frame: 0,
+};
+
+function escapeText(s) {
+    return String(s).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+}
+function rowMetaText(r) {
+    return (r.nm ? r.nm + ' · ' : '') + r.d + ' (' + r.g + ')';
+}
+function rowText(i) {
+    if (rowDeleted[i]) return HTML_MESSAGE_DELETED.replace('{num}', ROWS[i].n).toLowerCase();
+    if (rowSearchText[i] === undefined) {
+        const r = ROWS[i];
+        rowSearchText[i] = (rowMetaText(r) + '\n' + (r.t || '') + '\n' + (r.tr || '')).toLowerCase();
+    }
+    return rowSearchText[i];
+}
+function noteText(html) {
+    const scratch = document.createElement('div');
+    scratch.innerHTML = html;
+    return scratch.textContent.trim();
+}
+function rowHasIntervention(i) {
+    return rowPriority[i] !== 'none' || (rowNotes.has(i) && noteText(rowNotes.get(i)).length > 0);
+}
+function rowIndexOf(el) {
+    const msg = el.closest('.msg');
+    return msg ? parseInt(msg.dataset.index, 10) : -1;
+}
+
+function buildRow(i) {
+    const r = ROWS[i];
+    const meta = (r.nm ? '<span class="name">' + escapeText(r.nm) + '</span> · ' : '')
+        + escapeText(r.d) + ' (<b>' + escapeText(r.g) + '</b>)';
+    const wrap = document.createElement('div');
+    wrap.innerHTML = '<div class="msg' + (r.x ? ' msg-external' : '') + (r.p !== undefined ? ' p' + r.p : '') + '"'
+        + ' data-msg-id="' + r.i + '" data-original-number="' + r.n + '" data-index="' + i + '">'
+        + '<div class="msg-number">' + r.n + '</div>'
+        + '<div class="msg-body"><input type="checkbox" id="cb-' + r.i + '">'
+        + '<div class="msg-main"><div class="msg-priority-marker" data-priority="none"></div>'
+        + '<div class="meta">' + meta + '</div>'
+        + '<div class="content">' + escapeText(r.t || '') + '</div>'
+        + (r.m || '') + '</div>'
+        + '<div class="msg-note empty" id="note-' + r.i + '" contenteditable="true"></div></div>'
+        + '<div class="msg-deleted-placeholder" aria-hidden="true"></div></div>';
+    const row = wrap.firstElementChild;
+    projectRow(row, i);
+    return row;
+}
+
+// Copy the in-memory state of message i onto its row element.
+function projectRow(row, i) {
+    const r = ROWS[i];
+    row.querySelector('.msg-body input[type="checkbox"]').checked = !!rowSelected[i];
+    row.querySelector('.msg-priority-marker').dataset.priority = rowPriority[i];
+    const note = row.querySelector('.msg-note');
+    if (rowNotes.has(i) && document.activeElement !== note) {
+        note.innerHTML = rowNotes.get(i);
+        const has = note.innerText.trim().length > 0;
+        note.classList.toggle('empty', !has);
+        note.classList.toggle('has-content', has);
+    }
+    const pre = row.querySelector('pre[id^="transcription-pre-"]');
+    if (pre && rowEdits.has(pre.id) && document.activeElement !== pre) {
+        pre.innerText = rowEdits.get(pre.id);
+        pre.removeAttribute('data-lazy');
+    }
+    row.querySelectorAll('img[id]').forEach(img => {
+        if (rowAngles.has(img.id)) {
+            img.style.transform = 'rotate(' + rowAngles.get(img.id) + 'deg)';
+            img.setAttribute('data-angle', rowAngles.get(img.id));
+        }
+    });
+    const deleted = !!rowDeleted[i];
+    const placeholder = row.querySelector('.msg-deleted-placeholder');
+    row.classList.toggle('msg-deleted', deleted);
+    if (deleted) row.dataset.deleted = 'true'; else delete row.dataset.deleted;
+    row.querySelector('.msg-body').style.display = deleted ? 'none' : '';
+    placeholder.style.display = deleted ? 'block' : 'none';
+    placeholder.textContent = deleted ? HTML_MESSAGE_DELETED.replace('{num}', r.n) : '';
+    if (deleted) placeholder.removeAttribute('aria-hidden'); else placeholder.setAttribute('aria-hidden', 'true');
+    if (vs.query) highlightRow(row);
+}
+
+function highlightRow(row) {
+    const apply = () => {
+        if (!vs.query) return;
+        row.querySelectorAll('.content, .msg-deleted-placeholder, .trans pre').forEach(el => highlightFolded(el, vs.terms));
+    };
+    if (row.querySelector('pre[data-lazy]')) fillTranscripts(row).then(apply); else apply();
+}
+
+/* --- Virtual scroller: spacers above and below stand in for rows that are not rendered --- */
+function vsRecomputeOffsets(fromK) {
+    const n = vs.visible.length;
+    if (vs.offsets.length !== n + 1) { vs.offsets = new Float64Array(n + 1); fromK = 0; }
+    for (let k = fromK; k < n; k++) vs.offsets[k + 1] = vs.offsets[k] + vs.heights[vs.visible[k]];
+}
+function vsFind(y) {
+    let lo = 0, hi = vs.visible.length;
+    while (lo < hi) {
+        const mid = (lo + hi + 1) >> 1;
+        if (vs.offsets[mid] <= y) lo = mid; else hi = mid - 1;
+    }
+    return Math.min(lo, Math.max(0, vs.visible.length - 1));
+}
+function vsDetach(i) {
+    const row = vs.rendered.get(i);
+    if (!row) return;
+    if (window.archiveMediaDetach) window.archiveMediaDetach(row);
+    if (window.vsResizeObserver) window.vsResizeObserver.unobserve(row);
+    row.remove();
+    vs.rendered.delete(i);
+}
+function vsAttach(row) {
+    if (window.archiveMediaAttach) window.archiveMediaAttach(row);
+    if (window.vsResizeObserver) window.vsResizeObserver.observe(row);
+}
+function vsSpacers() {
+    const n = vs.visible.length;
+    vs.top.style.height = vs.offsets[vs.start] + 'px';
+    vs.bottom.style.height = (vs.offsets[n] - vs.offsets[vs.end]) + 'px';
+}
+// Re-measure rendered rows; rows above the viewport that changed size are compensated by scrolling.
+function vsMeasure() {
+    let minK = -1, shift = 0;
+    for (let k = vs.start; k < vs.end; k++) {
+        const i = vs.visible[k];
+        const row = vs.rendered.get(i);
+        if (!row || !row.isConnected) continue;
+        if (vs.rowMargin === null) {
+            const cs = getComputedStyle(row);
+            vs.rowMargin = parseFloat(cs.marginTop) + parseFloat(cs.marginBottom);
+        }
+        const h = row.offsetHeight + vs.rowMargin;
+        if (h !== vs.heights[i]) {
+            if (row.getBoundingClientRect().bottom < 0) shift += h - vs.heights[i];
+            vs.heights[i] = h;
+            if (minK < 0) minK = k;
+        }
+    }
+    if (minK >= 0) {
+        vsRecomputeOffsets(minK);
+        vsSpacers();
+    }
+    return shift;
+}
+function vsRender() {
+    vs.frame = 0;
+    const n = vs.visible.length;
+    if (!n) {
+        Array.from(vs.rendered.keys()).forEach(vsDetach);
+        vs.start = vs.end = 0;
+        vsSpacers();
+        return;
+    }
+    const listTop = vs.top.getBoundingClientRect().top;
+    const start = vsFind(Math.max(0, -listTop - OVERSCAN_PX));
+    const end = Math.min(n, vsFind(-listTop + window.innerHeight + OVERSCAN_PX) + 1);
+    const keep = new Set();
+    for (let k = start; k < end; k++) keep.add(vs.visible[k]);
+    Array.from(vs.rendered.keys()).forEach(i => { if (!keep.has(i)) vsDetach(i); });
+
+    // Rendered rows form one contiguous run; add new rows before and after it.
+    let firstKept = -1, lastKept = -1;
+    for (let k = start; k < end; k++) {
+        if (vs.rendered.has(vs.visible[k])) { if (firstKept < 0) firstKept = k; lastKept = k; }
+    }
+    const before = document.createDocumentFragment(), after = document.createDocumentFragment();
+    const added = [];
+    let prependedEstimate = 0;
+    for (let k = start; k < end; k++) {
+        const i = vs.visible[k];
+        if (vs.rendered.has(i)) continue;
+        const row = buildRow(i);
+        vs.rendered.set(i, row);
+        added.push(row);
+        if (firstKept >= 0 && k < firstKept) { before.appendChild(row); prependedEstimate += vs.heights[i]; }
+        else after.appendChild(row);
+    }
+    vs.rows.insertBefore(before, vs.rows.firstChild);
+    vs.rows.appendChild(after);
+    added.forEach(vsAttach);
+    vs.start = start;
+    vs.end = end;
+    vsSpacers();
+
+    // Rows added above the ones on screen replace estimated heights with real ones.
+    let prependedReal = 0;
+    if (prependedEstimate) {
+        for (let k = start; k < firstKept; k++) prependedReal += vs.rendered.get(vs.visible[k]).offsetHeight + (vs.rowMargin || 0);
+    }
+    vsMeasure();
+    if (prependedEstimate) window.scrollBy(0, prependedReal - prependedEstimate);
+}
+function vsSchedule() {
+    if (!vs.frame) vs.frame = requestAnimationFrame(vsRender);
+}
+// Rebuild the visible list and every rendered row (after filtering or bulk state changes).
+function vsRefresh(predicate) {
+    const out = [];
+    for (let i = 0; i < ROW_COUNT; i++) if (!predicate || predicate(i)) out.push(i);
+    vs.visible = Int32Array.from(out);
+    vsRecomputeOffsets(0);
+    Array.from(vs.rendered.keys()).forEach(vsDetach);
+    vs.start = vs.end = 0;
+    vsRender();
+}
+function vsReproject() {
+    vs.rendered.forEach((row, i) => projectRow(row, i));
+}
+function vsScrollTo(i, highlight) {
+    let k = vs.visible.indexOf(i);
+    if (k < 0) { vs.query = ''; vsRefresh(null); k = i; }
+    const listTop = vs.top.getBoundingClientRect().top + window.scrollY;
+    window.scrollTo(0, listTop + vs.offsets[k] - window.innerHeight / 3);
+    vsRender();
+    const row = vs.rendered.get(i);
+    if (row) {
+        if (highlight) row.classList.add('msg-highlight');
+        row.scrollIntoView({ block: 'center' });
+    }
+}
+function revealMessage(msgId) {
+    const i = rowIndexById.get(msgId);
+    if (i !== undefined) vsScrollTo(i, true);
+}
+
+/* --- Replacements for the DOM-walking functions of the regular page --- */
+function filterMessages() {
+    const input = document.getElementById('q').value.trim();
+    const q = input.toLowerCase();
+    const numMatch = input.match(/^(?:#|message|msg)?\s*(\d+)\s*$/i);
+    if (numMatch) {
+        vs.query = '';
+        vsRefresh(showOnlyInterventions ? rowHasIntervention : null);
+        const i = rowIndexByNumber.get(parseInt(numMatch[1], 10));
+        if (i !== undefined) vsScrollTo(i, true);
+        return;
+    }
+    const found = q ? searchMatches(q, ROW_COUNT) : null;
+    vs.query = q;
+    vs.terms = found ? found.terms : searchTokens(q);
+    vsRefresh(i => (!q || (found ? found.mask[i] === 1 : rowText(i).includes(q)))
+        && (!showOnlyInterventions || rowHasIntervention(i)));
+}
+function updateMessageNumbers() { vsReproject(); vsSchedule(); }
+function selectAll() { rowSelected.fill(1); vsReproject(); }
+function clearAll() { rowSelected.fill(0); vsReproject(); }
+function invertSel() { for (let i = 0; i < ROW_COUNT; i++) rowSelected[i] ^= 1; vsReproject(); }
+function deleteSelected() {
+    for (let i = 0; i < ROW_COUNT; i++) {
+        if (!rowSelected[i] || rowDeleted[i]) continue;
+        rowDeleted[i] = 1;
+        rowSearchText[i] = undefined;
+        stateSet('deleted', ROWS[i].i, 1);
+    }
+    vsReproject();
+    vsMeasure();
+}
+function rotateImage(id) {
+    const img = document.getElementById(id);
+    const angle = (rowAngles.get(id) || 0) + 90;
+    rowAngles.set(id, angle);
+    if (img) { img.style.transform = 'rotate(' + angle + 'deg)'; img.setAttribute('data-angle', angle); }
+}
+function pageHasMessage(msgId) { return rowIndexById.has(msgId); }
+function searchOrdinalId(i) { return ROWS[i].i; }
+function saveEdit(element) {
+    rowEdits.set(element.id, element.innerText);
+    stateSet('edit', transcriptId(element), element.innerText);
+}
+function loadEdits() {
+    stateStore.maps.edit.forEach((text, id) => {
+        const i = rowIndexById.get(id);
+        if (i !== undefined && (ROWS[i].tr !== undefined || ROWS[i].lz)) rowEdits.set('transcription-pre-' + id, text);
+    });
+}
+function saveCheckboxStates() {
+    for (let i = 0; i < ROW_COUNT; i++) {
+        const id = ROWS[i].i;
+        if (!!rowSelected[i] !== stateStore.maps.selected.has(id)) stateSet('selected', id, rowSelected[i] ? 1 : undefined);
+    }
+    flushState().then(() => alert(HTML_STATES_SAVED)).catch(e => {
+        console.error("Failed to save checkbox states:", e);
+        alert("Error saving states. Browser storage might be full or disabled.");
+    });
+}
+function loadCheckboxStates() {
+    stateStore.maps.selected.forEach((on, id) => {
+        const i = rowIndexById.get(id);
+        if (i !== undefined) rowSelected[i] = 1;
+    });
+}
+function resetCheckboxStates() {
+    stateClear('selected');
+    rowSelected.fill(0);
+    vsReproject();
+    flushState().catch(e => console.error("Failed to reset checkbox states:", e));
+    alert(HTML_STATES_RESET);
+}
+function onNoteInput(el) {
+    const has = el.innerText.trim().length > 0;
+    if (!has) { el.innerHTML = ''; el.classList.add('empty'); } else { el.classList.remove('empty'); }
+    el.classList.toggle('has-content', has);
+    const i = rowIndexOf(el);
+    if (i < 0) return;
+    if (has) rowNotes.set(i, sanitizeNoteHtml(el.innerHTML)); else rowNotes.delete(i);
+    stateSet('note', ROWS[i].i, rowNotes.get(i));
+}
+function loadNotes() {
+    stateStore.maps.note.forEach((html, id) => {
+        const i = rowIndexById.get(id);
+        if (i !== undefined && !rowNotes.has(i)) rowNotes.set(i, sanitizeNoteHtml(html));
+    });
+}
+function cyclePriority(marker) {
+    const i = rowIndexOf(marker);
+    const next = PRIORITIES[(PRIORITIES.indexOf(marker.dataset.priority || 'none') + 1) % PRIORITIES.length];
+    marker.dataset.priority = next;
+    if (i < 0) return;
+    rowPriority[i] = next;
+    stateSet('priority', ROWS[i].i, next === 'none' ? undefined : next);
+}
+function loadPriorities() {
+    stateStore.maps.priority.forEach((priority, id) => {
+        const i = rowIndexById.get(id);
+        if (i !== undefined) rowPriority[i] = priority || 'none';
+    });
+}
+function loadDeletedStates() {
+    stateStore.maps.deleted.forEach((on, id) => {
+        const i = rowIndexById.get(id);
+        if (i !== undefined) rowDeleted[i] = 1;
+    });
+}
+function getReportEntries() {
+    const entries = [];
+    for (let i = 0; i < ROW_COUNT; i++) {
+        if (!rowHasIntervention(i)) continue;
+        const r = ROWS[i];
+        const isDeleted = !!rowDeleted[i];
+        const pre = 'transcription-pre-' + r.i;
+        entries.push({
+            metaText: rowMetaText(r), num: String(r.n), name: r.nm || '',
+            note: rowNotes.has(i) ? noteText(rowNotes.get(i)) : '', priority: rowPriority[i],
+            content: isDeleted ? REPORT_MESSAGE_HIDDEN : (r.t || '').trim(),
+            transcription: isDeleted ? '' : (rowEdits.has(pre) ? rowEdits.get(pre) : (rowTranscript(r) || '')).trim(),
+            isDeleted: isDeleted,
+        });
+    }
+    return entries;
+}
+function rowTranscript(r) {
+    return r.lz ? (loadedTranscripts || {})[r.i] : r.tr;
+}
+// Pruned export: the same virtualized page, with the current state baked into the payload.
+function bakedRow(i) {
+    const r = ROWS[i];
+    const out = Object.assign({}, r);
+    if (r.lz && loadedTranscripts) {
+        // Inline sidecar transcriptions so the export stands on its own.
+        const text = loadedTranscripts[r.i] || '';
+        delete out.lz;
+        out.tr = text;
+        out.m = r.m.replace(' data-lazy></pre>', '>' + escapeText(text) + '</pre>');
+    }
+    if (rowSelected[i]) out.sel = 1;
+    if (rowDeleted[i]) out.del = 1;
+    if (rowPriority[i] !== 'none') out.pr = rowPriority[i];
+    if (rowNotes.has(i)) out.nt = rowNotes.get(i);
+    const pre = 'transcription-pre-' + r.i;
+    if (rowEdits.has(pre)) out.ed = rowEdits.get(pre);
+    return out;
+}
+function exportContainer(container, parts) {
+    parts.push(openTag(container), '<div id="vs-top"></div><div id="vs-rows"></div><div id="vs-bottom"></div>\n',
+        '<script type="application/json" id="msg-data">[');
+    return renderInSlices(ROW_COUNT, i => (i ? ',' : '') + '\n'
+        + JSON.stringify(bakedRow(i)).replace(/<\//g, '<\\/').replace(/<!--/g, '<\\u0021--'), parts)
+        .then(() => parts.push(']<\/script></div>'));
+}
+function collectPageState() {
+    const state = { selected: [], deleted: prunedIds(), notes: {}, priorities: {}, edits: {} };
+    for (let i = 0; i < ROW_COUNT; i++) {
+        const id = ROWS[i].i;
+        if (rowSelected[i]) state.selected.push(id);
+        if (rowDeleted[i]) state.deleted.push(id);
+        if (rowPriority[i] !== 'none') state.priorities[id] = rowPriority[i];
+        if (rowNotes.has(i)) state.notes[id] = rowNotes.get(i);
+    }
+    rowEdits.forEach((text, pre) => { state.edits[pre.slice('transcription-pre-'.length)] = text; });
+    return state;
+}
+
+if ('ResizeObserver' in window) {
+    // Images and expanded transcriptions change row heights after rendering.
+    window.vsResizeObserver = new ResizeObserver(() => {
+        const shift = vsMeasure();
+        if (shift) window.scrollBy(0, shift);
+    });
+}
+// The scroller compensates for height changes itself (vsRender/vsMeasure).
+document.documentElement.style.overflowAnchor = 'none';
+window.addEventListener('scroll', vsSchedule, { passive: true });
+document.querySelector('.container').addEventListener('change', ev => {
+    if (!ev.target.matches('.msg-body > input[type="checkbox"]')) return;
+    const i = rowIndexOf(ev.target);
+    if (i >= 0) rowSelected[i] = ev.target.checked ? 1 : 0;
+});
+window.addEventListener('resize', vsSchedule);
+vsRefresh(null);
+'''
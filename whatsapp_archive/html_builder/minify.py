@@ -0,0 +1,311 @@
+"""Minified output for hosted archives.
+
+minify_css and minify_js drop comments and the whitespace the code does not need;
+strings, template literals and regular expressions are copied as they are, and line
+breaks that may end a statement are kept (no semicolons are inserted). MinifyingWriter
+wraps the stream a page is written to: it minifies the page's <style> and <script>
+elements and collapses whitespace between tags where it cannot show, leaving elements
+that keep their whitespace (<pre>, message text, notes) and JSON payloads untouched.
+"""
+import re
+from functools import lru_cache
+from typing import Optional, TextIO
+
+_WHITESPACE = " \t\r\n\f\v"
+_TAG_NAME_RE = re.compile(r"<(/?)([A-Za-z][A-Za-z0-9-]*)")
+_TYPE_RE = re.compile(r'\stype="([^"]*)"')
+
+# A "/" after one of these starts a regular expression, not a division.
+_JS_REGEX_AFTER = set("(,=:[!&|?{};+-*%<>~^")
+_JS_REGEX_AFTER_WORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+                         "throw", "case", "do", "else", "yield", "await"}
+# Between these and the next token a line break cannot end a statement.
+_JS_OPENERS = set("{[(,;:")
+_JS_CLOSERS = set(")]},;.")
+_CSS_TIGHT = set("{};,>")
+
+# Whitespace before these tags does not render (it ends a line, or sits between block
+# boxes); other runs between tags render as one space.
+BLOCK_TAGS = (
+    "html", "head", "body", "meta", "link", "title", "style", "script", "div", "p", "ul", "ol",
+    "li", "table", "tr", "th", "td", "h1", "h2", "h3", "h4", "h5", "h6", "details", "summary",
+    "pre", "br", "hr", "audio", "video", "source",
+)
+_BLOCK = "|".join(BLOCK_TAGS)
+_BEFORE_BLOCK_RE = re.compile(rf"(?<=>)[ \t\r\n\f]+(?=</?(?:{_BLOCK})[\s/>])")
+_BETWEEN_RE = re.compile(r"(?<=>)[ \t\r\n\f]{2,}(?=<)")
+# Elements handled on their own: scripts and styles (minified as code, or copied when
+# they hold JSON), and elements whose content is copied as it is (white-space: pre-wrap
+# in the archive's CSS: message text, notes, transcriptions).
+_SPECIAL_RE = re.compile(r'<(?:script|style|pre|textarea)\b[^>]*>'
+                         r'|<[A-Za-z][\w-]*\s(?:[^>]*\s)?(?:contenteditable\b|class="(?:[^"]*\s)?(?:content|msg-note)[\s"])[^>]*>')
+_JS_TYPES = ("", "module", "text/javascript")
+
+
+def _is_word(c: str) -> bool:
+    return c.isalnum() or c in "_$" or ord(c) > 127
+
+
+def _js_template(code: str, i: int) -> tuple[int, bool]:
+    """From inside a template literal at `i`: (index after its end or after "${", whether
+    a substitution starts there)."""
+    n = len(code)
+    while i < n:
+        c = code[i]
+        if c == "\\":
+            i += 2
+        elif c == "`":
+            return i + 1, False
+        elif c == "$" and code.startswith("${", i):
+            return i + 2, True
+        else:
+            i += 1
+    return n, False
+
+
+@lru_cache(maxsize=64)
+def minify_js(code: str) -> str:
+    out: list[str] = []
+    n = len(code)
+    i = 0
+    depth = 0
+    substitutions: list[int] = []  # brace depth at each open template substitution
+    pending = ""  # whitespace since the last token: "", " " or "\n"
+    last = ""  # last token, for telling regular expressions from divisions
+
+    def push(token: str) -> None:
+        nonlocal pending
+        if pending and out:
+            prev, nxt = out[-1][-1], token[0]
+            if pending == "\n" and prev not in _JS_OPENERS and nxt not in _JS_CLOSERS:
+                out.append("\n")
+            elif ((_is_word(prev) and _is_word(nxt)) or (prev in "+-" and nxt in "+-")
+                  or (prev == "/" and nxt in "/*") or (prev.isdigit() and nxt == ".")):
+                out.append(" ")
+        pending = ""
+        out.append(token)
+
+    while i < n:
+        c = code[i]
+        if c in _WHITESPACE:
+            j = i
+            while j < n and code[j] in _WHITESPACE:
+                j += 1
+            pending = "\n" if pending == "\n" or "\n" in code[i:j] else " "
+            i = j
+        elif code.startswith("//", i):
+            j = code.find("\n", i)
+            i = n if j < 0 else j
+            pending = pending or " "
+        elif code.startswith("/*", i):
+            j = code.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            pending = "\n" if pending == "\n" or "\n" in code[i:j] else " "
+            i = j
+        elif c in "'\"":
+            j = i + 1
+            while j < n and code[j] != c:
+                j += 2 if code[j] == "\\" else 1
+            push(code[i:j + 1])
+            last = c
+            i = j + 1
+        elif c == "`":
+            j, opened = _js_template(code, i + 1)
+            push(code[i:j])
+            if opened:
+                substitutions.append(depth)
+            last = "`"
+            i = j
+        elif c == "}" and substitutions and depth == substitutions[-1]:
+            # End of a ${...} substitution: back inside the template literal.
+            substitutions.pop()
+            j, opened = _js_template(code, i + 1)
+            pending = ""
+            out.append(code[i:j])
+            if opened:
+                substitutions.append(depth)
+            last = "`"
+            i = j
+        elif c == "/" and (not last or last in _JS_REGEX_AFTER or last in _JS_REGEX_AFTER_WORDS):
+            j = i + 1
+            in_class = False
+            while j < n and (code[j] != "/" or in_class):
+                if code[j] == "\\":
+                    j += 1
+                elif code[j] == "[":
+                    in_class = True
+                elif code[j] == "]":
+                    in_class = False
+                j += 1
+            j += 1
+            while j < n and _is_word(code[j]):
+                j += 1
+            push(code[i:j])
+            last = ")"  # a value: a "/" after it divides
+            i = j
+        elif _is_word(c):
+            j = i + 1
+            while j < n and _is_word(code[j]):
+                j += 1
+            last = code[i:j]
+            push(last)
+            i = j
+        else:
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+            push(c)
+            last = c
+            i += 1
+    return "".join(out).strip()
+
+
+@lru_cache(maxsize=64)
+def minify_css(css: str) -> str:
+    out: list[str] = []
+    n = len(css)
+    i = 0
+    space = False
+    while i < n:
+        c = css[i]
+        if c in _WHITESPACE:
+            space = True
+            i += 1
+        elif css.startswith("/*", i):
+            j = css.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+            space = True
+        else:
+            if c in "'\"":
+                j = i + 1
+                while j < n and css[j] != c:
+                    j += 2 if css[j] == "\\" else 1
+                token = css[i:j + 1]
+                i = j + 1
+            else:
+                token = c
+                i += 1
+            if c == "}" and out and out[-1] == ";":
+                out.pop()
+            if space and out and out[-1][-1] not in _CSS_TIGHT and out[-1][-1] != ":" and c not in _CSS_TIGHT:
+                out.append(" ")
+            space = False
+            out.append(token)
+    return "".join(out)
+
+
+def _saved(before: str, after: str) -> int:
+    return len(before.encode("utf-8")) - len(after.encode("utf-8"))
+
+
+class MinifyingWriter:
+    """Text stream wrapper: HTML written to it reaches `out` minified. Call finish() once
+    the page is complete. `bytes_saved` counts what was left out.
+
+    Markup between the elements handled on their own (scripts, styles and kept elements)
+    goes through two regular expressions, which is what keeps this fast on pages with a
+    hundred thousand messages: whitespace before a block tag is dropped, other runs
+    between tags become one space. Text with anything but whitespace in it is kept.
+    """
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.bytes_saved = 0
+        self._pending = ""  # input not handled yet
+        self._carry = ""  # last tag written, which decides the whitespace after it
+        self._raw: Optional[tuple[str, str]] = None  # (element, "js" / "css" / "") inside script/style
+        self._raw_parts: list[str] = []
+        self._keep: Optional[list] = None  # [element, nesting] inside an element kept as it is
+
+    def write(self, text: str) -> int:
+        self._pending += text
+        self._process(final=False)
+        return len(text)
+
+    def finish(self) -> None:
+        self._process(final=True)
+
+    def _markup(self, text: str) -> str:
+        """Minify markup following self._carry (already written)."""
+        joined = self._carry + text
+        minified = _BETWEEN_RE.sub(" ", _BEFORE_BLOCK_RE.sub("", joined))
+        self.bytes_saved += len(joined) - len(minified)  # whitespace only: one byte per character
+        return minified[len(self._carry):]
+
+    def _end_raw(self, content: str) -> str:
+        kind = self._raw[1]
+        self._raw = None
+        minified = minify_js(content) if kind == "js" else minify_css(content)
+        self.bytes_saved += _saved(content, minified)
+        return minified
+
+    def _process(self, final: bool) -> None:
+        buf = self._pending
+        n = len(buf)
+        pos = 0
+        emit: list[str] = []
+        while pos < n:
+            if self._raw:
+                name, kind = self._raw
+                end = buf.find("</" + name, pos)
+                if end < 0:
+                    # Hold back what could be the start of the end tag.
+                    stop = n if final else max(pos, n - len(name) - 1)
+                    (self._raw_parts if kind else emit).append(buf[pos:stop])
+                    pos = stop
+                    if final and kind:
+                        emit.append(self._end_raw("".join(self._raw_parts)))
+                    break
+                if kind:
+                    self._raw_parts.append(buf[pos:end])
+                    emit.append(self._end_raw("".join(self._raw_parts)))
+                    self._raw_parts = []
+                else:
+                    emit.append(buf[pos:end])
+                    self._raw = None
+                self._carry = ""
+                pos = end
+            elif self._keep:
+                lt = buf.find("<", pos)
+                gt = buf.find(">", lt) if lt >= 0 else -1
+                if gt < 0:
+                    stop = n if final or lt < 0 else lt
+                    emit.append(buf[pos:stop])
+                    pos = stop
+                    break
+                tag = buf[lt:gt + 1]
+                match = _TAG_NAME_RE.match(tag)
+                if match and match.group(2).lower() == self._keep[0] and not tag.endswith("/>"):
+                    self._keep[1] += -1 if match.group(1) else 1
+                    if not self._keep[1]:
+                        self._keep = None
+                        self._carry = tag
+                emit.append(buf[pos:gt + 1])
+                pos = gt + 1
+            else:
+                special = _SPECIAL_RE.search(buf, pos)
+                if special:
+                    emit.append(self._markup(buf[pos:special.end()]))
+                    tag = special.group()
+                    name = _TAG_NAME_RE.match(tag).group(2).lower()
+                    if name == "style":
+                        self._raw = (name, "css")
+                    elif name == "script":
+                        script_type = _TYPE_RE.search(tag)
+                        self._raw = (name, "js" if (script_type.group(1) if script_type else "") in _JS_TYPES else "")
+                    elif not tag.endswith("/>"):
+                        self._keep = [name, 1]
+                    self._carry = tag
+                    pos = special.end()
+                    continue
+                # Up to the last complete tag; the rest waits for what follows it.
+                stop = n if final else buf.rfind(">", pos) + 1
+                if stop <= pos:
+                    break
+                emit.append(self._markup(buf[pos:stop]))
+                last_tag = buf.rfind("<", pos, stop)
+                self._carry = buf[last_tag:stop] if last_tag >= 0 else ""
+                pos = stop
+        self._pending = buf[pos:]
+        self.out.write("".join(emit))
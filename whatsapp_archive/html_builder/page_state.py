@@ -0,0 +1,109 @@
+"""Page state exported from an archive, applied when the archive is rebuilt.
+
+The page's "Export state" button downloads the selections, deletions, notes, priorities
+and transcription edits as <page>_state.json:
+
+    {"format": "whatsapp-archive-state", "version": 1, "page": "chat.html",
+     "selected": [id, ...], "deleted": [id, ...], "notes": {id: html, ...},
+     "priorities": {id: "red", ...}, "edits": {id: text, ...}}
+
+Ids are message ids (see builder.message_id). They depend on the message's position in
+the sorted chat, so a state applies to rebuilds of the same chat with the same date range.
+"""
+import html
+import json
+from html.parser import HTMLParser
+from pathlib import Path
+
+STATE_FORMAT = "whatsapp-archive-state"
+STATE_VERSION = 1
+PRIORITIES = ("red", "amber", "orange", "white")
+
+# Same rules as sanitizeNoteHtml in the page (see JS_FUNCTIONS).
+_NOTE_TAGS = {"p", "br", "div", "span", "ul", "ol", "li", "strong", "em", "b", "i", "u", "sub", "sup"}
+_NOTE_STYLED_TAGS = {"p", "div", "span", "li"}
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class _NoteSanitizer(HTMLParser):
+    """Keeps allowed tags (others are dropped with their content) and style/class on block elements."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self.open: list[str] = []
+        self.skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip or tag not in _NOTE_TAGS:
+            if tag not in _VOID_TAGS:
+                self.skip += 1
+            return
+        kept = "".join(f' {name}="{html.escape(value or "")}"' for name, value in attrs
+                       if name in ("style", "class") and tag in _NOTE_STYLED_TAGS)
+        self.parts.append(f"<{tag}{kept}>")
+        if tag not in _VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in _VOID_TAGS:
+            return
+        if self.skip:
+            self.skip -= 1
+        elif tag in self.open:
+            while self.open:
+                closed = self.open.pop()
+                self.parts.append(f"</{closed}>")
+                if closed == tag:
+                    break
+
+    def handle_data(self, data):
+        if not self.skip:
+            self.parts.append(html.escape(data, quote=False))
+
+    def result(self) -> str:
+        return "".join(self.parts) + "".join(f"</{tag}>" for tag in reversed(self.open))
+
+
+def sanitize_note_html(value: str) -> str:
+    """Note HTML from a state file, reduced to the markup the page itself would keep."""
+    if not value or not value.strip():
+        return ""
+    parser = _NoteSanitizer()
+    parser.feed(value)
+    parser.close()
+    return parser.result()
+
+
+class PageState:
+    """Per-message state keyed by message id."""
+
+    def __init__(self, selected=(), deleted=(), notes=None, priorities=None, edits=None):
+        self.selected: set[str] = set(selected)
+        self.deleted: set[str] = set(deleted)
+        self.notes: dict[str, str] = {}
+        for msg_id, note in (notes or {}).items():
+            clean = sanitize_note_html(note)
+            if clean.strip():
+                self.notes[msg_id] = clean
+        self.priorities: dict[str, str] = {
+            msg_id: p for msg_id, p in (priorities or {}).items() if p in PRIORITIES
+        }
+        self.edits: dict[str, str] = dict(edits or {})
+
+    @classmethod
+    def load(cls, path: Path) -> "PageState":
+        """Read a state file exported by an archive page. Raises ValueError if it is not one."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get("format") != STATE_FORMAT:
+            raise ValueError(f"{path.name} is not an archive state file")
+        if data.get("version") != STATE_VERSION:
+            raise ValueError(f"Unsupported state file version: {data.get('version')}")
+        return cls(
+            selected=data.get("selected", []),
+            deleted=data.get("deleted", []),
+            notes=data.get("notes", {}),
+            priorities=data.get("priorities", {}),
+            edits=data.get("edits", {}),
+        )
@@ -0,0 +1,125 @@
+"""Pre-compressed copies of a hosted archive's files, for static hosts that serve them.
+
+Each page, sidecar script and shared asset gets <file>.gz (stdlib gzip) and, when the
+brotli package is installed, <file>.br next to it. Files are compressed on a background
+thread as the build hands them over, so the pages of a sharded archive are compressed
+while the next ones are written. A file written without pre-compression loses the copies
+an earlier build left, so a host never serves a stale copy.
+"""
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from whatsapp_archive.config import (
+    PRECOMPRESS_BROTLI_LARGE_BYTES,
+    PRECOMPRESS_BROTLI_LARGE_QUALITY,
+    PRECOMPRESS_BROTLI_QUALITY,
+    PRECOMPRESS_GZIP_LEVEL,
+)
+from whatsapp_archive.utils import temp_path
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: .gz copies only
+    brotli = None
+
+if TYPE_CHECKING:
+    from whatsapp_archive.report import BuildReport
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = (".gz", ".br")
+CHUNK_SIZE = 1024 * 1024
+
+
+def remove_copies(path: Path) -> None:
+    for suffix in SUFFIXES:
+        path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+
+def refresh_copies(path: Path, compressor: Optional["Precompressor"]) -> None:
+    """After writing `path`: queue it for compression, or remove the copies of an earlier build."""
+    if compressor:
+        compressor.submit(path)
+    else:
+        remove_copies(path)
+
+
+def _write_gzip(source: Path, target: Path) -> None:
+    with open(source, "rb") as src, open(target, "wb") as raw, \
+            gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=PRECOMPRESS_GZIP_LEVEL, mtime=0) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def _write_brotli(source: Path, target: Path) -> None:
+    large = source.stat().st_size >= PRECOMPRESS_BROTLI_LARGE_BYTES
+    compressor = brotli.Compressor(mode=brotli.MODE_TEXT,
+                                   quality=PRECOMPRESS_BROTLI_LARGE_QUALITY if large else PRECOMPRESS_BROTLI_QUALITY)
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        while chunk := src.read(CHUNK_SIZE):
+            dst.write(compressor.process(chunk))
+        dst.write(compressor.finish())
+
+
+class Precompressor:
+    """Compresses submitted files on a background thread; close() waits for it and
+    returns {file: {"raw": bytes, "gzip": bytes, "brotli": bytes}}, with file names
+    relative to `root` (the archive's folder)."""
+
+    def __init__(self, root: Path, report: Optional["BuildReport"] = None):
+        self.root = root
+        self.report = report
+        self.sizes: dict[str, dict[str, int]] = {}
+        self.errors: list[str] = []
+        self._queue: "queue.Queue[Optional[Path]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="precompress", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: Path) -> None:
+        self._queue.put(path)
+
+    def close(self) -> dict[str, dict[str, int]]:
+        self._queue.put(None)
+        self._thread.join()
+        return self.sizes
+
+    def _run(self) -> None:
+        while (path := self._queue.get()) is not None:
+            try:
+                self._compress(path)
+            except OSError as e:
+                logger.warning("Could not compress %s: %s", path, e)
+                self.errors.append(f"{path.name}: {e}")
+
+    def _compress(self, path: Path) -> None:
+        raw = path.stat().st_size
+        sizes = {"raw": raw}
+        writers = [(".gz", "gzip", _write_gzip)]
+        if brotli is not None:
+            writers.append((".br", "brotli", _write_brotli))
+        else:
+            path.with_name(path.name + ".br").unlink(missing_ok=True)
+        for suffix, key, write in writers:
+            target = path.with_name(path.name + suffix)
+            # Shared assets never change: copies at least as new as the file are reused.
+            if not (target.exists() and target.stat().st_mtime >= path.stat().st_mtime):
+                part = temp_path(target, ".part")
+                try:
+                    write(path, part)
+                    os.replace(part, target)
+                finally:
+                    part.unlink(missing_ok=True)
+                if self.report:
+                    self.report.count("precompress", items=1, bytes_read=raw,
+                                      bytes_written=target.stat().st_size)
+            sizes[key] = target.stat().st_size
+        try:
+            name = Path(os.path.relpath(path, self.root)).as_posix()
+        except ValueError:  # another drive (Windows)
+            name = str(path)
+        self.sizes[name] = sizes
@@ -0,0 +1,66 @@
+"""Inverted search index embedded in the archive page.
+
+Text is accent-folded and lowercased, then split into word tokens. Each token maps to
+the ordinals (positions in the page) of the messages containing it. The page receives:
+
+    {"v": 1, "tokens": [...sorted...], "offsets": base64(uint32 LE), "postings": base64(bytes)}
+
+where the postings of tokens[k] are postings[offsets[k]:offsets[k + 1]], a run of
+delta-encoded LEB128 varints. The page folds queries the same way (see JS_SEARCH_TEXT).
+"""
+import base64
+import re
+import sys
+import unicodedata
+from array import array
+
+INDEX_VERSION = 1
+_TOKEN_RE = re.compile(r"[^\W]+")
+
+
+def fold_text(text: str) -> str:
+    """Lowercase and strip accents ("Élève" -> "eleve")."""
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.category(ch).startswith("M"))
+
+
+def tokenize(text: str) -> set[str]:
+    return set(_TOKEN_RE.findall(fold_text(text)))
+
+
+class SearchIndex:
+    """Collects message texts in page order and serializes the packed index."""
+
+    def __init__(self):
+        self.postings: dict[str, array] = {}
+        self.count = 0
+
+    def add(self, text: str) -> None:
+        ordinal = self.count
+        self.count += 1
+        for token in tokenize(text):
+            self.postings.setdefault(token, array("I")).append(ordinal)
+
+    def to_dict(self) -> dict:
+        # JavaScript compares strings by UTF-16 code units; sort the same way for its binary search.
+        tokens = sorted(self.postings, key=lambda t: t.encode("utf-16-be"))
+        offsets = array("I", [0])
+        packed = bytearray()
+        for token in tokens:
+            previous = 0
+            for ordinal in self.postings[token]:
+                delta = ordinal - previous
+                previous = ordinal
+                while delta >= 0x80:
+                    packed.append((delta & 0x7F) | 0x80)
+                    delta >>= 7
+                packed.append(delta)
+            offsets.append(len(packed))
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        return {
+            "v": INDEX_VERSION,
+            "tokens": tokens,
+            "offsets": base64.b64encode(offsets.tobytes()).decode("ascii"),
+            "postings": base64.b64encode(bytes(packed)).decode("ascii"),
+        }
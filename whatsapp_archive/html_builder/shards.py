@@ -0,0 +1,209 @@
+"""Sharded archive output: one page per month or per N messages, plus an index page.
+
+Each page is a regular archive (see builder.build_html) named <stem>_<key>.html next
+to the index, so per-page state keyed on the file name keeps working. Search text for
+every message is collected into <stem>_search.js, which pages load on demand to find
+matches on other pages.
+"""
+import calendar
+import html
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from whatsapp_archive.config import SHARD_MESSAGE_COUNT
+from whatsapp_archive.html_builder.assets import SharedAssets
+from whatsapp_archive.html_builder.builder import WRITE_BUFFER_SIZE, _FRENCH_MONTHS, build_html
+from whatsapp_archive.html_builder.css import HTML_CSS, INDEX_CSS
+from whatsapp_archive.html_builder.js import JS_INDEX
+from whatsapp_archive.html_builder.minify import MinifyingWriter
+from whatsapp_archive.html_builder.page_state import PageState
+from whatsapp_archive.html_builder.precompress import Precompressor, refresh_copies
+from whatsapp_archive.translations import TRANSLATIONS
+from whatsapp_archive.utils import temp_path
+
+if TYPE_CHECKING:
+    from whatsapp_archive.pipeline import ArchivePipeline
+
+SHARD_MODES = ("none", "month", "count")
+
+
+def _month_name(month: int, lang: str) -> str:
+    return _FRENCH_MONTHS[month] if lang == "fr" else calendar.month_name[month]
+
+
+def plan_shards(messages, mode: str, lang: str, shard_size: int = SHARD_MESSAGE_COUNT) -> list[dict]:
+    """Split sorted messages into pages: [{"key", "label", "offset", "messages"}]."""
+    shards: list[dict] = []
+    if mode == "month":
+        for offset, m in enumerate(messages):
+            dt = m["datetime_obj"]
+            key = f"{dt.year:04d}-{dt.month:02d}"
+            if not shards or shards[-1]["key"] != key:
+                shards.append({"key": key, "label": f"{_month_name(dt.month, lang)} {dt.year}",
+                               "offset": offset, "messages": []})
+            shards[-1]["messages"].append(m)
+    else:
+        for page, offset in enumerate(range(0, len(messages), shard_size), start=1):
+            chunk = messages[offset:offset + shard_size]
+            first = chunk[0]["datetime_obj"].strftime("%Y-%m-%d")
+            last = chunk[-1]["datetime_obj"].strftime("%Y-%m-%d")
+            shards.append({"key": f"p{page:03d}", "label": first if first == last else f"{first} – {last}",
+                           "offset": offset, "messages": chunk})
+    return shards
+
+
+def _write_atomic(path: Path, chunks, minify: bool = False) -> int:
+    """Write the chunks to `path`; with `minify`, as HTML through MinifyingWriter.
+    Returns the bytes minification saved."""
+    part_path = temp_path(path, ".part")
+    try:
+        with open(part_path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+            out = MinifyingWriter(f) if minify else f
+            for chunk in chunks:
+                out.write(chunk)
+            if minify:
+                out.finish()
+        os.replace(part_path, path)
+    finally:
+        part_path.unlink(missing_ok=True)
+    return out.bytes_saved if minify else 0
+
+
+def _search_script_chunks(pages: list[dict], entries: list[tuple[int, str, str]]):
+    yield "window.ARCHIVE_SEARCH = {\"pages\": "
+    yield json.dumps(pages, ensure_ascii=False)
+    yield ", \"entries\": ["
+    for n, entry in enumerate(entries):
+        yield ("," if n else "") + "\n" + json.dumps(entry, ensure_ascii=False)
+    yield "]};\n"
+
+
+def _index_chunks(title: str, lang: str, shards: list[dict], search_script: str,
+                  out_html: Path, assets: Optional[SharedAssets]):
+    html_t = TRANSLATIONS.get(lang, TRANSLATIONS["en"])
+    total = sum(len(s["messages"]) for s in shards)
+
+    # Month -> (message count, page holding the month's first message)
+    months: dict[tuple[int, int], list] = {}
+    for shard in shards:
+        for m in shard["messages"]:
+            dt = m["datetime_obj"]
+            cell = months.setdefault((dt.year, dt.month), [0, shard["file"]])
+            cell[0] += 1
+
+    constants = f'''
+const SEARCH_SCRIPT = {json.dumps(search_script)};
+const HTML_INDEX_NO_RESULTS = {json.dumps(html_t["html_index_no_results"])};
+const HTML_INDEX_MORE_RESULTS = {json.dumps(html_t["html_index_more_results"])};
+'''
+    if assets:
+        head = "\n".join([assets.stylesheet("archive", HTML_CSS, out_html),
+                          assets.stylesheet("archive-index", INDEX_CSS, out_html),
+                          assets.script("archive-index", JS_INDEX, out_html)])
+        script = f"<script>{constants}</script>"
+    else:
+        head = f"<style>{HTML_CSS}{INDEX_CSS}</style>"
+        script = f"<script>{constants}{JS_INDEX}\n</script>"
+
+    yield f'''<!doctype html><html lang="{lang}"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{html.escape(title)}</title>{head}</head>
+<body class="theme-light"><div class="sticky-top">
+<div class="header"><h1>{html.escape(title)}</h1></div>
+<div class="search"><input id="q" type="search" placeholder="{html_t["html_index_search_placeholder"]}"></div>
+</div>
+<div class="index">
+<ul id="index-results"></ul>
+<p>{html.escape(html_t["html_index_summary"].format(messages=total, pages=len(shards)))}</p>
+<h2>{html_t["html_index_calendar"]}</h2>
+<table class="calendar"><tr><th></th>'''
+    for month in range(1, 13):
+        yield f"<th>{html.escape(_month_name(month, lang)[:3])}</th>"
+    yield "</tr>"
+    for year in sorted({year for year, _ in months}):
+        yield f"\n<tr><th>{year}</th>"
+        for month in range(1, 13):
+            cell = months.get((year, month))
+            if cell:
+                yield f'<td><a href="{html.escape(cell[1])}">{cell[0]}</a></td>'
+            else:
+                yield '<td class="empty">·</td>'
+        yield "</tr>"
+    yield f'''</table>
+<h2>{html_t["html_index_pages"]}</h2>
+<ol class="shard-list">'''
+    for shard in shards:
+        yield (f'\n<li><a href="{html.escape(shard["file"])}">{html.escape(shard["label"])}</a>'
+               f' — {len(shard["messages"])}</li>')
+    yield f'''</ol>
+</div>
+{script}
+</body></html>'''
+
+
+def build_sharded_html(messages, media_root: Path, out_html: Path, title: str,
+                       model, worker: 'ArchivePipeline', transcribe_audio: bool,
+                       total_audio_files: int, encryption_key: str,
+                       media_output_folder: Path, lang: str, media_lookup: dict,
+                       thumbnails: Optional[dict] = None, videos: Optional[dict] = None,
+                       compact_audios: Optional[dict] = None, mode: str = "month",
+                       shard_size: int = SHARD_MESSAGE_COUNT, virtual: bool = False,
+                       transcript_sidecar: bool = False, stats: Optional[dict] = None,
+                       state: Optional[PageState] = None,
+                       assets: Optional[SharedAssets] = None, minify: bool = False,
+                       compressor: Optional[Precompressor] = None) -> Optional[dict]:
+    """Write a sharded archive: pages next to `out_html`, and the index page at `out_html`.
+
+    `stats` accumulates over all pages; `state`, `assets`, `minify` and `compressor` apply
+    to every page (see build_html).
+    Returns {"pages": n, "largest_page": message count} or None if the worker asked to stop.
+    """
+    shards = plan_shards(messages, mode, lang, shard_size)
+    for shard in shards:
+        shard["file"] = f"{out_html.stem}_{shard['key']}.html"
+    search_script = f"{out_html.stem}_search.js"
+    participants = sorted({m.get("name") for m in messages
+                           if m.get("name") and m.get("name") != "External RECORDED Audio"})
+
+    entries: list[tuple[int, str, str]] = []
+    for n, shard in enumerate(shards):
+        page_entries: list[tuple[str, str]] = []
+        written = build_html(
+            shard["messages"], media_root, out_html.with_name(shard["file"]), title, model, worker,
+            transcribe_audio, total_audio_files, encryption_key, media_output_folder, lang,
+            media_lookup, thumbnails, videos, compact_audios,
+            shard={
+                "label": shard["label"],
+                "offset": shard["offset"],
+                "total": len(messages),
+                "participants": participants,
+                "index": out_html.name,
+                "prev": shards[n - 1]["file"] if n else None,
+                "next": shards[n + 1]["file"] if n + 1 < len(shards) else None,
+                "search_script": search_script,
+                "search_entries": page_entries,
+            },
+            virtual=virtual,
+            transcript_sidecar=transcript_sidecar,
+            stats=stats,
+            state=state,
+            assets=assets,
+            minify=minify,
+            compressor=compressor,
+        )
+        if not written:
+            return None
+        entries.extend((n, msg_id, text) for msg_id, text in page_entries)
+
+    pages = [{"file": s["file"], "label": s["label"]} for s in shards]
+    _write_atomic(out_html.with_name(search_script), _search_script_chunks(pages, entries))
+    saved = _write_atomic(out_html, _index_chunks(title, lang, shards, search_script, out_html, assets), minify)
+    if minify:
+        worker.report.count("html", minified_bytes_saved=saved)
+    refresh_copies(out_html.with_name(search_script), compressor)
+    refresh_copies(out_html, compressor)
+    worker.report.count("html", bytes_written=out_html.stat().st_size
+                        + out_html.with_name(search_script).stat().st_size)
+    return {"pages": len(shards), "largest_page": max((len(s["messages"]) for s in shards), default=0)}
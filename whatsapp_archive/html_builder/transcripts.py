@@ -0,0 +1,42 @@
+"""Transcript sidecar: transcriptions kept out of the page and loaded on demand.
+
+A page built with a sidecar leaves its transcription <pre> blocks empty (marked
+`data-lazy`) and ships the texts, keyed by message id, in <stem>_transcripts.js next
+to it. That is a plain script, so it loads from file:// too:
+
+    window.ARCHIVE_TRANSCRIPTS = {"<msg id>": "text", ...};
+
+In encrypted archives the JSON is sealed like the media files (see encryptor):
+
+    window.ARCHIVE_TRANSCRIPTS_SEALED = "<base64 of the encrypted JSON>";
+"""
+import base64
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from whatsapp_archive.encryptor import encrypt_bytes
+from whatsapp_archive.utils import temp_path
+
+
+def sidecar_name(out_html: Path) -> str:
+    return f"{out_html.stem}_transcripts.js"
+
+
+def write_sidecar(out_html: Path, transcripts: dict[str, str], encryption_key: Optional[str]) -> Path:
+    """Write the sidecar for the page at `out_html` and return its path."""
+    payload = json.dumps(transcripts, ensure_ascii=False)
+    if encryption_key:
+        sealed = base64.b64encode(encrypt_bytes(payload.encode("utf-8"), encryption_key)).decode("ascii")
+        script = f'window.ARCHIVE_TRANSCRIPTS_SEALED = "{sealed}";\n'
+    else:
+        script = f"window.ARCHIVE_TRANSCRIPTS = {payload};\n"
+    path = out_html.with_name(sidecar_name(out_html))
+    part_path = temp_path(path, ".part")
+    try:
+        part_path.write_text(script, encoding="utf-8")
+        os.replace(part_path, path)
+    finally:
+        part_path.unlink(missing_ok=True)
+    return path
@@ -1,12 +1,18 @@
 """Chat file parsing, regex patterns, message loading, and media lookup."""
+import hashlib
+import io
+import json
+import os
 import re
-from datetime import datetime
+from datetime import date, datetime, time, tzinfo
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Optional
 
 import pytz
 
-from whatsapp_archive.config import DEFAULT_TIMEZONE
+from whatsapp_archive.config import APP_FOLDERS, DEFAULT_TIMEZONE
+from whatsapp_archive.utils import temp_path
 
 # Regex patterns for WhatsApp chat format
 DT_PATTERNS = [
@@ -14,15 +20,21 @@ DT_PATTERNS = [
     r'^(?P<date>\d{1,2}/\d{1,2}/\d{2,4}),\s(?P<time>\d{1,2}:\d{2})\s-\s(?P<name>[^:]+):\s(?P<msg>.*)$',
     r'^(?P<date>\d{1,2}/\d{1,2}/\d{2,4}),\s(?P<time>\d{1,2}:\d{2}(?:\s?(AM|PM))?)\s-\s(?P<msg>.*)$',
 ]
+_MEDIA_EXTENSIONS = "jpg|jpeg|png|gif|webp|bmp|svg|mp4|mov|mkv|webm|m4a|opus|ogg|mp3|wav|pdf|docx?|xlsx?|pptx?"
+# A file name with an extension starts a word: matching only there finds the same (leftmost)
+# name without retrying \S+ from every character of the word.
 MEDIA_FILENAME_RE = re.compile(
-    r'(?P<fname>(?:IMG|VID|PTT|AUD|DOC|VOICE|STK)-\d{4,}-WA\d{4,}\.\w+|\S+\.(?:jpg|jpeg|png|gif|webp|bmp|svg|mp4|mov|mkv|webm|m4a|opus|ogg|mp3|wav|pdf|docx?|xlsx?|pptx?))',
+    rf'(?P<fname>(?:IMG|VID|PTT|AUD|DOC|VOICE|STK)-\d{{4,}}-WA\d{{4,}}\.\w+|(?<!\S)\S+\.(?:{_MEDIA_EXTENSIONS}))',
     re.IGNORECASE,
 )
+# What every MEDIA_FILENAME_RE match contains; much cheaper to search for.
+_MEDIA_HINT_RE = re.compile(rf'-WA\d|\.(?:{_MEDIA_EXTENSIONS})', re.IGNORECASE)
 MEDIA_OMITTED_RE = re.compile(
     r'(image omitted|photo omitted|video omitted|audio omitted|sticker omitted|media omitted)',
     re.IGNORECASE,
 )
 EXTERNAL_AUDIO_RE = re.compile(r'^(AUD|PTT)-(\d{8})-WA\d{4,}\.\w+$', re.IGNORECASE)
+PARSE_CACHE_VERSION = 1
 
 # Timezone for parsing (user can override via settings)
 LOCAL_TZ = pytz.timezone(DEFAULT_TIMEZONE)
@@ -45,22 +57,121 @@ def try_parse_line(line: str) -> Optional[dict[str, Any]]:
     return None
 
 
-def load_chat_messages(chat_txt: Path) -> list[dict[str, Any]]:
-    """Load and parse a WhatsApp _chat.txt file. Continuation lines are appended to previous message."""
-    msgs = []
-    with open(chat_txt, "r", encoding="utf-8", errors="replace") as f:
-        for raw in f:
-            parsed = try_parse_line(raw)
-            if parsed is None:
-                if msgs:
-                    msgs[-1]["msg"] += "\n" + raw.strip("\r\n")
-                else:
-                    msgs.append({"date": "", "time": "", "name": None, "msg": raw.strip()})
+def is_chat_export(path: Path, max_lines: int = 20) -> bool:
+    """True if `path` is a .txt file whose first lines include a WhatsApp message line."""
+    if path.suffix.lower() != ".txt" or not path.is_file():
+        return False
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for _ in range(max_lines):
+                line = f.readline()
+                if not line:
+                    break
+                if try_parse_line(line.lstrip("\ufeff")):
+                    return True
+    except OSError:
+        pass
+    return False
+
+
+def _parse_chat_lines(lines, msgs: list[dict[str, Any]]) -> None:
+    """Parse chat lines onto `msgs`. Continuation lines are appended to the previous message."""
+    for raw in lines:
+        parsed = try_parse_line(raw)
+        if parsed is None:
+            if msgs:
+                msgs[-1]["msg"] += "\n" + raw.strip("\r\n")
             else:
-                msgs.append(parsed)
+                msgs.append({"date": "", "time": "", "name": None, "msg": raw.strip()})
+        else:
+            msgs.append(parsed)
+
+
+def _decoded_lines(data: bytes) -> io.TextIOWrapper:
+    # Same decoding and newline handling as open(..., "r", encoding="utf-8", errors="replace").
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors="replace")
+
+
+def find_chat_exports(folder: Path) -> list[Path]:
+    """Chat exports under `folder`, skipping the app's own folders (_archive_cache, ...)."""
+    found = []
+    for path in sorted(folder.rglob("*.txt")):
+        if any(part in APP_FOLDERS for part in path.relative_to(folder).parent.parts):
+            continue
+        if is_chat_export(path):
+            found.append(path)
+    return found
+
+
+def chat_identity(chat_txt: Path, max_messages: int = 5) -> Optional[str]:
+    """A key for the conversation in a chat export, from its first messages: re-exports of
+    the same chat get the same key wherever they are saved. None if no message is found."""
+    digest = hashlib.sha1()
+    found = 0
+    try:
+        with open(chat_txt, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parsed = try_parse_line(line.lstrip("\ufeff"))
+                if parsed:
+                    digest.update("\x1f".join(str(v) for v in parsed.values()).encode("utf-8") + b"\n")
+                    found += 1
+                    if found == max_messages:
+                        break
+    except OSError:
+        return None
+    return digest.hexdigest()[:16] if found else None
+
+
+def load_chat_messages(chat_txt: Path, cache_file: Optional[Path] = None,
+                       stats: Optional[dict] = None) -> list[dict[str, Any]]:
+    """Load and parse a WhatsApp _chat.txt file. Continuation lines are appended to previous message.
+
+    With `cache_file`, the messages parsed so far are kept there with a hash of the text they
+    came from; a later export that starts with the same text (a re-export with new messages
+    at the end) only has its new lines parsed. `stats` gets the reused and parsed byte counts.
+    """
+    data = chat_txt.read_bytes()
+    # Only whole lines are cached: the last one may still get continuation lines.
+    cut = data.rfind(b"\n") + 1
+    msgs: list[dict[str, Any]] = []
+    start = 0
+    if cache_file is not None:
+        cached = _load_parse_cache(cache_file)
+        offset = cached.get("offset", 0) if cached else 0
+        if 0 < offset <= cut and cached.get("prefix") == hashlib.sha256(data[:offset]).hexdigest():
+            msgs = cached["messages"]
+            start = offset
+    _parse_chat_lines(_decoded_lines(data[start:cut]), msgs)
+    if cache_file is not None and cut > start:
+        _save_parse_cache(cache_file, {"version": PARSE_CACHE_VERSION, "offset": cut,
+                                       "prefix": hashlib.sha256(data[:cut]).hexdigest(), "messages": msgs})
+    _parse_chat_lines(_decoded_lines(data[cut:]), msgs)
+    if stats is not None:
+        stats.update(reused_bytes=start, parsed_bytes=len(data) - start)
     return msgs
 
 
+def _load_parse_cache(cache_file: Path) -> Optional[dict[str, Any]]:
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) and data.get("version") == PARSE_CACHE_VERSION else None
+
+
+def _save_parse_cache(cache_file: Path, data: dict[str, Any]) -> None:
+    """Write atomically; a cache that cannot be written only costs a full parse next time."""
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = temp_path(cache_file)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass
+
+
 def load_folder_audio(media_root: Path, local_tz: Optional[Any] = None) -> list[dict[str, Any]]:
     """Scan media folder for external audio files (AUD-YYYYMMDD-WA*.ext). Returns list of message-like dicts."""
     tz = local_tz or LOCAL_TZ
@@ -100,29 +211,60 @@ def parse_message_datetime(msg: dict[str, Any], local_tz: Optional[Any] = None)
     if not date_str or not time_str:
         return None
 
-    formats_to_try = [
-        "%m/%d/%y, %I:%M %p",
-        "%m/%d/%Y, %I:%M %p",
-        "%m/%d/%y, %H:%M",
-        "%m/%d/%Y, %H:%M",
-    ]
-    datetime_str = f"{date_str}, {time_str}"
-    for fmt in formats_to_try:
+    day = _parse_date(date_str)
+    clock = _parse_time(time_str)
+    if day is None or clock is None:
+        return None
+    return _localize(tz, datetime.combine(day, clock))
+
+
+# A chat has a few thousand distinct days and minutes but up to millions of messages, so
+# each date and time string is parsed once. The year and clock formats never both match.
+@lru_cache(maxsize=65536)
+def _parse_date(date_str: str) -> Optional[date]:
+    for fmt in ("%m/%d/%y", "%m/%d/%Y"):
         try:
-            naive_dt = datetime.strptime(datetime_str, fmt)
-            return tz.localize(naive_dt)
+            return datetime.strptime(date_str, fmt).date()
         except ValueError:
             continue
     return None
 
 
+@lru_cache(maxsize=4096)
+def _parse_time(time_str: str) -> Optional[time]:
+    for fmt in ("%I:%M %p", "%H:%M"):
+        try:
+            return datetime.strptime(time_str, fmt).time()
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=65536)
+def _day_tzinfo(tz: Any, day: date) -> Optional[tzinfo]:
+    """The tzinfo tz.localize gives every minute of the day, or None if the offset changes
+    during it (a daylight saving switch). localize is the slow part of parsing dates."""
+    first = tz.localize(datetime.combine(day, time(0, 0))).tzinfo
+    last = tz.localize(datetime.combine(day, time(23, 59))).tzinfo
+    return first if first is last else None
+
+
+def _localize(tz: Any, naive_dt: datetime) -> datetime:
+    day_tzinfo = _day_tzinfo(tz, naive_dt.date())
+    return naive_dt.replace(tzinfo=day_tzinfo) if day_tzinfo is not None else tz.localize(naive_dt)
+
+
 def build_media_lookup(media_root: Path) -> dict[str, Path]:
-    """Build a single {lowercase_filename: Path} map with one os.walk. Use for O(1) lookups."""
-    import os
+    """Build a single {lowercase_filename: Path} map with one os.walk. Use for O(1) lookups.
+
+    The app's own folders (_archive_cache, _transcriptions_cache, ...) are skipped: their
+    thumbnails and transcoded files must never be taken for the chat's attachments.
+    """
     lookup = {}
     if not media_root.is_dir():
         return lookup
-    for root, _, files in os.walk(media_root):
+    for root, dirs, files in os.walk(media_root):
+        dirs[:] = [d for d in dirs if d not in APP_FOLDERS]
         for f in files:
             lookup[f.lower()] = Path(root) / f
     return lookup
@@ -133,3 +275,20 @@ def get_media_path(media_lookup: dict[str, Path], filename: str) -> Optional[Pat
     if not filename:
         return None
     return media_lookup.get(filename.lower())
+
+
+def media_filename_match(text: str) -> Optional[re.Match]:
+    """MEDIA_FILENAME_RE's match in a message text (group "fname"), or None. Most messages
+    name no file; _MEDIA_HINT_RE rules them out first."""
+    if not _MEDIA_HINT_RE.search(text):
+        return None
+    return MEDIA_FILENAME_RE.search(text) or MEDIA_FILENAME_RE.fullmatch(text.strip())
+
+
+def message_media_filename(msg: dict[str, Any]) -> Optional[str]:
+    """Return the media filename referenced by a message (or the external audio file name), or None."""
+    msg_content = msg.get("msg", "")
+    if msg.get("is_external_audio", False):
+        return msg_content
+    mf = media_filename_match(msg_content)
+    return mf.group("fname") if mf else None
@@ -0,0 +1,379 @@
+"""Archive build pipeline: parsing, media stages and HTML output, without Qt.
+
+The desktop app runs it through gui.worker.ChatWorker, which relays its events as Qt
+signals; the command line (see cli) runs it directly. Stages report through the
+pipeline object they are given:
+
+    pipeline.status_updated.emit(key, params)   # translation key + format params
+    pipeline.progress_updated.emit(current, total)
+    pipeline.stop_requested                     # checked between files
+"""
+import logging
+from pathlib import Path
+from typing import Callable, Optional
+
+import pytz
+
+from whatsapp_archive.config import ASSETS_FOLDER, AUDIO_EXTENSIONS, IMAGE_EXTENSIONS, VIDEO_EXTENSIONS
+from whatsapp_archive.html_builder import PageState, SharedAssets, build_html, build_sharded_html, message_id
+from whatsapp_archive.html_builder.precompress import Precompressor
+from whatsapp_archive.parser import (
+    build_media_lookup,
+    get_media_path,
+    load_chat_messages,
+    load_folder_audio,
+    media_filename_match,
+    message_media_filename,
+    parse_message_datetime,
+)
+from whatsapp_archive.report import BuildReport
+from whatsapp_archive.stages import (
+    compact_audio,
+    encrypt_media,
+    generate_thumbnails,
+    load_archive_key,
+    process_videos,
+)
+from whatsapp_archive.transcriber import load_whisper_model
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    """A list of callbacks, called in order on emit(). Same shape as a Qt signal."""
+
+    def __init__(self):
+        self._callbacks: list[Callable] = []
+
+    def connect(self, callback: Callable) -> None:
+        self._callbacks.append(callback)
+
+    def emit(self, *args) -> None:
+        for callback in self._callbacks:
+            callback(*args)
+
+
+class BuildError(Exception):
+    """The build did not complete. `key` is a translation key ("error_stopped", ...) or a message."""
+
+    def __init__(self, key: str):
+        super().__init__(key)
+        self.key = key
+
+
+class ArchivePipeline:
+    """One archive build. Call run() in any thread; request_stop() may be called from another."""
+
+    def __init__(
+        self,
+        chat_file: Path,
+        out_file: Path,
+        title: str,
+        transcribe_audio: bool,
+        encrypt_media: bool,
+        lang: str,
+        whisper_model_index: int = -1,
+        timezone_str: str = "America/New_York",
+        date_from=None,
+        date_to=None,
+        transcode_video: bool = False,
+        compact_audio: bool = False,
+        shard_mode: str = "none",
+        virtual_rendering: bool = False,
+        transcript_sidecar: bool = False,
+        shared_assets: bool = False,
+        assets_dir: Optional[Path] = None,
+        minify_output: bool = False,
+        precompress_output: bool = False,
+        page_state: Optional[PageState] = None,
+        media_workers: int = 0,
+    ):
+        self.chat_file = chat_file
+        self.out_file = out_file
+        self.title = title
+        self.transcribe_audio = transcribe_audio
+        self.encrypt_media = encrypt_media
+        self.lang = lang
+        self.whisper_model_index = whisper_model_index
+        self.timezone_str = timezone_str
+        self.date_from = date_from  # datetime.date or None
+        self.date_to = date_to
+        self.transcode_video = transcode_video
+        self.compact_audio = compact_audio
+        self.shard_mode = shard_mode
+        self.virtual_rendering = virtual_rendering
+        self.transcript_sidecar = transcript_sidecar
+        self.shared_assets = shared_assets
+        self.assets_dir = assets_dir  # Shared assets folder; default: ASSETS_FOLDER next to the archive
+        self.minify_output = minify_output
+        self.precompress_output = precompress_output
+        self.page_state = page_state
+        self.media_workers = media_workers  # Threads per media stage; 0 lets each stage decide
+        self.model = None
+        self.stop_requested = False
+        self.total_transcription_time = 0.0
+        self.report = BuildReport()
+        self.media_sources: dict[str, list[Path]] = {}  # files the archive uses, by kind (for diagnostics)
+        self.progress_updated = Event()
+        self.status_updated = Event()
+        self.stage_finished = Event()  # (stage name, nesting depth): see report.BuildReport.stage
+
+    def request_stop(self) -> None:
+        self.stop_requested = True
+
+    def _check_stop(self) -> None:
+        if self.stop_requested:
+            raise BuildError("error_stopped")
+
+    def run(self) -> Path:
+        """Build the archive. Returns the path of the HTML written; raises BuildError if
+        it was stopped or there was nothing to build. Stage timings and counters go to
+        the build report (see report.BuildReport.stage)."""
+        self.model = None
+        self.total_transcription_time = 0.0
+        self.media_sources = {}
+        self.report = BuildReport(on_stage_end=self.stage_finished.emit)
+        with self.report.stage("total"):
+            out_html_path = self._run()
+        try:
+            self.report.write(out_html_path)
+        except OSError as e:
+            logger.warning("Could not write build report: %s", e)
+        return out_html_path
+
+    def _run(self) -> Path:
+        encryption_key_hex = None
+
+        if self.encrypt_media:
+            self.transcribe_audio = True
+
+        if self.transcribe_audio:
+            self.status_updated.emit("status_looking_local_model", {})
+            with self.report.stage("model"):
+                self.model = load_whisper_model(self.whisper_model_index, self.status_updated.emit)
+        else:
+            self.status_updated.emit("status_skipping_model", {})
+
+        self._check_stop()
+
+        out_html_path = Path(self.out_file)
+        media_output_folder = None
+        if self.encrypt_media:
+            media_output_folder = out_html_path.parent / (out_html_path.stem + "_media")
+            media_output_folder.mkdir(exist_ok=True)
+            encryption_key_hex = load_archive_key(
+                self.chat_file.parent / "_archive_cache", media_output_folder
+            )
+            self.status_updated.emit("status_creating_media_folder", {"folder_name": media_output_folder.name})
+
+        self.status_updated.emit("status_loading_chat", {})
+        with self.report.stage("parse"):
+            parse_stats: dict = {}
+            # One cache per chat file: a folder may hold several exports (see batch and watcher).
+            parse_cache = self.chat_file.parent / "_archive_cache" / f"chat_parse-{self.chat_file.stem}.json"
+            messages = load_chat_messages(self.chat_file, parse_cache, stats=parse_stats)
+            self.report.add("parse", messages=len(messages), **parse_stats)
+
+            chat_file_names = set()
+            for msg in messages:
+                msg_content = msg.get("msg", "")
+                mf = media_filename_match(msg_content)
+                if mf:
+                    chat_file_names.add(mf.group("fname"))
+
+            local_tz = pytz.timezone(self.timezone_str)
+            for msg in messages:
+                msg["datetime_obj"] = parse_message_datetime(msg, local_tz=local_tz)
+            parseable_messages = [m for m in messages if m["datetime_obj"]]
+            self.report.count("parse", items=len(messages), bytes_read=parse_stats["reused_bytes"] + parse_stats["parsed_bytes"])
+
+        media_root = self.chat_file.parent
+        self.status_updated.emit("status_scanning_audio", {})
+        with self.report.stage("media_scan"):
+            media_lookup = build_media_lookup(media_root)
+            self.report.count("media_scan", items=len(media_lookup))
+
+        with self.report.stage("external_audio"):
+            all_folder_audio = load_folder_audio(media_root, local_tz=local_tz)
+
+            external_audios = []
+            for audio_msg in all_folder_audio:
+                if audio_msg["msg"] not in chat_file_names:
+                    audio_msg["is_external_audio"] = True
+                    external_audios.append(audio_msg)
+            self.report.count("external_audio", items=len(external_audios))
+
+        self.status_updated.emit("status_found_external", {"count": len(external_audios)})
+
+        with self.report.stage("sort"):
+            all_messages = parseable_messages + external_audios
+            if self.date_from is not None:
+                all_messages = [m for m in all_messages if m["datetime_obj"].date() >= self.date_from]
+            if self.date_to is not None:
+                all_messages = [m for m in all_messages if m["datetime_obj"].date() <= self.date_to]
+            self.status_updated.emit("status_sorting", {"count": len(all_messages)})
+            all_messages.sort(key=lambda m: m["datetime_obj"])
+            self.report.count("sort", items=len(all_messages))
+
+        if not all_messages:
+            raise BuildError("status_no_messages")
+
+        if self.page_state is not None:
+            # Deleted messages skip every stage below; the rest keep the ids and
+            # numbers they have in the full chat, which the state refers to.
+            for index, m in enumerate(all_messages):
+                m["archive_index"] = index
+            kept = [m for m in all_messages if message_id(m, m["archive_index"]) not in self.page_state.deleted]
+            self.status_updated.emit("status_pruning", {"count": len(all_messages) - len(kept)})
+            self.report.add("pruning", messages=len(kept), removed=len(all_messages) - len(kept))
+            all_messages = kept
+            if not all_messages:
+                raise BuildError("status_no_messages")
+
+        audio_files_to_transcribe = 0
+        if self.transcribe_audio and self.model:
+            self.status_updated.emit("status_counting_audio", {})
+            with self.report.stage("audio_check"):
+                cache_dir = media_root / "_transcriptions_cache"
+
+                for m in all_messages:
+                    self._check_stop()
+                    fn = None
+                    is_external = m.get("is_external_audio", False)
+                    msg_content = m.get("msg", "")
+                    if is_external:
+                        fn = msg_content
+                    else:
+                        mf = media_filename_match(msg_content)
+                        if mf:
+                            fn = mf.group("fname")
+                    if fn and fn.lower().endswith(AUDIO_EXTENSIONS):
+                        abs_match = get_media_path(media_lookup, fn)
+                        if abs_match:
+                            cache_file = cache_dir / (abs_match.stem + ".json")
+                            if not cache_file.exists():
+                                audio_files_to_transcribe += 1
+                self.report.count("audio_check", items=audio_files_to_transcribe)
+
+        self._check_stop()
+
+        image_sources = []
+        video_sources = []
+        audio_sources = []
+        for m in all_messages:
+            fn = message_media_filename(m)
+            abs_match = get_media_path(media_lookup, fn)
+            if abs_match and fn.lower().endswith(IMAGE_EXTENSIONS):
+                image_sources.append(abs_match)
+            elif abs_match and fn.lower().endswith(VIDEO_EXTENSIONS):
+                video_sources.append(abs_match)
+            elif abs_match and fn.lower().endswith(AUDIO_EXTENSIONS):
+                audio_sources.append(abs_match)
+        self.media_sources = {"image": image_sources, "video": video_sources, "audio": audio_sources}
+        with self.report.stage("thumbnails"):
+            thumbnails = generate_thumbnails(image_sources, media_root / "_archive_cache", self,
+                                             max_workers=self.media_workers)
+            self.report.count("thumbnails", items=len(image_sources))
+        self._check_stop()
+
+        with self.report.stage("video"):
+            videos, video_stats = process_videos(
+                video_sources, media_root / "_archive_cache", self, transcode=self.transcode_video,
+                max_workers=self.media_workers,
+            )
+            self.report.count("video", items=len(video_sources))
+        self.report.add("video", transcode=self.transcode_video, **video_stats)
+        self._check_stop()
+
+        compact_audios = {}
+        if self.compact_audio:
+            with self.report.stage("audio"):
+                compact_audios, audio_stats = compact_audio(audio_sources, media_root / "_archive_cache", self,
+                                                            max_workers=self.media_workers)
+                self.report.count("audio", items=len(audio_sources))
+            self.report.add("audio", **audio_stats)
+            self._check_stop()
+
+        if self.encrypt_media:
+            encryption_jobs = []
+            for m in all_messages:
+                fn = message_media_filename(m)
+                abs_match = get_media_path(media_lookup, fn)
+                if not abs_match:
+                    continue
+                video = videos.get(abs_match, {})
+                if video.get("poster"):
+                    encryption_jobs.append((video["poster"], video["poster"].name + ".aes"))
+                if video.get("video"):
+                    # The archive links the compact rendition; the original is not shipped.
+                    encryption_jobs.append((video["video"], video["video"].name + ".aes"))
+                elif abs_match in compact_audios:
+                    compact = compact_audios[abs_match]
+                    encryption_jobs.append((compact, compact.name + ".aes"))
+                else:
+                    encryption_jobs.append((abs_match, fn + ".aes"))
+            for thumb in thumbnails.values():
+                if thumb["path"]:
+                    encryption_jobs.append((thumb["path"], thumb["path"].name + ".aes"))
+            with self.report.stage("encryption"):
+                encrypt_media(encryption_jobs, media_output_folder, encryption_key_hex, self,
+                              max_workers=self.media_workers)
+            self._check_stop()
+
+        self.status_updated.emit("status_building_html", {})
+        build_args = (
+            all_messages,
+            media_root,
+            out_html_path,
+            self.title,
+            self.model,
+            self,
+            self.transcribe_audio,
+            audio_files_to_transcribe,
+            encryption_key_hex,
+            media_output_folder,
+            self.lang,
+            media_lookup,
+            thumbnails,
+            videos,
+            compact_audios,
+        )
+        markup_stats: dict = {}
+        # Files are compressed on its thread while the next pages are written.
+        compressor = Precompressor(out_html_path.parent, self.report) if self.precompress_output else None
+        assets = None
+        if self.shared_assets:
+            assets = SharedAssets(self.assets_dir or out_html_path.parent / ASSETS_FOLDER,
+                                  minify=self.minify_output, compressor=compressor)
+        output_options = {"virtual": self.virtual_rendering, "transcript_sidecar": self.transcript_sidecar,
+                          "stats": markup_stats, "state": self.page_state, "assets": assets,
+                          "minify": self.minify_output, "compressor": compressor}
+        try:
+            with self.report.stage("html"):
+                if self.shard_mode != "none":
+                    shards = build_sharded_html(*build_args, mode=self.shard_mode, **output_options)
+                    if shards:
+                        self.report.add("shards", mode=self.shard_mode, **shards)
+                else:
+                    build_html(*build_args, **output_options)
+                if assets:
+                    self.report.count("html", bytes_written=assets.bytes_written)
+        finally:
+            if compressor:
+                self.status_updated.emit("status_precompressing", {})
+                with self.report.stage("precompress"):
+                    sizes = compressor.close()
+                self.report.add("precompress", files=sizes, errors=compressor.errors,
+                                raw_bytes=sum(s["raw"] for s in sizes.values()),
+                                gzip_bytes=sum(s.get("gzip", 0) for s in sizes.values()),
+                                brotli_bytes=sum(s.get("brotli", 0) for s in sizes.values()) or None)
+        if markup_stats:
+            self.report.add("markup", **markup_stats,
+                            note="bytes_saved_estimate is computed from the attributes the previous "
+                                 "message markup had, not measured against a build with it")
+        if assets:
+            self.report.add("assets", folder=str(assets.folder), files=assets.published,
+                            bytes_written=assets.bytes_written)
+
+        self._check_stop()
+        return out_html_path
@@ -0,0 +1,219 @@
+"""Opt-in build profiling, for reproducing a slow build without the user's chat.
+
+BuildProfiler runs a pipeline under cProfile and writes two files to the log folder
+(see utils.log_directory):
+
+    profile-<time>.prof           cProfile data (python -m pstats, snakeviz, ...)
+    profile-<time>-summary.json   build options, size counters, stage timings, the slowest
+                                  functions and, with `memory`, the top allocations per stage
+
+Only sizes and code locations are recorded: message, media and audio counts, audio
+duration and byte totals, never names, titles, paths or message text, so both files can be
+shared. With `memory`, tracemalloc runs during the build (which slows it down) and a
+snapshot is taken when each pipeline stage ends. cProfile sees the build thread only: work
+done on the media stages' pool threads shows up as time spent waiting for them.
+"""
+import cProfile
+import json
+import logging
+import platform
+import pstats
+import sys
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from whatsapp_archive.config import VERSION
+from whatsapp_archive.utils import log_directory
+
+if TYPE_CHECKING:
+    from whatsapp_archive.pipeline import ArchivePipeline
+
+logger = logging.getLogger(__name__)
+
+TOP_N = 25
+TRACEMALLOC_FRAMES = 5
+
+
+def _ogg_duration(path: Path) -> Optional[float]:
+    """Duration of an Ogg Opus/Vorbis file from its last page's granule position, or None."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(128)
+            f.seek(0, 2)
+            f.seek(max(0, f.tell() - 64 * 1024))
+            tail = f.read()
+    except OSError:
+        return None
+    last_page = tail.rfind(b"OggS")
+    if not head.startswith(b"OggS") or last_page < 0 or len(tail) < last_page + 14:
+        return None
+    granule = int.from_bytes(tail[last_page + 6:last_page + 14], "little")
+    if b"OpusHead" in head:
+        rate = 48000  # Opus granules always count 48 kHz samples
+    else:
+        vorbis = head.find(b"\x01vorbis")
+        if vorbis < 0:
+            return None
+        rate = int.from_bytes(head[vorbis + 12:vorbis + 16], "little")
+    return granule / rate if rate else None
+
+
+def _location(filename: str, lineno: int) -> str:
+    """Code location without the folders above the package or site-packages (user names)."""
+    path = Path(filename)
+    for marker in ("whatsapp_archive", "site-packages", "lib", "Lib"):
+        if marker in path.parts:
+            index = len(path.parts) - 1 - path.parts[::-1].index(marker)
+            return f"{'/'.join(path.parts[index:])}:{lineno}"
+    return f"{path.name}:{lineno}"
+
+
+class BuildProfiler:
+    """Runs `pipeline` under cProfile (and tracemalloc with `memory`) and writes the dumps."""
+
+    def __init__(self, pipeline: "ArchivePipeline", memory: bool = False, top: int = TOP_N,
+                 directory: Optional[Path] = None):
+        self.pipeline = pipeline
+        self.memory = memory
+        self.top = top
+        self.directory = directory
+        self.prof_path: Optional[Path] = None
+        self.summary_path: Optional[Path] = None
+        self._profiler = cProfile.Profile()
+        self._allocations: dict[str, list[dict[str, Any]]] = {}
+        self._start_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def run(self) -> Path:
+        """pipeline.run() under the profiler. The dumps are written even if the build fails
+        or is stopped (a build given up on for being slow is the one worth profiling)."""
+        profiler = self._profiler
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if self.memory:
+            if tracing:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._start_snapshot = self._last_snapshot = self._snapshot()
+            self.pipeline.stage_finished.connect(self._on_stage_end)
+        outcome = "ok"
+        try:
+            profiler.enable()
+            try:
+                return self.pipeline.run()
+            finally:
+                profiler.disable()
+        except BaseException as e:
+            outcome = getattr(e, "key", None) or type(e).__name__
+            raise
+        finally:
+            peak_traced = tracemalloc.get_traced_memory()[1] if self.memory else None
+            if tracing:
+                tracemalloc.stop()
+            try:
+                self._write(profiler, outcome, peak_traced)
+            except OSError as e:
+                logger.warning("Could not write the build profile: %s", e)
+
+    def _on_stage_end(self, name: str, depth: int) -> None:
+        # Pipeline stages are one level inside "total"; deeper ones (each transcription)
+        # are part of the stage around them.
+        if depth > 1:
+            return
+        self._profiler.disable()  # snapshots are the profiler's own work
+        snapshot = self._snapshot()
+        base = self._start_snapshot if depth == 0 else self._last_snapshot
+        stats = snapshot.compare_to(base, "lineno")
+        self._allocations[name] = [
+            {"where": _location(stat.traceback[0].filename, stat.traceback[0].lineno),
+             "size_kb": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+            for stat in stats[:self.top] if stat.size_diff > 0
+        ]
+        if depth == 1:
+            self._last_snapshot = snapshot
+            self._profiler.enable()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def counters(self) -> dict[str, Any]:
+        """Anonymous size figures for the build: how much there was, not what it was."""
+        pipeline = self.pipeline
+        stages = pipeline.report.stages
+        audio = pipeline.media_sources.get("audio", [])
+        durations = [_ogg_duration(path) for path in audio]
+        try:
+            chat_bytes = pipeline.chat_file.stat().st_size
+        except OSError:
+            chat_bytes = None
+        return {
+            "chat_bytes": chat_bytes,
+            "messages": stages.get("sort", {}).get("items"),
+            "media_files_in_folder": stages.get("media_scan", {}).get("items"),
+            "images": len(pipeline.media_sources.get("image", [])),
+            "videos": len(pipeline.media_sources.get("video", [])),
+            "audio_files": len(audio),
+            "audio_seconds": round(sum(d for d in durations if d), 1),
+            "audio_files_without_duration": sum(1 for d in durations if d is None),
+            "media_bytes": sum(path.stat().st_size for paths in pipeline.media_sources.values()
+                               for path in paths if path.exists()),
+            "transcribed": stages.get("transcription", {}).get("items", 0),
+            "transcriptions_cached": stages.get("transcription", {}).get("cached", 0),
+        }
+
+    def _options(self) -> dict[str, Any]:
+        pipeline = self.pipeline
+        return {
+            "transcribe": pipeline.transcribe_audio,
+            "encrypt": pipeline.encrypt_media,
+            "whisper_model_index": pipeline.whisper_model_index,
+            "date_filter": pipeline.date_from is not None or pipeline.date_to is not None,
+            "transcode_video": pipeline.transcode_video,
+            "compact_audio": pipeline.compact_audio,
+            "shard_mode": pipeline.shard_mode,
+            "virtual_rendering": pipeline.virtual_rendering,
+            "transcript_sidecar": pipeline.transcript_sidecar,
+            "shared_assets": pipeline.shared_assets,
+            "minify_output": pipeline.minify_output,
+            "precompress_output": pipeline.precompress_output,
+            "page_state": pipeline.page_state is not None,
+            "media_workers": pipeline.media_workers,
+        }
+
+    def _write(self, profiler: cProfile.Profile, outcome: str, peak_traced: Optional[int]) -> None:
+        directory = self.directory or log_directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = "profile-" + datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.prof_path = directory / f"{stem}.prof"
+        self.summary_path = directory / f"{stem}-summary.json"
+        profiler.dump_stats(str(self.prof_path))
+
+        stats = pstats.Stats(profiler)
+        slowest = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+        summary: dict[str, Any] = {
+            "version": VERSION,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": f"{sys.platform} {platform.machine()}",
+            "outcome": outcome,
+            "options": self._options(),
+            "counters": self.counters(),
+            "stages": self.pipeline.report.to_dict()["stages"],
+            "slowest_functions": [
+                {"function": name if filename == "~" else f"{_location(filename, lineno)}({name})",
+                 "calls": calls,
+                 "own_s": round(own, 3), "cumulative_s": round(cumulative, 3)}
+                for (filename, lineno, name), (_prim, calls, own, cumulative, _callers) in slowest
+            ],
+        }
+        if self.memory:
+            summary["peak_traced_mb"] = round(peak_traced / 2 ** 20, 1) if peak_traced else None
+            summary["allocations"] = self._allocations
+        with open(self.summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        logger.info("Build profile written to %s", self.prof_path)
+        self.pipeline.status_updated.emit("status_profile_written", {"path": str(self.prof_path)})
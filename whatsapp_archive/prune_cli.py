@@ -0,0 +1,32 @@
+"""
+Rebuild an archive with a state file exported from its page ("Export State" button).
+Deleted messages are left out; selections, notes, priorities and transcription edits are
+written into the new page. Media and transcriptions come from the caches next to the chat.
+Usage: python -m whatsapp_archive.prune_cli --chat _chat.txt --state chat_state.json --output pruned.html
+       [--title T] [--transcribe] [--encrypt] [--date-from YYYY-MM-DD] [--date-to YYYY-MM-DD]
+Options not given default to the desktop app's saved settings; they, the date range and
+--transcribe/--encrypt should match the build the state was exported from.
+Same as python -m whatsapp_archive build --state ... (see cli).
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from whatsapp_archive.cli import add_build_arguments, load_state_argument, run_build
+from whatsapp_archive.settings_store import load_settings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild an archive from a state file exported by its page.")
+    parser.add_argument("--state", required=True, type=Path, help="State file exported from the archive page")
+    add_build_arguments(parser, load_settings())
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    state = load_state_argument(args.state)
+    sys.exit(run_build(args, state))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Build report: figures collected by the build stages, written next to the archive."""
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from whatsapp_archive.config import VERSION
+
+
+def report_path(out_html: Path) -> Path:
+    """Location of the report for an archive: <stem>_build_report.json beside the HTML."""
+    return out_html.with_name(out_html.stem + "_build_report.json")
+
+
+def _format_bytes(count: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GB"
+
+
+def stage_rows(stages: dict[str, dict[str, Any]]) -> list[tuple[str, list[str]]]:
+    """(stage name, [time, CPU, items, read, written, peak memory]) for a report's "stages",
+    in build order with the total last; figures a stage does not have are left blank."""
+    rows = []
+    for name, entry in sorted(stages.items(), key=lambda item: item[0] == "total"):
+        cells = [f"{entry['wall_s']:.2f}" if "wall_s" in entry else "",
+                 f"{entry['cpu_s']:.2f}" if "cpu_s" in entry else "",
+                 str(entry["items"]) if "items" in entry else "",
+                 _format_bytes(entry["bytes_read"]) if entry.get("bytes_read") else "",
+                 _format_bytes(entry["bytes_written"]) if entry.get("bytes_written") else "",
+                 f"{entry['peak_rss_mb']:.0f} MB" if "peak_rss_mb" in entry else ""]
+        rows.append((name, cells))
+    return rows
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Highest resident memory of the process so far, or None where it cannot be read."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        try:
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+        except (AttributeError, OSError):
+            pass
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB elsewhere
+
+
+class BuildReport:
+    """Per-section key/value figures (e.g. "video": {"bytes_saved": ...}), and per-stage
+    timings and counters (see stage and count)."""
+
+    def __init__(self, on_stage_end: Optional[Callable[[str, int], None]] = None):
+        self.sections: dict[str, dict[str, Any]] = {}
+        self.stages: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._depth = 0  # stages currently open (stage() is used from the build thread only)
+        self._on_stage_end = on_stage_end  # called with (name, depth) when a stage ends
+
+    def add(self, section: str, **values: Any) -> None:
+        self.sections.setdefault(section, {}).update(values)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a build stage: wall and CPU seconds (CPU of the whole process, pool threads
+        included), and the process's peak resident memory when it ends. A stage run several
+        times adds up; a stage run inside another (transcription inside html) is also
+        counted in the outer one."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.count(name, wall_s=time.perf_counter() - wall, cpu_s=time.process_time() - cpu)
+            peak = peak_rss_bytes()
+            if peak is not None:
+                with self._lock:
+                    self.stages[name]["peak_rss_mb"] = round(peak / 2 ** 20, 1)
+            if self._on_stage_end:
+                self._on_stage_end(name, self._depth)
+
+    def count(self, stage: str, **values: float) -> None:
+        """Add to a stage's counters (items, bytes_read, bytes_written, ...). Safe from pool threads."""
+        with self._lock:
+            entry = self.stages.setdefault(stage, {})
+            for key, value in values.items():
+                entry[key] = entry.get(key, 0) + value
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            stages = {name: {key: round(value, 3) if isinstance(value, float) else value
+                             for key, value in entry.items()}
+                      for name, entry in self.stages.items()}
+        return {
+            "version": VERSION,
+            "generated": datetime.now().isoformat(timespec="seconds"),
+            **self.sections,
+            "stages": stages,
+        }
+
+    def write(self, out_html: Path) -> Path:
+        path = report_path(out_html)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
@@ -20,6 +20,16 @@ def _defaults():
         "lang": "en",
         "timezone_key": DEFAULT_TIMEZONE,
         "whisper_model_index": max(0, len(WHISPER_MODELS) - 1),
+        "transcode_video": False,
+        "compact_audio": False,
+        "shard_mode": "none",
+        "virtual_rendering": False,
+        "transcript_sidecar": False,
+        "shared_assets": False,
+        "minify_output": False,
+        "precompress_output": False,
+        "profile_builds": False,
+        "profile_memory": False,
         "last_directory": str(Path.home()),
         "window_x": 100,
         "window_y": 100,
@@ -0,0 +1,7 @@
+"""Build stages that prepare media before the HTML is written."""
+from whatsapp_archive.stages.audio import compact_audio
+from whatsapp_archive.stages.encryption import encrypt_media, load_archive_key
+from whatsapp_archive.stages.thumbnails import generate_thumbnails
+from whatsapp_archive.stages.video import process_videos
+
+__all__ = ["compact_audio", "encrypt_media", "generate_thumbnails", "load_archive_key", "process_videos"]
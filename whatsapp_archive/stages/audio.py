@@ -0,0 +1,118 @@
+"""Audio stage: compact mono Opus copies of large voice notes and recordings.
+
+Attachments above AUDIO_COMPACT_MIN_BYTES (or in an uncompressed format) are
+re-encoded to mono Opus at a speech bitrate. The archive links the compact copy
+when it is actually smaller; the original files are never modified and are still
+what Whisper transcribes. Results are cached under the chat's _archive_cache/audio
+folder by source fingerprint. Without ffmpeg the stage is skipped.
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from whatsapp_archive.config import AUDIO_COMPACT_ARGS, AUDIO_COMPACT_MIN_BYTES
+from whatsapp_archive.stages.ffmpeg import find_ffmpeg, run_ffmpeg
+from whatsapp_archive.stages.manifest import Manifest
+from whatsapp_archive.utils import file_fingerprint, temp_path
+
+if TYPE_CHECKING:
+    from whatsapp_archive.pipeline import ArchivePipeline
+
+# Always worth re-encoding, whatever their size.
+UNCOMPRESSED_EXTENSIONS = (".wav",)
+
+
+def needs_compaction(source: Path) -> bool:
+    """True if `source` is large enough (or uncompressed) to be worth re-encoding."""
+    if source.suffix.lower() in UNCOMPRESSED_EXTENSIONS:
+        return True
+    return source.stat().st_size >= AUDIO_COMPACT_MIN_BYTES
+
+
+def compact_audio(
+    sources: list[Path],
+    cache_dir: Path,
+    worker: "ArchivePipeline",
+    max_workers: int = 0,
+) -> tuple[dict[Path, Path], dict[str, int]]:
+    """Re-encode audio attachments that need it to mono Opus.
+
+    Returns ({source_path: compact_path}, stats); only sources whose compact copy is
+    smaller than the original appear in the mapping. stats holds
+    {"files", "compacted", "bytes_original", "bytes_output", "bytes_saved"}.
+    """
+    stats = {"files": 0, "compacted": 0, "bytes_original": 0, "bytes_output": 0, "bytes_saved": 0}
+    candidates = [s for s in dict.fromkeys(sources) if needs_compaction(s)]
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        if candidates:
+            worker.status_updated.emit("status_ffmpeg_missing", {})
+        return {}, stats
+
+    audio_dir = cache_dir / "audio"
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(audio_dir / "manifest.json")
+    results: dict[Path, Path] = {}
+
+    pending = []
+    for source in candidates:
+        fingerprint = file_fingerprint(source)
+        entry = manifest.get(source.name)
+        if entry and entry.get("source") == fingerprint and (
+            not entry.get("output") or (audio_dir / entry["output"]).exists()
+        ):
+            if entry.get("output"):
+                results[source] = audio_dir / entry["output"]
+        else:
+            pending.append((source, fingerprint))
+
+    def _encode_one(source: Path, fingerprint: str) -> Optional[dict[str, Any]]:
+        if worker.stop_requested:
+            return None
+        digest = hashlib.sha1(f"{source.name}:{fingerprint}".encode("utf-8")).hexdigest()[:10]
+        output_name = f"{source.stem}-{digest}.ogg"
+        output_path = audio_dir / output_name
+        part_path = temp_path(output_path, ".part.ogg")
+        entry: dict[str, Any] = {"source": fingerprint, "output": None}
+        try:
+            encoded = run_ffmpeg(ffmpeg, ["-i", str(source), "-vn", *AUDIO_COMPACT_ARGS, str(part_path)]) and part_path.exists()
+            if encoded and part_path.stat().st_size < source.stat().st_size:
+                os.replace(part_path, output_path)
+                entry["output"] = output_name
+        finally:
+            part_path.unlink(missing_ok=True)
+        # A failed or timed-out encode is left out of the manifest so the next build retries it.
+        if encoded:
+            manifest.set(source.name, entry)
+        return entry
+
+    if pending:
+        total = len(pending)
+        max_workers = max_workers or max(1, min(8, os.cpu_count() or 2))
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {pool.submit(_encode_one, *job): job[0] for job in pending}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    entry = future.result()
+                    if entry and entry["output"]:
+                        results[futures[future]] = audio_dir / entry["output"]
+                    worker.progress_updated.emit(done, total)
+                    worker.status_updated.emit("status_audio_compact", {"current": done, "total": total})
+                    if worker.stop_requested:
+                        for f in futures:
+                            f.cancel()
+                        break
+        finally:
+            manifest.save()
+
+    stats["files"] = len(candidates)
+    for source, output in results.items():
+        original = source.stat().st_size
+        compact = output.stat().st_size
+        stats["compacted"] += 1
+        stats["bytes_original"] += original
+        stats["bytes_output"] += compact
+        stats["bytes_saved"] += original - compact
+    return results, stats
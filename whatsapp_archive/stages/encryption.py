@@ -0,0 +1,137 @@
+"""Media encryption stage: encrypts every referenced file in a thread pool.
+
+A manifest in the encrypted media folder records, per output file, the source
+fingerprint and the id of the key it was encrypted with. Outputs that match the
+current source and archive key are skipped; anything else is re-encrypted.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from whatsapp_archive.encryptor import encrypt_file
+from whatsapp_archive.stages.manifest import Manifest
+from whatsapp_archive.utils import file_fingerprint, temp_path
+
+if TYPE_CHECKING:
+    from whatsapp_archive.pipeline import ArchivePipeline
+
+MANIFEST_NAME = "manifest.json"
+KEYS_FILE_NAME = "archive_keys.json"
+# Concurrent builds (see batch) may add keys to the same store: one read-modify-write at a time.
+_keys_lock = threading.Lock()
+
+
+def key_id(key_hex: str) -> str:
+    """Short, non-secret identifier of an archive key."""
+    return hashlib.sha256(bytes.fromhex(key_hex)).hexdigest()[:16]
+
+
+def load_archive_key(cache_dir: Path, media_output_folder: Path) -> str:
+    """Return the key used for this media folder on earlier runs, or create and remember a new one.
+
+    Keys are kept in the local cache next to the chat export (never in the shared media
+    folder), so rebuilding an archive keeps its key and can reuse already-encrypted files.
+    """
+    keys_file = cache_dir / KEYS_FILE_NAME
+    folder_key = str(media_output_folder.resolve())
+    with _keys_lock:
+        keys = {}
+        if keys_file.exists():
+            try:
+                with open(keys_file, "r", encoding="utf-8") as f:
+                    keys = json.load(f)
+            except Exception:
+                keys = {}
+        key_hex = keys.get(folder_key)
+        if key_hex:
+            return key_hex
+        from Crypto.Random import get_random_bytes
+
+        key_hex = get_random_bytes(16).hex()
+        keys[folder_key] = key_hex
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = temp_path(keys_file)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(keys, f, indent=2)
+        os.replace(tmp, keys_file)
+    return key_hex
+
+
+def encrypt_media(
+    jobs: list[tuple[Path, str]],
+    media_output_folder: Path,
+    key_hex: str,
+    worker: "ArchivePipeline",
+    max_workers: int = 0,
+) -> dict[str, int]:
+    """Encrypt (source_path, output_name) pairs into media_output_folder.
+
+    Returns counts: {"encrypted": n, "skipped": n, "failed": n}.
+    """
+    manifest = Manifest(media_output_folder / MANIFEST_NAME)
+    current_key = key_id(key_hex)
+    counts = {"encrypted": 0, "skipped": 0, "failed": 0}
+
+    pending = []
+    seen = set()
+    for source, output_name in jobs:
+        if output_name in seen:
+            continue
+        seen.add(output_name)
+        fingerprint = file_fingerprint(source)
+        entry = manifest.get(output_name)
+        if (
+            entry
+            and entry.get("source") == fingerprint
+            and entry.get("key_id") == current_key
+            and (media_output_folder / output_name).exists()
+        ):
+            counts["skipped"] += 1
+            continue
+        pending.append((source, output_name, fingerprint))
+
+    if counts["skipped"]:
+        worker.status_updated.emit("status_encryption_skipped", {"count": counts["skipped"]})
+    if not pending:
+        return counts
+
+    def _encrypt_one(source: Path, output_name: str, fingerprint: str) -> bool:
+        if worker.stop_requested:
+            return False
+        output_path = media_output_folder / output_name
+        if not encrypt_file(source, output_path, key_hex, worker):
+            manifest.remove(output_name)
+            return False
+        manifest.set(output_name, {
+            "source": fingerprint,
+            "key_id": current_key,
+            "size": output_path.stat().st_size,
+        })
+        return True
+
+    total = len(pending)
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_encrypt_one, *job): job for job in pending}
+            for done, future in enumerate(as_completed(futures), start=1):
+                source = futures[future][0]
+                if future.result():
+                    counts["encrypted"] += 1
+                elif not worker.stop_requested:
+                    counts["failed"] += 1
+                worker.progress_updated.emit(done, total)
+                worker.status_updated.emit(
+                    "status_encrypting_media", {"current": done, "total": total, "filename": source.name}
+                )
+                if worker.stop_requested:
+                    for f in futures:
+                        f.cancel()
+                    break
+    finally:
+        manifest.save()
+    return counts
@@ -0,0 +1,31 @@
+"""Locating and running the ffmpeg binary used by the video and audio stages."""
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from typing import Optional
+
+
+def find_ffmpeg() -> Optional[str]:
+    """Return the ffmpeg executable: next to the frozen app first, then on PATH. None if missing."""
+    if getattr(sys, "frozen", False):
+        bundled = Path(sys.executable).parent / ("ffmpeg.exe" if sys.platform == "win32" else "ffmpeg")
+        if bundled.exists():
+            return str(bundled)
+    return shutil.which("ffmpeg")
+
+
+def run_ffmpeg(ffmpeg: str, args: list[str], timeout: float = 600) -> bool:
+    """Run ffmpeg quietly with the given arguments. Returns True on success."""
+    creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+    try:
+        result = subprocess.run(
+            [ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin", "-y", *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+            creationflags=creationflags,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0
@@ -0,0 +1,49 @@
+"""JSON manifest used by the media stages to remember what they already produced."""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from whatsapp_archive.utils import temp_path
+
+MANIFEST_VERSION = 1
+
+
+class Manifest:
+    """A {name: entry-dict} map persisted as JSON. Safe to update from pool threads."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: dict[str, dict[str, Any]] = {}
+        if path.exists():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    self.entries = data.get("entries", {})
+            except Exception:
+                self.entries = {}
+
+    def get(self, name: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            return self.entries.get(name)
+
+    def set(self, name: str, entry: dict[str, Any]) -> None:
+        with self._lock:
+            self.entries[name] = entry
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            self.entries.pop(name, None)
+
+    def save(self) -> None:
+        """Write the manifest atomically (temp file + rename)."""
+        with self._lock:
+            data = {"version": MANIFEST_VERSION, "entries": self.entries}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = temp_path(self.path)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
@@ -0,0 +1,131 @@
+"""Image preview stage: downscaled, EXIF-oriented thumbnails with intrinsic dimensions.
+
+Thumbnails are written to a cache folder next to the chat export and reused while
+the source fingerprint is unchanged. Pillow is optional; without it the stage
+reports that previews are unavailable and the archive links the originals.
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from whatsapp_archive.config import THUMBNAIL_MAX_SIZE, THUMBNAIL_QUALITY
+from whatsapp_archive.stages.manifest import Manifest
+from whatsapp_archive.utils import file_fingerprint, temp_path
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow is optional
+    Image = None
+
+if TYPE_CHECKING:
+    from whatsapp_archive.pipeline import ArchivePipeline
+
+# Animated GIFs would lose their animation and SVGs are already small and scalable.
+SKIP_EXTENSIONS = (".gif", ".svg")
+
+
+def _thumbnail_format() -> tuple[str, str]:
+    if features.check("webp"):
+        return "WEBP", ".webp"
+    return "JPEG", ".jpg"
+
+
+def _make_thumbnail(source: Path, thumbs_dir: Path, fingerprint: str) -> dict[str, Any]:
+    """Write one thumbnail. Returns {"thumb": name or None, "width": w, "height": h}."""
+    with Image.open(source) as img:
+        orientation = img.getexif().get(0x0112, 1)
+        img = ImageOps.exif_transpose(img)
+        if max(img.size) <= THUMBNAIL_MAX_SIZE and orientation == 1:
+            # Already small and upright: keep the original, just record its size.
+            return {"thumb": None, "width": img.width, "height": img.height}
+        img.thumbnail((THUMBNAIL_MAX_SIZE, THUMBNAIL_MAX_SIZE))
+        fmt, ext = _thumbnail_format()
+        if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        digest = hashlib.sha1(f"{source.name}:{fingerprint}".encode("utf-8")).hexdigest()[:10]
+        name = f"{source.stem}-{digest}{ext}"
+        part_path = temp_path(thumbs_dir / name, ".part")
+        try:
+            img.save(part_path, fmt, quality=THUMBNAIL_QUALITY)
+            os.replace(part_path, thumbs_dir / name)
+        finally:
+            part_path.unlink(missing_ok=True)
+        return {"thumb": name, "width": img.width, "height": img.height}
+
+
+def generate_thumbnails(
+    sources: list[Path],
+    cache_dir: Path,
+    worker: "ArchivePipeline",
+    max_workers: int = 0,
+) -> dict[Path, dict[str, Any]]:
+    """Create previews for image files in a thread pool, reusing cached ones.
+
+    Returns {source_path: {"path": thumbnail Path or None, "width": w, "height": h}};
+    "path" is None when the original is small enough to be shown as-is.
+    """
+    if Image is None:
+        worker.status_updated.emit("status_thumbnails_unavailable", {})
+        return {}
+
+    thumbs_dir = cache_dir / "thumbs"
+    thumbs_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(thumbs_dir / "manifest.json")
+    results: dict[Path, dict[str, Any]] = {}
+
+    def _record(source: Path, entry: dict[str, Any]) -> None:
+        results[source] = {
+            "path": (thumbs_dir / entry["thumb"]) if entry["thumb"] else None,
+            "width": entry["width"],
+            "height": entry["height"],
+        }
+
+    pending = []
+    for source in dict.fromkeys(sources):
+        if source.suffix.lower() in SKIP_EXTENSIONS:
+            continue
+        fingerprint = file_fingerprint(source)
+        entry = manifest.get(source.name)
+        if entry and entry.get("source") == fingerprint and (
+            entry["thumb"] is None or (thumbs_dir / entry["thumb"]).exists()
+        ):
+            _record(source, entry)
+        else:
+            pending.append((source, fingerprint))
+
+    if not pending:
+        return results
+
+    def _thumb_one(source: Path, fingerprint: str) -> Optional[dict[str, Any]]:
+        if worker.stop_requested:
+            return None
+        try:
+            entry = _make_thumbnail(source, thumbs_dir, fingerprint)
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).warning("Thumbnail failed for %s: %s", source.name, e)
+            return None
+        entry["source"] = fingerprint
+        manifest.set(source.name, entry)
+        return entry
+
+    total = len(pending)
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_thumb_one, *job): job[0] for job in pending}
+            for done, future in enumerate(as_completed(futures), start=1):
+                entry = future.result()
+                if entry:
+                    _record(futures[future], entry)
+                worker.progress_updated.emit(done, total)
+                worker.status_updated.emit("status_thumbnails", {"current": done, "total": total})
+                if worker.stop_requested:
+                    for f in futures:
+                        f.cancel()
+                    break
+    finally:
+        manifest.save()
+    return results
@@ -0,0 +1,153 @@
+"""Video stage: poster frames and optional lightweight H.264/Opus renditions.
+
+Each video gets a poster frame; with transcoding enabled it also gets a capped-bitrate
+MP4 that replaces the original in the archive when it is actually smaller. Work runs
+as a bounded number of concurrent ffmpeg processes, cached under the chat's
+_archive_cache/video folder by source fingerprint. Without ffmpeg the stage is skipped.
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from whatsapp_archive.config import THUMBNAIL_MAX_SIZE, VIDEO_TRANSCODE_ARGS
+from whatsapp_archive.stages.ffmpeg import find_ffmpeg, run_ffmpeg
+from whatsapp_archive.stages.manifest import Manifest
+from whatsapp_archive.utils import file_fingerprint, temp_path
+
+if TYPE_CHECKING:
+    from whatsapp_archive.pipeline import ArchivePipeline
+
+
+def _extract_poster(ffmpeg: str, source: Path, poster_path: Path) -> bool:
+    scale = f"scale='min({THUMBNAIL_MAX_SIZE},iw)':-2"
+    part_path = temp_path(poster_path, ".part.jpg")
+    try:
+        # One second in skips black intro frames; very short clips fall back to the first frame.
+        for seek in ("1", "0"):
+            if run_ffmpeg(ffmpeg, ["-ss", seek, "-i", str(source), "-frames:v", "1", "-vf", scale,
+                                   "-q:v", "4", str(part_path)]) and part_path.exists() and part_path.stat().st_size:
+                os.replace(part_path, poster_path)
+                return True
+        return False
+    finally:
+        part_path.unlink(missing_ok=True)
+
+
+def _transcode(ffmpeg: str, source: Path, video_path: Path) -> bool:
+    part_path = temp_path(video_path, ".part.mp4")
+    try:
+        ok = run_ffmpeg(ffmpeg, ["-i", str(source), *VIDEO_TRANSCODE_ARGS, str(part_path)], timeout=3600)
+        if ok and part_path.exists():
+            os.replace(part_path, video_path)
+            return True
+        return False
+    finally:
+        part_path.unlink(missing_ok=True)
+
+
+def process_videos(
+    sources: list[Path],
+    cache_dir: Path,
+    worker: "ArchivePipeline",
+    transcode: bool = False,
+    max_workers: int = 0,
+) -> tuple[dict[Path, dict[str, Any]], dict[str, int]]:
+    """Create posters (and, if `transcode`, compact renditions) for video files.
+
+    Returns ({source_path: {"poster": Path or None, "video": Path or None}}, stats), where
+    "video" is only set when the rendition is smaller than the original, and stats holds
+    {"videos", "posters", "transcoded", "bytes_original", "bytes_output", "bytes_saved"}.
+    """
+    stats = {"videos": 0, "posters": 0, "transcoded": 0,
+             "bytes_original": 0, "bytes_output": 0, "bytes_saved": 0}
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        if sources:
+            worker.status_updated.emit("status_ffmpeg_missing", {})
+        return {}, stats
+
+    video_dir = cache_dir / "video"
+    video_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(video_dir / "manifest.json")
+    results: dict[Path, dict[str, Any]] = {}
+
+    def _record(source: Path, entry: dict[str, Any]) -> None:
+        poster = video_dir / entry["poster"] if entry.get("poster") else None
+        # A rendition cached by an earlier run is only used while transcoding is enabled.
+        video = video_dir / entry["video"] if transcode and entry.get("video") else None
+        results[source] = {"poster": poster, "video": video}
+
+    def _is_fresh(entry: Optional[dict[str, Any]], fingerprint: str) -> bool:
+        if not entry or entry.get("source") != fingerprint:
+            return False
+        # A failed or timed-out ffmpeg run is retried on the next build.
+        if entry.get("failed") or (transcode and not entry.get("transcode_done")):
+            return False
+        return all((video_dir / entry[k]).exists() for k in ("poster", "video") if entry.get(k))
+
+    pending = []
+    for source in dict.fromkeys(sources):
+        fingerprint = file_fingerprint(source)
+        entry = manifest.get(source.name)
+        if _is_fresh(entry, fingerprint):
+            _record(source, entry)
+        else:
+            pending.append((source, fingerprint))
+
+    def _process_one(source: Path, fingerprint: str) -> Optional[dict[str, Any]]:
+        if worker.stop_requested:
+            return None
+        digest = hashlib.sha1(f"{source.name}:{fingerprint}".encode("utf-8")).hexdigest()[:10]
+        entry: dict[str, Any] = {"source": fingerprint, "poster": None, "video": None}
+        poster_name = f"{source.stem}-{digest}.poster.jpg"
+        if _extract_poster(ffmpeg, source, video_dir / poster_name):
+            entry["poster"] = poster_name
+        else:
+            entry["failed"] = True
+        if transcode and not worker.stop_requested:
+            video_name = f"{source.stem}-{digest}.mp4"
+            if _transcode(ffmpeg, source, video_dir / video_name):
+                if (video_dir / video_name).stat().st_size < source.stat().st_size:
+                    entry["video"] = video_name
+                else:
+                    (video_dir / video_name).unlink()
+                entry["transcode_done"] = True
+            else:
+                entry["failed"] = True
+        manifest.set(source.name, entry)
+        return entry
+
+    if pending:
+        total = len(pending)
+        # ffmpeg is multi-threaded itself; a few concurrent processes saturate the CPU.
+        max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {pool.submit(_process_one, *job): job[0] for job in pending}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    entry = future.result()
+                    if entry:
+                        _record(futures[future], entry)
+                    worker.progress_updated.emit(done, total)
+                    worker.status_updated.emit("status_video", {"current": done, "total": total})
+                    if worker.stop_requested:
+                        for f in futures:
+                            f.cancel()
+                        break
+        finally:
+            manifest.save()
+
+    for source, info in results.items():
+        stats["videos"] += 1
+        if info["poster"]:
+            stats["posters"] += 1
+        if info["video"]:
+            original = source.stat().st_size
+            output = info["video"].stat().st_size
+            stats["transcoded"] += 1
+            stats["bytes_original"] += original
+            stats["bytes_output"] += output
+            stats["bytes_saved"] += original - output
+    return results, stats
@@ -1,18 +1,92 @@
-"""Whisper model loading, transcription, and cache handling."""
+"""Whisper model loading, transcription, and cache handling.
+
+Whisper (and torch with it) is imported the first time a model is loaded, so starting
+the app or building without transcription never pays for it. Loaded models are kept for
+the process; the app starts loading one in the background once its window is up.
+"""
 import json
+import logging
+import sys
+import threading
 import time
 from pathlib import Path
-from typing import Any, Optional, TYPE_CHECKING
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+from whatsapp_archive.config import WHISPER_MODELS
 
 if TYPE_CHECKING:
-    from whatsapp_archive.gui.worker import ChatWorker
+    from whatsapp_archive.pipeline import ArchivePipeline
+
+logger = logging.getLogger(__name__)
+
+_model_lock = threading.RLock()
+_loaded_model: Optional[tuple[int, Any]] = None  # (model index, model); one model at a time
+_latest_preload: Optional[object] = None  # the most recent preload_whisper_model request
+# Builds running side by side (see batch) share the model, one transcription at a time.
+_transcribe_lock = threading.Lock()
+
+
+def _model_index(index: int) -> int:
+    return index if 0 <= index < len(WHISPER_MODELS) else len(WHISPER_MODELS) - 1
+
+
+def load_whisper_model(index: int, status: Optional[Callable[[str, dict], None]] = None) -> Any:
+    """The Whisper model WHISPER_MODELS[index] (the last one if out of range), loading it
+    if needed. A bundled model file is preferred over a download. Thread-safe: a caller
+    waits for a load already in progress instead of starting another."""
+    global _loaded_model
+    idx = _model_index(index)
+    with _model_lock:
+        if _loaded_model is not None and _loaded_model[0] == idx:
+            return _loaded_model[1]
+        import whisper
+
+        if getattr(sys, "frozen", False):
+            bundle_dir = Path(sys.executable).parent
+        else:
+            bundle_dir = Path(__file__).resolve().parent.parent
+        _display_name, load_name, local_file = WHISPER_MODELS[idx]
+        model_file = (bundle_dir / local_file) if local_file else None
+        # Drop the previous model first: two large models may not fit in memory.
+        _loaded_model = None
+        if model_file and model_file.exists():
+            if status:
+                status("status_found_local_model", {"model_name": model_file.name})
+            model = whisper.load_model(str(model_file))
+        else:
+            if status:
+                status("status_downloading_model", {})
+            model = whisper.load_model(load_name)
+        _loaded_model = (idx, model)
+        return model
+
+
+def preload_whisper_model(index: int) -> threading.Thread:
+    """Start loading a model in a daemon thread; a later load_whisper_model call gets it.
+    A preload that has not started loading when a newer one is requested is dropped."""
+    global _latest_preload
+    request = _latest_preload = object()
+
+    def run():
+        try:
+            with _model_lock:
+                if _latest_preload is not request:
+                    return
+                load_whisper_model(index)
+        except Exception as e:
+            # The build loads the model again and reports the error there.
+            logger.warning("Background Whisper model load failed: %s", e)
+
+    thread = threading.Thread(target=run, name="whisper-preload", daemon=True)
+    thread.start()
+    return thread
 
 
 def transcribe_audio_file(
     model: Any,
     audio_path: Path,
     cache_dir: Path,
-    worker: "ChatWorker",
+    worker: "ArchivePipeline",
     current_count: int,
     total_count: int,
 ) -> str:
@@ -22,7 +96,9 @@ def transcribe_audio_file(
     if cache_file.exists():
         try:
             with open(cache_file, "r", encoding="utf-8") as f:
-                return json.load(f)["text"]
+                text = json.load(f)["text"]
+            worker.report.count("transcription", cached=1)
+            return text
         except Exception:
             pass
     try:
@@ -30,9 +106,11 @@ def transcribe_audio_file(
             "status_transcribing",
             {"current": current_count, "total": total_count, "filename": audio_path.name},
         )
-        start_time = time.perf_counter()
-        result = model.transcribe(str(audio_path))
-        end_time = time.perf_counter()
+        with _transcribe_lock, worker.report.stage("transcription"):
+            start_time = time.perf_counter()
+            result = model.transcribe(str(audio_path))
+            end_time = time.perf_counter()
+            worker.report.count("transcription", items=1, bytes_read=audio_path.stat().st_size)
         worker.total_transcription_time += end_time - start_time
         text = result.get("text", "").strip()
         with open(cache_file, "w", encoding="utf-8") as f:
@@ -30,6 +30,17 @@ TRANSLATIONS = {
         "title_label": "Archive Title:",
         "transcribe_label": "Transcribe Audio Files (can be slow)",
         "encrypt_label": "Encrypt media for sharing (Slower, creates new folder)",
+        "transcode_video_label": "Compress videos for the archive (requires ffmpeg, slower)",
+        "compact_audio_label": "Compress large voice notes to Opus (requires ffmpeg)",
+        "virtual_rendering_label": "Render messages on demand (for very large chats)",
+        "transcript_sidecar_label": "Load transcriptions on demand (separate file)",
+        "shared_assets_label": "Shared style and script files (assets folder, cached across archives)",
+        "minify_output_label": "Minify the HTML, CSS and JavaScript",
+        "precompress_output_label": "Write compressed copies for web hosting (.gz, .br)",
+        "shard_label": "Split archive:",
+        "shard_none": "Single page",
+        "shard_month": "One page per month",
+        "shard_count": "One page per {count} messages",
         "select_chat_btn": "1. Select Chat File (_chat.txt)",
         "chat_file_label": "No chat file selected.",
         "media_folder_label": "Media folder will be inferred from chat file location.",
@@ -66,23 +77,55 @@ TRANSLATIONS = {
         "status_scanning_audio": "Scanning folder for all audio files...",
         "status_found_external": "Found {count} external audio files.",
         "status_sorting": "Sorting {count} total messages...",
+        "status_pruning": "Removing {count} messages deleted in the page state...",
         "status_no_messages": "No messages or audio files could be loaded.",
         "status_counting_audio": "Counting audio files to transcribe...",
         "status_building_html": "Building HTML...",
+        "status_precompressing": "Finishing compressed copies...",
         "status_transcribing": "Transcribing {current}/{total}: {filename}...",
         "status_encrypting": "Encrypting {filename}...",
         "status_encrypting_error": "Failed to encrypt {filename}.",
+        "status_encrypting_media": "Encrypting media {current}/{total}: {filename}...",
+        "status_encryption_skipped": "{count} encrypted files are already up to date.",
+        "status_thumbnails": "Creating image previews {current}/{total}...",
+        "status_thumbnails_unavailable": "Pillow is not installed; image previews skipped.",
+        "status_video": "Processing videos {current}/{total}...",
+        "status_ffmpeg_missing": "ffmpeg was not found; video posters and media compression skipped.",
+        "status_audio_compact": "Compressing voice notes {current}/{total}...",
         "status_processing": "Processing messages...",
         "status_stop_requested": "Stop requested, finishing current file...",
         "status_done_time": "Done! Total transcription time: {time:.2f} seconds.",
         "status_done_no_time": "Done! (No new transcriptions were needed).",
         "status_stopped": "Process stopped by user.",
+        "status_profile_written": "Build profile written to {path}",
+        "stages_title": "Build stages",
+        "stages_col_stage": "Stage",
+        "stages_col_time": "Time (s)",
+        "stages_col_cpu": "CPU (s)",
+        "stages_col_items": "Items",
+        "stages_col_read": "Read",
+        "stages_col_written": "Written",
+        "stages_col_memory": "Peak memory",
+        "stage_total": "Total",
+        "stage_model": "Whisper model",
+        "stage_parse": "Chat parsing",
+        "stage_media_scan": "Media scan",
+        "stage_external_audio": "External audio",
+        "stage_sort": "Sorting",
+        "stage_audio_check": "Audio check",
+        "stage_thumbnails": "Image previews",
+        "stage_video": "Videos",
+        "stage_audio": "Voice notes",
+        "stage_encryption": "Encryption",
+        "stage_html": "HTML",
+        "stage_transcription": "Transcription",
 
         "html_select_all": "Select all",
         "html_clear": "Clear",
         "html_invert": "Invert",
         "html_delete_selected": "Delete selected",
         "html_download_pruned": "Download Pruned HTML",
+        "html_export_state": "Export State (JSON)",
         "html_theme_dark": "🌙 Dark Theme",
         "html_theme_light": "☀️ Light Theme",
         "html_theme_vibrant": "🎨 Vibrant Theme",
@@ -98,6 +141,7 @@ TRANSLATIONS = {
         "html_note_placeholder": "Add a note…",
         "html_notes_saved": "Notes saved!",
         "html_message_deleted": "Message {num} — Deleted",
+        "html_export_progress": "Preparing export… {percent}%",
         "html_show_my_interventions": "Show my interventions",
         "html_show_all_msgs": "Show all messages",
         "html_report_pdf": "Report (PDF)",
@@ -119,6 +163,16 @@ TRANSLATIONS = {
         "html_report_priority_amber": "Amber",
         "html_report_priority_orange": "Orange",
         "html_report_priority_white": "White",
+        "html_shard_index": "⌂ Index",
+        "html_shard_prev": "← Previous",
+        "html_shard_next": "Next →",
+        "html_shard_other_pages": "Also found in:",
+        "html_index_search_placeholder": "Search all pages…",
+        "html_index_summary": "{messages} messages across {pages} pages.",
+        "html_index_calendar": "Calendar",
+        "html_index_pages": "Pages",
+        "html_index_no_results": "No matches.",
+        "html_index_more_results": "Showing the first {count} matches.",
 
         "how_to_use_content": """
             <h2>Welcome! Here's how to use this tool.</h2>
@@ -198,6 +252,17 @@ TRANSLATIONS = {
         "title_label": "Titre de l'archive :",
         "transcribe_label": "Transcrire les fichiers audio (peut être lent)",
         "encrypt_label": "Crypter les médias pour le partage (Plus lent, crée un dossier)",
+        "transcode_video_label": "Compresser les vidéos pour l'archive (nécessite ffmpeg, plus lent)",
+        "compact_audio_label": "Compresser les notes vocales volumineuses en Opus (nécessite ffmpeg)",
+        "virtual_rendering_label": "Afficher les messages à la demande (très longues discussions)",
+        "transcript_sidecar_label": "Charger les transcriptions à la demande (fichier séparé)",
+        "shared_assets_label": "Fichiers de style et de script partagés (dossier assets, en cache entre archives)",
+        "minify_output_label": "Minifier le HTML, le CSS et le JavaScript",
+        "precompress_output_label": "Écrire des copies compressées pour l'hébergement web (.gz, .br)",
+        "shard_label": "Découper l'archive :",
+        "shard_none": "Page unique",
+        "shard_month": "Une page par mois",
+        "shard_count": "Une page par tranche de {count} messages",
         "select_chat_btn": "1. Sélectionner le fichier de chat (_chat.txt)",
         "chat_file_label": "Aucun fichier de chat sélectionné.",
         "media_folder_label": "Le dossier multimédia sera déduit de l'emplacement du fichier de chat.",
@@ -234,23 +299,55 @@ TRANSLATIONS = {
         "status_scanning_audio": "Analyse du dossier pour les fichiers audio...",
         "status_found_external": "Trouvé {count} fichiers audio externes.",
         "status_sorting": "Tri de {count} messages au total...",
+        "status_pruning": "Suppression de {count} messages supprimés dans l'état de la page...",
         "status_no_messages": "Aucun message ou fichier audio n'a pu être chargé.",
         "status_counting_audio": "Comptage des fichiers audio à transcrire...",
         "status_building_html": "Création du HTML...",
+        "status_precompressing": "Finalisation des copies compressées...",
         "status_transcribing": "Transcription {current}/{total} : {filename}...",
         "status_encrypting": "Cryptage de {filename}...",
         "status_encrypting_error": "Échec du cryptage de {filename}.",
+        "status_encrypting_media": "Cryptage des médias {current}/{total} : {filename}...",
+        "status_encryption_skipped": "{count} fichiers cryptés sont déjà à jour.",
+        "status_thumbnails": "Création des aperçus d'images {current}/{total}...",
+        "status_thumbnails_unavailable": "Pillow n'est pas installé ; aperçus d'images ignorés.",
+        "status_video": "Traitement des vidéos {current}/{total}...",
+        "status_ffmpeg_missing": "ffmpeg est introuvable ; affiches vidéo et compression des médias ignorées.",
+        "status_audio_compact": "Compression des notes vocales {current}/{total}...",
         "status_processing": "Traitement des messages...",
         "status_stop_requested": "Arrêt demandé, fin du fichier actuel...",
         "status_done_time": "Terminé ! Temps total de transcription : {time:.2f} secondes.",
         "status_done_no_time": "Terminé ! (Aucune nouvelle transcription n'était nécessaire).",
         "status_stopped": "Processus arrêté par l'utilisateur.",
+        "status_profile_written": "Profil de la conversion écrit dans {path}",
+        "stages_title": "Étapes de la conversion",
+        "stages_col_stage": "Étape",
+        "stages_col_time": "Durée (s)",
+        "stages_col_cpu": "CPU (s)",
+        "stages_col_items": "Éléments",
+        "stages_col_read": "Lu",
+        "stages_col_written": "Écrit",
+        "stages_col_memory": "Mémoire max.",
+        "stage_total": "Total",
+        "stage_model": "Modèle Whisper",
+        "stage_parse": "Lecture du chat",
+        "stage_media_scan": "Recherche des médias",
+        "stage_external_audio": "Audios externes",
+        "stage_sort": "Tri",
+        "stage_audio_check": "Vérification audio",
+        "stage_thumbnails": "Aperçus d'images",
+        "stage_video": "Vidéos",
+        "stage_audio": "Notes vocales",
+        "stage_encryption": "Chiffrement",
+        "stage_html": "HTML",
+        "stage_transcription": "Transcription",
 
         "html_select_all": "Tout Sél.",
         "html_clear": "Effacer",
         "html_invert": "Inverser",
         "html_delete_selected": "Suppr. Sél.",
         "html_download_pruned": "Télécharger HTML Nettoyé",
+        "html_export_state": "Exporter l'état (JSON)",
         "html_theme_dark": "🌙 Thème Sombre",
         "html_theme_light": "☀️ Thème Clair",
         "html_theme_vibrant": "🎨 Thème Vibrant",
@@ -266,6 +363,7 @@ TRANSLATIONS = {
         "html_note_placeholder": "Ajouter une note…",
         "html_notes_saved": "Notes sauvegardées !",
         "html_message_deleted": "Message {num} — Supprimé",
+        "html_export_progress": "Préparation de l'export… {percent} %",
         "html_show_my_interventions": "Voir mes interventions",
         "html_show_all_msgs": "Voir tous les messages",
         "html_report_pdf": "Rapport (PDF)",
@@ -287,6 +385,16 @@ TRANSLATIONS = {
         "html_report_priority_amber": "Ambre",
         "html_report_priority_orange": "Orange",
         "html_report_priority_white": "Blanc",
+        "html_shard_index": "⌂ Sommaire",
+        "html_shard_prev": "← Précédent",
+        "html_shard_next": "Suivant →",
+        "html_shard_other_pages": "Aussi trouvé dans :",
+        "html_index_search_placeholder": "Rechercher dans toutes les pages…",
+        "html_index_summary": "{messages} messages sur {pages} pages.",
+        "html_index_calendar": "Calendrier",
+        "html_index_pages": "Pages",
+        "html_index_no_results": "Aucun résultat.",
+        "html_index_more_results": "Affichage des {count} premiers résultats.",
 
         "how_to_use_content": """
             <h2>Bienvenue ! Voici comment utiliser cet outil.</h2>
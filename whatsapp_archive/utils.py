@@ -1,13 +1,21 @@
 """Logging setup and path helpers."""
 import logging
+import os
+import threading
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
 
-def setup_logging() -> logging.Logger:
-    """Configure package logging to a rotating file. Returns the module logger."""
+def log_directory() -> Path:
+    """Folder of the app log, also used for diagnostics such as build profiles (see profiling)."""
     log_dir = Path(__file__).resolve().parent.parent / "logs"
     log_dir.mkdir(exist_ok=True)
+    return log_dir
+
+
+def setup_logging() -> logging.Logger:
+    """Configure package logging to a rotating file. Returns the module logger."""
+    log_dir = log_directory()
     log_file = log_dir / "app.log"
     handler = RotatingFileHandler(
         log_file, maxBytes=1024 * 1024, backupCount=3, encoding="utf-8"
@@ -20,3 +28,15 @@ def setup_logging() -> logging.Logger:
     if not root.handlers:
         root.addHandler(handler)
     return logging.getLogger(__name__)
+
+
+def file_fingerprint(path: Path) -> str:
+    """Cheap change detector for a source file: size and mtime in nanoseconds."""
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def temp_path(path: Path, suffix: str = ".tmp") -> Path:
+    """Name to write `path` under before renaming it into place, unique to this process and
+    thread: concurrent builds (see batch) may write the same file."""
+    return path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}{suffix}")
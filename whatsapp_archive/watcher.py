@@ -0,0 +1,367 @@
+"""Watch-folder daemon: builds an archive whenever a chat export lands in a watched folder.
+
+An export is a folder holding a chat .txt and its media (an extracted WhatsApp export), or
+a chat .txt saved directly in a watched folder. It is built once its files have stopped
+changing for `settle` seconds, so a copy in progress is not picked up half-way.
+
+The chat is identified from its first messages (see parser.chat_identity) and the export is
+merged into a folder kept for that chat under the work folder: the chat text is replaced and
+media files it does not have yet are copied in. Builds run from that folder, so a weekly
+re-export of the same chat reuses the parsed messages, transcriptions, previews and
+encrypted media of the previous builds, and only its new messages cost anything.
+
+Changes are noticed through inotify on Linux, with a rescan every `poll` seconds as the
+fallback elsewhere. <output dir>/watch_status.json reports the queue depth, the build in
+progress and the last build; it also records what was built, so a restart does not
+rebuild every export.
+"""
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import logging
+import os
+import queue
+import select
+import shutil
+import signal
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+from whatsapp_archive.batch import output_name
+from whatsapp_archive.config import APP_FOLDERS
+from whatsapp_archive.parser import chat_identity, find_chat_exports
+from whatsapp_archive.pipeline import ArchivePipeline, BuildError
+from whatsapp_archive.translations import TRANSLATIONS
+
+logger = logging.getLogger(__name__)
+
+STATUS_NAME = "watch_status.json"
+STATUS_VERSION = 1
+# Name of the chat text in a chat's work folder, whatever the export called it.
+WORK_CHAT_NAME = "_chat.txt"
+
+# inotify(7)
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_IGNORED = 0x8000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Linux inotify watches on a set of folder trees. Only used to wake the scanner up."""
+
+    def __init__(self, libc, fd: int):
+        self._libc = libc
+        self._fd = fd
+        self._paths: dict[int, Path] = {}  # watch descriptor -> folder
+
+    @classmethod
+    def open(cls) -> Optional["_Inotify"]:
+        """An inotify instance, or None where inotify is not available."""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def watch_trees(self, roots: list[Path]) -> None:
+        """Watch every folder under `roots` that is not watched yet (new export folders)."""
+        watched = set(self._paths.values())
+        for root in roots:
+            for folder, dirs, _files in os.walk(root):
+                dirs[:] = [d for d in dirs if d not in APP_FOLDERS]
+                path = Path(folder)
+                if path in watched:
+                    continue
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+                if wd < 0:
+                    # Usually the fs.inotify.max_user_watches limit; the poll interval still applies.
+                    logger.warning("Cannot watch %s: %s", path, os.strerror(ctypes.get_errno()))
+                    continue
+                self._paths[wd] = path
+
+    def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for changes. True if there were any."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return True
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                if mask & _IN_IGNORED:
+                    self._paths.pop(wd, None)  # folder deleted: watch it again if it comes back
+                offset += _EVENT_HEADER.size + length
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def export_files(chat: Path, roots: list[Path]) -> list[Path]:
+    """The files of the export holding `chat`: its folder's files, or only the chat text when
+    it was saved directly in a watched folder (which may hold other exports' media)."""
+    if chat.parent in roots:
+        return [chat]
+    return sorted(p for p in chat.parent.iterdir()
+                  if p.is_file() and (p == chat or p.suffix.lower() != ".txt"))
+
+
+def files_snapshot(files: list[Path]) -> str:
+    """Changes whenever a file of the export is added, removed or rewritten."""
+    digest = hashlib.sha1()
+    for path in files:
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        digest.update(f"{path.name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+
+def merge_export(chat: Path, files: list[Path], work_folder: Path) -> None:
+    """Copy an export into the chat's work folder. Media files already there from an earlier
+    export are kept as they are, so the caches built from them stay valid."""
+    work_folder.mkdir(parents=True, exist_ok=True)
+    for source in files:
+        target = work_folder / (WORK_CHAT_NAME if source == chat else source.name)
+        if source != chat and target.exists() and target.stat().st_size == source.stat().st_size:
+            continue
+        part = target.with_name(target.name + ".part")
+        shutil.copy2(source, part)
+        os.replace(part, target)
+
+
+class FolderWatcher:
+    """Watches `folders` and builds each settled export into `output_dir` (see module doc).
+
+    `options` are build options named as on the command line (see cli.pipeline_options).
+    """
+
+    def __init__(self, folders: list[Path], output_dir: Path, options: dict,
+                 work_dir: Optional[Path] = None, settle: float = 10.0, poll: float = 10.0):
+        self.folders = [Path(folder) for folder in folders]
+        self.output_dir = output_dir
+        self.options = options
+        self.work_dir = work_dir or output_dir / "_chats"
+        self.settle = settle
+        self.poll = poll
+        self.status_path = output_dir / STATUS_NAME
+        self._T = TRANSLATIONS[options["lang"]]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._queue: "queue.Queue[Optional[Path]]" = queue.Queue()
+        self._queued: set[Path] = set()
+        self._settling: dict[Path, tuple[str, float]] = {}  # chat -> (snapshot, time it was taken)
+        self._pipeline: Optional[ArchivePipeline] = None
+        self.status = self._load_status()
+
+    def _load_status(self) -> dict[str, Any]:
+        status: dict[str, Any] = {"chats": {}, "exports": {}, "last_build": None, "last_build_time": None}
+        try:
+            with open(self.status_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("version") == STATUS_VERSION:
+                for key in status:
+                    status[key] = saved.get(key, status[key])
+        except (OSError, ValueError):
+            pass
+        status.update(version=STATUS_VERSION, pid=os.getpid(), started=datetime.now().isoformat(timespec="seconds"),
+                      folders=[str(folder) for folder in self.folders], mode=None, building=None,
+                      queue_depth=0, settling=0)
+        return status
+
+    def _write_status(self) -> None:
+        with self._lock:
+            self.status["queue_depth"] = len(self._queued)
+            self.status["settling"] = len(self._settling)
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.status_path.with_name(self.status_path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.status, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.status_path)
+
+    def stop(self) -> None:
+        """Stop watching; the build in progress stops at its next check."""
+        self._stop.set()
+        with self._lock:
+            if self._pipeline is not None:
+                self._pipeline.request_stop()
+
+    def scan(self) -> None:
+        """Queue the exports that changed since they were built and have settled."""
+        now = time.monotonic()
+        found = set()
+        changed = False
+        for root in self.folders:
+            if not root.is_dir():
+                continue
+            for chat in find_chat_exports(root):
+                found.add(chat)
+                try:
+                    snapshot = files_snapshot(export_files(chat, self.folders))
+                except OSError:
+                    continue  # folder removed while scanning
+                with self._lock:
+                    if chat in self._queued or self.status["exports"].get(str(chat)) == snapshot:
+                        changed |= self._settling.pop(chat, None) is not None
+                        continue
+                    seen = self._settling.get(chat)
+                    if seen is None or seen[0] != snapshot:
+                        self._settling[chat] = (snapshot, now)
+                        changed = True
+                    elif now - seen[1] >= self.settle:
+                        del self._settling[chat]
+                        self._queued.add(chat)
+                        self._queue.put(chat)
+                        logger.info("Queued %s", chat)
+                        changed = True
+        with self._lock:
+            for chat in set(self._settling) - found:
+                del self._settling[chat]
+                changed = True
+        if changed:
+            self._write_status()
+
+    def _next_timeout(self) -> float:
+        with self._lock:
+            deadlines = [taken + self.settle for _snapshot, taken in self._settling.values()]
+        if not deadlines:
+            return self.poll
+        return max(0.5, min(self.poll, min(deadlines) - time.monotonic()))
+
+    def run(self) -> None:
+        """Watch until stop() is called or the process gets SIGINT/SIGTERM."""
+        inotify = _Inotify.open()
+        self.status["mode"] = "inotify" if inotify else "polling"
+        logger.info("Watching %s (%s)", ", ".join(map(str, self.folders)), self.status["mode"])
+        if self.options["transcribe"] or self.options["encrypt"]:
+            from whatsapp_archive.transcriber import preload_whisper_model
+            preload_whisper_model(self.options["model_index"])
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+        builder = threading.Thread(target=self._build_loop, name="watch-build", daemon=True)
+        builder.start()
+        self._write_status()
+        try:
+            while not self._stop.is_set():
+                if inotify:
+                    inotify.watch_trees([root for root in self.folders if root.is_dir()])
+                self.scan()
+                if inotify:
+                    inotify.wait(self._next_timeout())
+                else:
+                    self._stop.wait(self._next_timeout())
+        except KeyboardInterrupt:
+            logger.info("Stopping")
+        finally:
+            self.stop()
+            with self._lock:
+                self._queued.clear()  # pending builds are picked up again on the next start
+            self._queue.put(None)
+            builder.join()
+            if inotify:
+                inotify.close()
+            self.status["building"] = None
+            self._write_status()
+
+    def _build_loop(self) -> None:
+        while True:
+            chat = self._queue.get()
+            if chat is None or self._stop.is_set():
+                return
+            with self._lock:
+                if chat not in self._queued:
+                    continue
+            try:
+                self._build(chat)
+            except Exception as e:
+                logger.exception("Build of %s failed: %s", chat, e)
+            finally:
+                with self._lock:
+                    self._queued.discard(chat)
+                    self.status["building"] = None
+                self._write_status()
+
+    def _chat_record(self, chat: Path, key: str) -> dict[str, Any]:
+        """The registry entry of a chat, created with an output name no other chat uses."""
+        chats = self.status["chats"]
+        if key not in chats:
+            name = output_name(chat)
+            if any(record["name"] == name for record in chats.values()):
+                name = f"{name}-{key[:6]}"
+            chats[key] = {"name": name, "output": str(self.output_dir / f"{name}.html"), "builds": 0}
+        return chats[key]
+
+    def _build(self, chat: Path) -> None:
+        key = chat_identity(chat)
+        files = export_files(chat, self.folders)
+        snapshot = files_snapshot(files)
+        if key is None:
+            logger.warning("No messages found in %s", chat)
+            with self._lock:
+                self.status["exports"][str(chat)] = snapshot
+            return
+        with self._lock:
+            record = self._chat_record(chat, key)
+            self.status["building"] = {"chat": str(chat), "started": datetime.now().isoformat(timespec="seconds")}
+        self._write_status()
+
+        from whatsapp_archive.cli import pipeline_options
+
+        work_folder = self.work_dir / f"{record['name']}-{key[:8]}"
+        pipeline = ArchivePipeline(work_folder / WORK_CHAT_NAME, Path(record["output"]), record["name"],
+                                   **pipeline_options(self.options))
+        pipeline.status_updated.connect(
+            lambda status_key, params: logger.info("[%s] %s", record["name"],
+                                                   self._T.get(status_key, status_key).format(**params)))
+        with self._lock:
+            self._pipeline = pipeline
+        if self._stop.is_set():
+            return
+        start = time.perf_counter()
+        error = None
+        try:
+            merge_export(chat, files, work_folder)
+            pipeline.run()
+        except BuildError as e:
+            error = e.key
+        except Exception as e:
+            logger.exception("Build of %s failed: %s", chat, e)
+            error = str(e) or type(e).__name__
+        seconds = round(time.perf_counter() - start, 2)
+        finished = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            self._pipeline = None
+            if error == "error_stopped":
+                return  # not recorded: built again on the next start
+            build = {"chat": str(chat), "output": record["output"], "finished": finished, "seconds": seconds,
+                     "status": "ok" if error is None else "failed", "error": error}
+            record.update(last_build=finished, status=build["status"], error=error, export=str(chat),
+                          builds=record.get("builds", 0) + 1)
+            self.status["exports"][str(chat)] = snapshot
+            self.status["last_build"] = build
+            self.status["last_build_time"] = finished
+        if error is None:
+            logger.info("Built %s in %.1f s", record["output"], seconds)
+        else:
+            logger.warning("Build of %s failed: %s", chat, self._T.get(error, error))